@@ -0,0 +1,63 @@
+"""
+Throughput of the preprocessing's 0.01-0.5 Hz band-pass filter: mne's default ('raw.filter'), the cached FIR design
+and the IIR (SOS) option, with one and with all the CPUs.
+
+usage: python -m benchmarks.filtering_benchmark [--channels 200] [--minutes 60] [--sfreq 10] [--repeats 3]
+"""
+import argparse
+import time
+
+import mne
+import numpy as np
+
+from niralysis.utils.filtering import FIR, IIR, filter_raw
+
+LOW_FREQ, HIGH_FREQ = 0.01, 0.5
+
+
+def create_raw(n_channels: int, n_times: int, sfreq: float) -> mne.io.RawArray:
+    data = np.random.default_rng(0).standard_normal((n_channels, n_times)).cumsum(axis=1)
+    info = mne.create_info([f"S{i}_D1 760" for i in range(n_channels)], sfreq, "fnirs_od")
+    return mne.io.RawArray(data, info, verbose=False)
+
+
+def measure(filter_function, raw: mne.io.BaseRaw, repeats: int) -> float:
+    """
+    @return: best time (seconds) of filtering a copy of the raw
+    """
+    times = []
+    for _ in range(repeats):
+        copy = raw.copy()
+        start = time.perf_counter()
+        filter_function(copy)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--minutes", type=float, default=60)
+    parser.add_argument("--sfreq", type=float, default=10)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    raw = create_raw(args.channels, int(args.minutes * 60 * args.sfreq), args.sfreq)
+    samples = raw._data.size
+    cases = {
+        "mne raw.filter (default)": lambda copy: copy.filter(LOW_FREQ, HIGH_FREQ, verbose=False),
+        "fir, cached design": lambda copy: filter_raw(copy, LOW_FREQ, HIGH_FREQ, FIR),
+        "fir, cached design, n_jobs=-1": lambda copy: filter_raw(copy, LOW_FREQ, HIGH_FREQ, FIR, n_jobs=-1),
+        "iir (sos), cached design": lambda copy: filter_raw(copy, LOW_FREQ, HIGH_FREQ, IIR),
+        "iir (sos), cached design, n_jobs=-1": lambda copy: filter_raw(copy, LOW_FREQ, HIGH_FREQ, IIR, n_jobs=-1),
+    }
+    print(f"{args.channels} channels x {raw.n_times} samples ({args.minutes} minutes at {args.sfreq} Hz)")
+    baseline = None
+    for name, filter_function in cases.items():
+        seconds = measure(filter_function, raw, args.repeats)
+        baseline = baseline or seconds
+        print(f"{name:40} {seconds:8.3f} s  {samples / seconds / 1e6:8.1f} M samples/s  x{baseline / seconds:.1f}")
+
+
+if __name__ == "__main__":
+    main()
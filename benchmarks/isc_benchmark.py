@@ -0,0 +1,96 @@
+"""
+Time of the ISC between two subjects' events: the previous per-bin and per-channel loops over DataFrames, the
+vectorized kernel event by event (ISC.ISC) and the whole batch of events at once (batch_isc).
+
+usage: python -m benchmarks.isc_benchmark [--channels 200] [--events 12] [--minutes 3] [--sfreq 10] [--repeats 3]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from niralysis.ISC.ISC import ISC
+from niralysis.utils.consts import TIME_COLUMN
+from niralysis.utils.isc_kernel import batch_isc, get_timepoints_per_bin
+
+
+def loop_binned_signals(df: pd.DataFrame, timepoints_per_bin: int) -> pd.DataFrame:
+    n_bins = round(df.shape[0] / timepoints_per_bin)
+    df = df.drop(columns=TIME_COLUMN)
+    return pd.DataFrame([np.mean(df.iloc[i * timepoints_per_bin:(i + 1) * timepoints_per_bin, :], axis=0)
+                         for i in range(n_bins - 1)])
+
+
+def loop_isc(df_A: pd.DataFrame, df_B: pd.DataFrame, sampling_rate: float) -> np.ndarray:
+    """
+    The ISC as it was calculated before the vectorized kernel
+    """
+    timepoints_per_bin = get_timepoints_per_bin(sampling_rate)
+    binned_A, binned_B = loop_binned_signals(df_A, timepoints_per_bin), loop_binned_signals(df_B, timepoints_per_bin)
+    n_bins = min(binned_A.shape[0], binned_B.shape[0])
+    binned_A, binned_B = binned_A.iloc[:n_bins], binned_B.iloc[:n_bins]
+    return np.array([np.corrcoef(binned_A.iloc[:, channel], binned_B.iloc[:, channel])[0, 1]
+                     for channel in range(binned_A.shape[1])])
+
+
+def create_events(n_events: int, n_channels: int, n_times: int, sfreq: float, seed: int) -> [pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    events = []
+    for _ in range(n_events):
+        length = int(n_times * rng.uniform(0.8, 1.2))
+        event = pd.DataFrame(rng.standard_normal((length, n_channels)).cumsum(axis=0),
+                             columns=[f"S{i}_D1 hbo" for i in range(n_channels)])
+        event.insert(0, TIME_COLUMN, np.arange(length) / sfreq)
+        events.append(event)
+    return events
+
+
+def measure(function, repeats: int) -> float:
+    """
+    @return: best time (seconds) of the function
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--events", type=int, default=12)
+    parser.add_argument("--minutes", type=float, default=3)
+    parser.add_argument("--sfreq", type=float, default=10)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    n_times, sampling_rate = int(args.minutes * 60 * args.sfreq), 1 / args.sfreq
+    events_A = create_events(args.events, args.channels, n_times, args.sfreq, 0)
+    events_B = create_events(args.events, args.channels, n_times, args.sfreq, 1)
+    timepoints_per_bin = get_timepoints_per_bin(sampling_rate)
+    pairs = [(ISC.get_signals(event_A), ISC.get_signals(event_B)) for event_A, event_B in zip(events_A, events_B)]
+
+    expected = np.array([loop_isc(event_A, event_B, sampling_rate) for event_A, event_B in zip(events_A, events_B)])
+    assert np.allclose(batch_isc(pairs, timepoints_per_bin), expected)
+
+    cases = {
+        "loops over bins and channels": lambda: [loop_isc(event_A, event_B, sampling_rate)
+                                                 for event_A, event_B in zip(events_A, events_B)],
+        "vectorized, event by event": lambda: [ISC.ISC(event_A, event_B, sampling_rate)
+                                               for event_A, event_B in zip(events_A, events_B)],
+        "vectorized, batch of events": lambda: batch_isc(pairs, timepoints_per_bin),
+    }
+    print(f"{args.events} events x {args.channels} channels x ~{n_times} samples ({args.minutes} minutes at "
+          f"{args.sfreq} Hz)")
+    baseline = None
+    for name, function in cases.items():
+        seconds = measure(function, args.repeats)
+        baseline = baseline or seconds
+        print(f"{name:40} {seconds:8.3f} s  x{baseline / seconds:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 import re
-import mne
 import pandas as pd
 from niralysis.utils.consts import *
 from niralysis.utils.add_annotations import set_events_from_rec_delay, set_events_from_original_file
+from niralysis.utils.snirf_loader import read_raw_snirf
 
 
 class EventsHandler:
@@ -11,6 +11,7 @@ class EventsHandler:
 
      Args:
          path (string): Path to the SNIRF file.
+         lazy (bool): If True, only the file's header (and annotations) is read, the recording's data stays on disk
 
      Methods:
          set_spotted_events_frame - sets events frame, treat each spotted event as a singular event
@@ -20,12 +21,14 @@ class EventsHandler:
     """
 
 
-    def __init__(self, path: str, file_to_merge=None):
-        self.raw_data = mne.io.read_raw_snirf(path, preload=True)
-        if path and file_to_merge is not None:
-            raw_data_2 = mne.io.read_raw_snirf(file_to_merge, preload=True)
+    def __init__(self, path: str, file_to_merge=None, lazy: bool = False):
+        self.raw_data = read_raw_snirf(path, preload=not lazy)
+        # the merged file's channels are not needed for the events, only merge them when the data is loaded anyway
+        if path and file_to_merge is not None and not lazy:
+            raw_data_2 = read_raw_snirf(file_to_merge)
             self.raw_data.add_channels([raw_data_2])
         self.path = path
+        self.lazy = lazy
         self.continuous_events = None
         self.spotted_events = None
 
@@ -56,13 +59,14 @@ class EventsHandler:
             self.spotted_events = None
         
         if self.path.endswith("A.snirf") or self.path.endswith("A.snirf.gz"):
-            self.raw_data = set_events_from_original_file(self.path, self.path.replace("_A", "_events_file"))
+            self.raw_data = set_events_from_original_file(self.path, self.path.replace("_A", "_events_file"),
+                                                          preload=not self.lazy)
         # If snirf is B file, we need to take the A file and set the events
         if self.path.endswith("B.snirf") or self.path.endswith("B.snirf.gz"):
         # if self.raw_data.annotations.description.size == 0:
             # Take the path and change the B to A
             path_a = self.path.replace("B", "events_file")
-            self.raw_data = set_events_from_rec_delay(path_a, self.path)
+            self.raw_data = set_events_from_rec_delay(path_a, self.path, preload=not self.lazy)
 
         events = pd.DataFrame(columns=[EVENT_COLUMN, START_COLUMN, END_COLUMN, DURATION_COLUMN])
 
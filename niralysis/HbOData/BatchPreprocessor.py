@@ -0,0 +1,138 @@
+import mne
+import numpy as np
+
+from niralysis.HbOData.ChannelQuality import to_optical_density
+from niralysis.HbOData.ChannelRegistry import get_channel_registry
+from niralysis.HbOData.HbOData import HbOData
+from niralysis.utils.beer_lambert import get_beer_lambert_matrix
+from niralysis.utils.filtering import FIR, apply_fir_filter_stack, filter_data, get_filter_design
+from niralysis.utils.motion_correction import wavelet_motion_correction
+
+
+class BatchPreprocessor:
+    """
+    Preprocesses the HbO measurements of many recordings at once.
+
+    Recordings with the same sampling frequency and channels are stacked into one (recording, channel, time) array and
+    every step runs once on the whole stack instead of once per recording:
+        convert intensity to optical density
+        wavelet motion correction (optional, per channel thresholds)
+        filter low and high frequency bands (one FFT convolution, each recording is padded at its own edges)
+        convert from optical density to concentration difference (Beer-Lambert law as a matrix, computed once per
+        montage)
+    The stack is then split back into the recordings, each keeps its own valid channels (SCI, storm and given bad
+    channels, see HbOData.preprocess) and the results are the same as preprocessing each recording alone, up to
+    floating point errors. Recordings of different lengths are stacked too, the shorter ones are padded.
+
+     Args:
+        hbo_datas ([HbOData]): the recordings, their data is loaded (and merged) if it is not already
+        low_freq, high_freq (float): the filter's band
+        path_length_factor (float): The partial pathlength factor for beer lambert law
+        scale (float): scale to convert to micro molar
+        filter_method (str): 'fir' - mne's default FIR filter, 'iir' - zero-phase butterworth filter
+        motion_correction (bool): if True, applies wavelet motion correction to the optical density before filtering
+
+     Methods:
+        run - preprocesses all the recordings, sets the HbO measurements and bad channels of each HbOData
+    """
+
+    def __init__(self, hbo_datas: [HbOData], low_freq: float = 0.01, high_freq: float = 0.5,
+                 path_length_factor: float = 0.6, scale: float = 0.1, filter_method: str = FIR,
+                 motion_correction: bool = False):
+        self.hbo_datas = hbo_datas
+        self.low_freq, self.high_freq = low_freq, high_freq
+        self.path_length_factor = path_length_factor
+        self.scale = scale
+        self.filter_method = filter_method
+        self.motion_correction = motion_correction
+
+    def run(self, channels: [int] = None, with_storm: bool = False, invalid_source_thresh: int = 20,
+            invalid_detectors_thresh: int = 20, bad_channels: [str] = [], dtype=None,
+            max_bad_channels_fraction: float = None, n_jobs: int = 1) -> [HbOData]:
+        """
+        @param channels: A list of channels indexes to focus, see HbOData.preprocess
+        @param with_storm: if True, drops channels with invalid source or detectors, requires each HbOData to have a
+                           storm file path (see HbOData.set_storm_path)
+        @param invalid_source_thresh: The threshold value for the Euclidean distance
+        @param invalid_detectors_thresh: The threshold value for the Euclidean distance.
+        @param bad_channels: channels ('S1_D1') to drop from all the recordings
+        @param dtype: data type of the HbO measurements, float64 if None
+        @param max_bad_channels_fraction: recordings with more than this fraction of bad channels are not preprocessed
+        @param n_jobs: number of workers of the IIR filter and the motion correction (-1 - all the CPUs)
+        @return: the preprocessed recordings, recordings that failed are printed and left out
+        """
+        stacks = {}
+        for hbo_data in self.hbo_datas:
+            try:
+                if with_storm:
+                    hbo_data.set_invalid_optodes(invalid_source_thresh, invalid_detectors_thresh)
+                hbo_data.load_data()
+                quality = hbo_data.get_channel_quality()
+                hbo_data.bad_channels_sci = quality.bad_channels_sci()
+                hbo_data.bad_channels_cv = quality.bad_channels_cv()
+                if max_bad_channels_fraction is not None and quality.bad_fraction() > max_bad_channels_fraction:
+                    raise Exception(f"{quality.bad_fraction():.0%} of the channels are bad, the recording is not "
+                                    f"preprocessed")
+                raw = hbo_data.raw_data
+                stacks.setdefault((raw.info['sfreq'], tuple(raw.ch_names)), []).append(hbo_data)
+            except Exception as e:
+                print(e)
+
+        for stack in stacks.values():
+            for hbo_data, (names, data) in zip(stack, self._preprocess_stack([hbo.raw_data for hbo in stack], n_jobs)):
+                # keep the pairs with a good SCI, as if the bad ones were dropped before the Beer-Lambert law
+                registry = get_channel_registry(names)
+                kept = ~registry.pair_mask(hbo_data.bad_channels_sci)
+                hbo_data.set_hbo_array(registry.names[kept].tolist(), data[kept], channels, with_storm, bad_channels,
+                                       self.scale, dtype)
+        preprocessed = {id(hbo_data) for stack in stacks.values() for hbo_data in stack}
+        return [hbo_data for hbo_data in self.hbo_datas if id(hbo_data) in preprocessed]
+
+    def _preprocess_stack(self, raws: [mne.io.BaseRaw], n_jobs: int):
+        """
+        @param raws: preloaded recordings with the same sampling frequency and channels
+        @return: (concentration channels' names, (channel, time) concentration data) of each recording, all the
+                 channels (HbO and HbR) before scaling
+        """
+        sfreq = raws[0].info['sfreq']
+        lengths = np.array([raw.n_times for raw in raws])
+        stack = np.zeros((len(raws), len(raws[0].ch_names), lengths.max()))
+        for i, raw in enumerate(raws):
+            stack[i, :, :raw.n_times] = raw._data
+
+        # convert intensity to optical density, recordings with non-positive intensities are clipped (as mne does)
+        positive = np.array([np.all(raw._data > 0) for raw in raws])
+        means = stack[positive].sum(axis=2) / lengths[positive, np.newaxis]
+        stack[positive] /= means[:, :, np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.log(stack, out=stack)
+        stack *= -1
+        for i in np.flatnonzero(~positive):
+            stack[i, :, :lengths[i]] = to_optical_density(raws[i]._data)
+        for i, n_times in enumerate(lengths):
+            stack[i, :, n_times:] = 0
+
+        if self.motion_correction:
+            for i, n_times in enumerate(lengths):
+                wavelet_motion_correction(stack[i, :, :n_times], n_jobs=n_jobs)
+
+        # filter low and high frequency bands
+        if self.filter_method == FIR:
+            apply_fir_filter_stack(stack, lengths, get_filter_design(sfreq, self.low_freq, self.high_freq))
+        else:
+            # recordings of the same length are filtered together
+            for n_times in np.unique(lengths):
+                same_length = np.flatnonzero(lengths == n_times)
+                signals = stack[same_length, :, :n_times].reshape(-1, n_times)
+                filter_data(signals, sfreq, self.low_freq, self.high_freq, self.filter_method, n_jobs)
+                stack[same_length, :, :n_times] = signals.reshape(len(same_length), -1, n_times)
+
+        # convert from optical density to concentration difference, recordings with the same montage share a matrix
+        matrices = [get_beer_lambert_matrix(raw.info, self.path_length_factor) for raw in raws]
+        results = [None] * len(raws)
+        for names, matrix in {id(matrix): (names, matrix) for names, matrix in matrices}.values():
+            same_montage = [i for i, (_, other) in enumerate(matrices) if other is matrix]
+            concentrations = np.matmul(matrix, stack[same_montage])
+            for i, data in zip(same_montage, concentrations):
+                results[i] = (names, data[:, :lengths[i]])
+        return results
@@ -0,0 +1,175 @@
+import mne
+import numpy as np
+import pandas as pd
+
+from niralysis.HbOData.ChannelRegistry import get_channel_registry
+from niralysis.utils.snirf_loader import file_stamp
+
+SCI_THRESHOLD = 0.7
+CV_THRESHOLD = 7.5  # percents
+FLAT_THRESHOLD = 0.5  # fraction of samples equal to the previous one
+SATURATION_THRESHOLD = 0.05  # fraction of samples at the channel's maximum
+CARDIAC_BAND = (0.7, 1.5)  # Hz
+CARDIAC_TRANSITION_BANDWIDTH = 0.3  # Hz
+
+SCI = "sci"
+CV = "cv"
+PEAK_POWER = "peak_power"
+FLAT = "flat"
+SATURATED = "saturated"
+
+
+class ChannelQuality:
+    """
+    Quality metrics of a recording's channels, computed in a single vectorized pass over its data buffer.
+
+    Metrics (the report's columns, one row per channel):
+        sci - scalp coupling index, the minimal correlation between the wavelengths of the channel's source-detector
+              pair in the cardiac band (same as mne's scalp_coupling_index)
+        cv - coefficient of variation of the given data, in percents
+        peak_power - the fraction of the channel's cardiac band power that is in its peak frequency, a clear heart
+                     beat gives a high value
+        flat - True if the signal is constant for more than half of its samples (flatline)
+        saturated - True if more than 5% of the samples are at the channel's maximum (the detector is saturated)
+
+     Args:
+        report (pd.DataFrame): index - channels' names, columns - the metrics above
+
+     Methods:
+        from_data - computes the metrics of a (channel, time) array
+        from_raw - computes the metrics of a Raw instance, without copying its data
+        bad_channels_sci / bad_channels_cv - channels that fail the SCI / CV thresholds
+        bad_fraction - fraction of the channels that are unusable (low SCI, flat or saturated)
+    """
+
+    def __init__(self, report: pd.DataFrame):
+        self.report = report
+
+    @staticmethod
+    def from_raw(raw: mne.io.BaseRaw, optical_density: bool = False) -> 'ChannelQuality':
+        """
+        @param raw: Raw instance of intensity signals, or of optical density signals if optical_density is True
+        @param optical_density: True if the raw's data is already converted to optical density
+        @return: the channels' quality
+        """
+        data = raw._data if raw.preload else raw.get_data()
+        return ChannelQuality.from_data(data, raw.ch_names, raw.info['sfreq'], optical_density)
+
+    @staticmethod
+    def from_data(data: np.ndarray, ch_names: [str], sfreq: float, optical_density: bool = False) -> 'ChannelQuality':
+        """
+        @param data: (channel, time) intensity signals (or optical density signals), it is not changed
+        @param ch_names: channels' names ('S1_D1 760'), channels with the same source and detector are a pair
+        @param sfreq: sampling frequency (Hz)
+        @param optical_density: True if the data is already converted to optical density
+        @return: the channels' quality
+        """
+        means = data.mean(axis=1)
+        stds = data.std(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cv = 100 * stds / means
+        n_times = data.shape[1]
+        flat = np.count_nonzero(np.diff(data, axis=1) == 0, axis=1) > FLAT_THRESHOLD * (n_times - 1)
+        saturated = np.count_nonzero(data == data.max(axis=1, keepdims=True), axis=1) > SATURATION_THRESHOLD * n_times
+
+        signal = data.copy() if optical_density else to_optical_density(data, means)
+        zero_mask = signal.std(axis=1) == 0
+        # filter to the cardiac band in place
+        mne.filter.filter_data(signal, sfreq, *CARDIAC_BAND, l_trans_bandwidth=CARDIAC_TRANSITION_BANDWIDTH,
+                               h_trans_bandwidth=CARDIAC_TRANSITION_BANDWIDTH, copy=False, verbose=False)
+
+        sci = scalp_coupling_index(signal, ch_names)
+        sci[zero_mask] = 0
+
+        power = np.abs(np.fft.rfft(signal, axis=1)) ** 2
+        frequencies = np.fft.rfftfreq(n_times, 1 / sfreq)
+        band_power = power[:, (frequencies >= CARDIAC_BAND[0]) & (frequencies <= CARDIAC_BAND[1])]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            peak_power = np.nan_to_num(band_power.max(axis=1, initial=0) / band_power.sum(axis=1))
+
+        report = pd.DataFrame({SCI: sci, CV: cv, PEAK_POWER: peak_power, FLAT: flat, SATURATED: saturated},
+                              index=pd.Index(ch_names))
+        return ChannelQuality(report)
+
+    def bad_channels_sci(self, threshold: float = SCI_THRESHOLD) -> [str]:
+        return self.report.index[self.report[SCI] < threshold].tolist()
+
+    def bad_channels_cv(self, threshold: float = CV_THRESHOLD) -> [str]:
+        return self.report.index[self.report[CV] > threshold].tolist()
+
+    def bad_fraction(self, sci_threshold: float = SCI_THRESHOLD) -> float:
+        """
+        @return: fraction of the channels with low SCI, a flatline or saturation
+        """
+        bad = (self.report[SCI] < sci_threshold) | self.report[FLAT] | self.report[SATURATED]
+        return bad.mean()
+
+
+_quality_cache = {}
+
+
+def get_channel_quality(raw: mne.io.BaseRaw, paths: [str] = None, optical_density: bool = False) -> ChannelQuality:
+    """
+    Computes the quality of a recording's channels once, later calls with the same (unchanged) files, time range and
+    channels return the cached result.
+    @param raw: Raw instance, see ChannelQuality.from_raw
+    @param paths: the SNIRF files the raw's data was read from, the result is not cached if None
+    @param optical_density: True if the raw's data is already converted to optical density
+    @return: the channels' quality
+    """
+    if not paths:
+        return ChannelQuality.from_raw(raw, optical_density)
+    key = (tuple(file_stamp(path) for path in paths), tuple(raw.ch_names), raw.first_samp, raw.n_times,
+           optical_density)
+    if key not in _quality_cache:
+        _quality_cache[key] = ChannelQuality.from_raw(raw, optical_density)
+    return _quality_cache[key]
+
+
+def get_wavelength_pairs(ch_names: [str]) -> (np.ndarray, np.ndarray):
+    """
+    @param ch_names: channels' names ('S1_D1 760'), channels with the same source and detector are a group
+    @return: indexes of the first and second channel of every pair of channels in the same group
+    """
+    groups = {}
+    for i, pair in enumerate(get_channel_registry(ch_names).pair):
+        groups.setdefault(pair if pair >= 0 else -1 - i, []).append(i)
+    pairs = np.array([(group[i], group[j]) for group in groups.values()
+                      for i in range(len(group)) for j in range(i + 1, len(group))], dtype=int).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def scalp_coupling_index(filtered: np.ndarray, ch_names: [str]) -> np.ndarray:
+    """
+    @param filtered: (channel, time) optical density signals, filtered to the cardiac band
+    @param ch_names: channels' names
+    @return: minimal correlation of each channel with the other wavelengths of its source-detector pair
+    """
+    first, second = get_wavelength_pairs(ch_names)
+    centered = filtered - filtered.mean(axis=1, keepdims=True)
+    norms = np.sqrt(np.einsum('ij,ij->i', centered, centered))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlations = np.einsum('ij,ij->i', centered[first], centered[second]) / (norms[first] * norms[second])
+    correlations = np.nan_to_num(correlations, nan=0, posinf=0, neginf=0)
+    sci = np.ones(len(ch_names))
+    np.minimum.at(sci, first, correlations)
+    np.minimum.at(sci, second, correlations)
+    return sci
+
+
+def to_optical_density(data: np.ndarray, means: np.ndarray = None) -> np.ndarray:
+    """
+    Same as mne's optical_density, on an array.
+    @param data: (channel, time) intensity signals, it is not changed
+    @param means: the channels' means, if already known
+    @return: new (channel, time) array of optical density signals
+    """
+    if np.any(data <= 0):
+        data = np.abs(data)
+        minimums = data.min(axis=1)
+        data = np.maximum(data, minimums[minimums > 0].min(initial=np.inf))
+        means = data.mean(axis=1)
+    elif means is None:
+        means = data.mean(axis=1)
+    optical_density = data / means[:, np.newaxis]
+    return -np.log(optical_density, out=optical_density)
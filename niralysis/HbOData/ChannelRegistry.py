@@ -0,0 +1,145 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+
+CHANNEL_PATTERN = re.compile(r"^S(\d+)_D(\d+)(?: (\S+))?$", re.IGNORECASE)
+OPTODE_PATTERN = re.compile(r"(\d+)")
+HBO = "hbo"
+HBR = "hbr"
+DEVICE_SOURCES = 10  # sources of the first device (S1-S10), the second device's are S11-S20
+DEVICE_DETECTORS = 8  # detectors of the first device (D1-D8), the second device's are D9-D16
+PAIR_BASE = 1 << 16  # pair id = source * PAIR_BASE + detector
+
+
+def parse_channel(name: str) -> (int, int, str):
+    """
+    @param name: channel's name - 'S1_D2 760' / 'S1_D2 hbo' / 'S1_D2'
+    @return: source number, detector number, kind (wavelength or chromophore, '' if none), (-1, -1, '') if the name is
+             not a channel's name
+    """
+    match = CHANNEL_PATTERN.match(str(name))
+    if match is None:
+        return -1, -1, ''
+    return int(match.group(1)), int(match.group(2)), (match.group(3) or '').lower()
+
+
+def optode_numbers(labels) -> np.ndarray:
+    """
+    @param labels: optodes' labels ('s1', 'D12'...), e.g. the index of Storm.invalid_sourc
+    @return: the optodes' numbers
+    """
+    return np.array([int(OPTODE_PATTERN.search(str(label)).group(1)) for label in labels], dtype=int)
+
+
+class ChannelRegistry:
+    """
+    Array-backed table of a recording's channels. The names are parsed once, channel operations (storm invalidation,
+    bad channels, device flipping, area membership) are then mask and integer operations on its arrays.
+
+     Args:
+        names ([str]): channels' names ('S1_D1 760', 'S1_D1 hbo'...), other names (e.g. 'Time') are kept as non
+                channels
+
+     Attributes:
+        names (np.ndarray): channels' names, by the given order
+        source, detector (np.ndarray): source and detector numbers, -1 for non channels
+        kind (np.ndarray): wavelength or chromophore ('760', 'hbo', 'hbr'), '' if there is none
+        pair (np.ndarray): source-detector pair id, channels of the same pair have the same id, -1 for non channels
+        device (np.ndarray): 0 - first device (S1-S10, D1-D8), 1 - second device, -1 for non channels
+        is_channel, is_hbo (np.ndarray): masks
+
+     Methods:
+        pair_mask - channels of the given source-detector pairs
+        optodes_mask - channels of the given sources or detectors
+        rows - indexes of the channels of given pairs, by the pairs' order
+        flipped_names - names with the devices' order flipped
+        area_mask - (channel, area) membership of the HbO channels in brain areas
+    """
+
+    def __init__(self, names: [str]):
+        self.names = np.array(names, dtype=object)
+        parsed = [parse_channel(name) for name in names]
+        self.source = np.array([source for source, _, _ in parsed], dtype=int)
+        self.detector = np.array([detector for _, detector, _ in parsed], dtype=int)
+        self.kind = np.array([kind for _, _, kind in parsed], dtype=object)
+        self.is_channel = self.source >= 0
+        self.pair = np.where(self.is_channel, self.source * PAIR_BASE + self.detector, -1)
+        self.device = np.where(self.is_channel, (self.source > DEVICE_SOURCES).astype(int), -1)
+        self.is_hbo = self.kind == HBO
+        self._rows = {(pair, kind): i for i, (pair, kind) in reversed(list(enumerate(zip(self.pair, self.kind))))}
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def pair_ids(pairs: [str]) -> np.ndarray:
+        """
+        @param pairs: pairs' ('S1_D1') or channels' ('S1_D1 760') names
+        @return: the pairs' ids, -1 for names that are not channels
+        """
+        parsed = [parse_channel(name) for name in pairs]
+        return np.array([source * PAIR_BASE + detector if source >= 0 else -1 for source, detector, _ in parsed],
+                        dtype=int)
+
+    def pair_mask(self, pairs: [str]) -> np.ndarray:
+        """
+        @param pairs: pairs' ('S1_D1') or channels' ('S1_D1 760') names
+        @return: mask of the channels (all their kinds) of the given pairs
+        """
+        ids = self.pair_ids(pairs)
+        return np.isin(self.pair, ids[ids >= 0])
+
+    def optodes_mask(self, sources, detectors) -> np.ndarray:
+        """
+        @param sources: sources' numbers (or labels, e.g. 's1')
+        @param detectors: detectors' numbers (or labels, e.g. 'd1')
+        @return: mask of the channels with one of the given sources or one of the given detectors
+        """
+        sources, detectors = optode_numbers(sources), optode_numbers(detectors)
+        return self.is_channel & (np.isin(self.source, sources) | np.isin(self.detector, detectors))
+
+    def rows(self, pairs: [str], kind: str = HBO) -> np.ndarray:
+        """
+        @param pairs: pairs' names ('S1_D1')
+        @param kind: the channels' wavelength or chromophore
+        @return: indexes of the pairs' channels of the given kind, by the pairs' order, pairs without such a channel
+                 are skipped
+        """
+        rows = [self._rows.get((pair, kind)) for pair in self.pair_ids(pairs)]
+        return np.array([row for row in rows if row is not None], dtype=int)
+
+    def flipped_names(self) -> [str]:
+        """
+        Flips the order of the devices: S1_D1 -> S11_D9 (first device), S11_D9 -> S1_D1 (second device).
+        @return: the channels' names after the flip, non channels' names are kept
+        """
+        sign = 1 - 2 * self.device
+        sources, detectors = self.source + sign * DEVICE_SOURCES, self.detector + sign * DEVICE_DETECTORS
+        return [f"S{source}_D{detector}" + (f" {kind}" if kind else "") if is_channel else name
+                for name, source, detector, kind, is_channel in
+                zip(self.names, sources, detectors, self.kind, self.is_channel)]
+
+    def area_mask(self, areas: dict, kind: str = HBO) -> np.ndarray:
+        """
+        @param areas: dictionary that associate brain areas and channels - keys: brain area name, value: a list of
+                      channels names ('S1_D1')
+        @param kind: the channels' wavelength or chromophore
+        @return: (channel, area) boolean matrix, True if the channel is of the given kind and in the area
+        """
+        of_kind = self.kind == kind
+        return np.stack([of_kind & self.pair_mask(channels) for channels in areas.values()], axis=1) \
+            if areas else np.zeros((len(self), 0), dtype=bool)
+
+
+@lru_cache(maxsize=1024)
+def _get_channel_registry(names: tuple) -> ChannelRegistry:
+    return ChannelRegistry(list(names))
+
+
+def get_channel_registry(names) -> ChannelRegistry:
+    """
+    @param names: channels' names (e.g. a recording's ch_names or a data frame's columns)
+    @return: the names' registry, built once per list of names
+    """
+    return _get_channel_registry(tuple(names))
@@ -0,0 +1,90 @@
+import mne
+import numpy as np
+import pandas as pd
+
+from niralysis.utils.consts import TIME_COLUMN
+
+
+class HbOArray:
+    """
+    Compact container of HbO measurements.
+
+    The measurements are kept in a single contiguous (channel, time) array, next to a time vector and a channels index.
+    This is the memory layout pandas uses for a single-dtype block, so the (time, channel) data frames returned by
+    'to_data_frame' are views of the container's array and creating them copies nothing but the time column.
+
+     Args:
+        data (np.ndarray): (channel, time) array of measurements
+        times (np.ndarray): time of each sample (seconds)
+        channels ([str]): channels names, by the order of the data's rows
+
+     Methods:
+        from_raw - creates a container from an mne Raw instance, without copying its data
+        select_channels - keeps only the given channels
+        scale - multiplies all the measurements by a given factor, in place
+        to_data_frame - data frame view of the measurements, first column - 'Time', each other column is a channel
+    """
+
+    def __init__(self, data: np.ndarray, times: np.ndarray, channels: [str]):
+        if data.shape != (len(channels), len(times)):
+            raise ValueError(f"data's shape {data.shape} does not match {len(channels)} channels and "
+                             f"{len(times)} time points")
+        self.data = data
+        self.times = times
+        self.channels = pd.Index(channels)
+
+    @staticmethod
+    def from_raw(raw: mne.io.BaseRaw, time_offset: float = 0, dtype=None) -> 'HbOArray':
+        """
+        @param raw: preloaded Raw instance, the container takes its data buffer (no copy). The buffer might be
+                read-only, in that case it is copied only if the container's measurements are changed.
+        @param time_offset: seconds to add to the Raw's times
+        @param dtype: data type of the measurements (np.float32 halves the memory), the Raw's data type if None
+        @return: HbOArray with all of the Raw's channels
+        """
+        data = raw._data if dtype is None else raw._data.astype(dtype, copy=False)
+        return HbOArray(data, raw.times + time_offset, raw.ch_names)
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        @return: (time, channel) view of the measurements
+        """
+        return self.data.T
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.times.nbytes
+
+    def select_channels(self, channels: [str]) -> 'HbOArray':
+        """
+        Keeps only the given channels (in the given order), channels that do not exist are ignored.
+        @param channels: channels names
+        @return: the container itself
+        """
+        indexes = self.channels.get_indexer(channels)
+        indexes = indexes[indexes >= 0]
+        self.data = np.ascontiguousarray(self.data[indexes])
+        self.channels = self.channels[indexes]
+        return self
+
+    def scale(self, factor: float) -> 'HbOArray':
+        """
+        Multiplies the measurements by a factor, in place.
+        @param factor: scaling factor
+        @return: the container itself
+        """
+        if not self.data.flags.writeable:
+            self.data = self.data * factor
+        else:
+            self.data *= factor
+        return self
+
+    def to_data_frame(self, channels: [int] = None) -> pd.DataFrame:
+        """
+        @param channels: indexes of the data frame's columns to keep (the 'Time' column is the first), all if None
+        @return: data frame with column - 'Time', ...channels, the channels' columns are a view of the container's data
+        """
+        data_frame = pd.DataFrame(self.values, columns=self.channels, copy=False)
+        data_frame.insert(0, TIME_COLUMN, self.times)
+        return data_frame.iloc[:, channels] if channels else data_frame
@@ -1,14 +1,19 @@
 from typing import Optional
-import re
 import mne
 import pandas as pd
+from niralysis.HbOData.ChannelQuality import ChannelQuality, get_channel_quality
+from niralysis.HbOData.ChannelRegistry import ChannelRegistry, get_channel_registry, HBO
+from niralysis.HbOData.HbOArray import HbOArray
+from niralysis.HbOData.PreprocessingPipeline import PreprocessingPipeline
+from niralysis.HbOData.StreamingPreprocessor import StreamingPreprocessor
 from niralysis.Storm.Storm import Storm
 from niralysis.utils.consts import *
-from itertools import compress
-import pywt
 import numpy as np
 
 from niralysis.utils.data_manipulation import set_data_by_areas
+from niralysis.utils.filtering import FIR
+from niralysis.utils.motion_correction import DEFAULT_WAVELET, wavelet_motion_correction
+from niralysis.utils.snirf_loader import read_raw_snirf, read_raw_snirf_window
 
 
 class HbOData:
@@ -16,25 +21,35 @@ class HbOData:
     Class to handle HbO date
      Args:
         path (string): Path to the SNIRF file.
+        lazy (bool): If True, the recording's data stays on disk until it is needed, see 'load_data'
+
+     The HbO measurements are kept in an HbOArray ('hbo_array'), 'user_data_frame' and 'all_data_frame' are data frame
+     views of it that are created on demand.
 
      Methods:
         Preprocess - Preprocess HbO measurements from a raw fNIRS  signals within a SNIRF, across all channels.
         Preprocessing includes:
             drops channels from invalid source and invalid detectors by storm
             convert intensity to optical density
+            wavelet motion correction (optional)
             filter low and high frequency bands
             convert from optical density to concentration difference
             convert to micro molar by given scale
 
     """
 
-    def __init__(self, path: str, raw_data=None, user_data_frame=None, data_by_area=None, file_to_merge=None):
+    def __init__(self, path: str, raw_data=None, user_data_frame=None, data_by_area=None, file_to_merge=None,
+                 lazy: bool = False):
+        self.path = path
+        self.merged_path = None
+        self.hbo_array = None
+        self.channels = None
         self.user_data_frame = user_data_frame
-        self.all_data_frame = None
-        self.raw_data = mne.io.read_raw_snirf(path, preload=True) if path else raw_data
-        if path and file_to_merge is not None:
-            raw_data_2 = mne.io.read_raw_snirf(file_to_merge, preload=True)
-            self.raw_data.add_channels([raw_data_2])
+        self.raw_data = read_raw_snirf(path, preload=not lazy) if path else raw_data
+        self.file_to_merge = file_to_merge if path else None
+        self.time_offset = 0
+        if path and not lazy:
+            self.load_data()
         self.concentrated_data = None
         self.storm_path = None
         self.storm = Storm(path)
@@ -42,8 +57,60 @@ class HbOData:
         self.invalid_detec = None
         self.bad_channels_sci = None
         self.bad_channels_cv = None
+        self.channel_quality = None
+        self.pipeline = None
         self.bad_channels = []
         self.data_by_areas = data_by_area
+        self.area_validation = None  # number of valid channels of each area in 'data_by_areas'
+
+    def load_data(self, start: float = None, end: float = None):
+        """
+        Loads the recording's data into memory (and merges the file to merge, if given).
+        If a time range is given, the recording is first cropped to it and only that range is read from the disk.
+        Times in the created data frames stay relative to the beginning of the original recording.
+        @param start: range's starting time (seconds)
+        @param end: range's ending time (seconds)
+        """
+        if start is not None or end is not None:
+            start = max(start - self.time_offset, 0) if start is not None else 0
+            end = min(end - self.time_offset, self.raw_data.times[-1]) if end is not None else None
+            self.raw_data.crop(tmin=start, tmax=end)
+            self.time_offset += start
+        if not self.raw_data.preload:
+            self.raw_data.load_data(verbose=False)
+        if self.file_to_merge is not None:
+            raw_data_2 = read_raw_snirf_window(self.file_to_merge, self.time_offset,
+                                               self.time_offset + self.raw_data.times[-1])
+            self.raw_data.add_channels([raw_data_2])
+            self.merged_path = self.file_to_merge
+            self.file_to_merge = None
+
+    @property
+    def user_data_frame(self) -> pd.DataFrame | None:
+        """
+        @return: data frame with column - 'Time', ...the channels given to preprocess (all the channels if None)
+        """
+        if self._user_data_frame is None and self.hbo_array is not None:
+            self._user_data_frame = self.hbo_array.to_data_frame(self.channels)
+        return self._user_data_frame
+
+    @user_data_frame.setter
+    def user_data_frame(self, data_frame: pd.DataFrame | None):
+        self._user_data_frame = data_frame
+
+    @property
+    def all_data_frame(self) -> pd.DataFrame | None:
+        """
+        @return: data frame with column - 'Time', ...all the valid channels
+        """
+        return self.hbo_array.to_data_frame() if self.hbo_array is not None else None
+
+    def release_raw_data(self):
+        """
+        Drops the reference to the recording once the HbO measurements were created, so its memory can be freed.
+        """
+        self.raw_data = None
+        self.pipeline = None
 
     def set_storm_path(self, storm_path: str):
         """
@@ -53,15 +120,33 @@ class HbOData:
         self.storm.check_storm_fname(storm_path)
         self.storm_path = storm_path
 
+    def set_invalid_optodes(self, invalid_source_thresh: int = 20, invalid_detectors_thresh: int = 20):
+        """
+        Finds the sources and detectors that are off-place by storm, requires to set a storm file path by method -
+        "set_storm_path(storm_path)"
+        @param invalid_source_thresh: The threshold value for the Euclidean distance
+        @param invalid_detectors_thresh: The threshold value for the Euclidean distance.
+        """
+        if self.storm_path is None:
+            raise Exception('Could not find a storm\'s path.\n Please set a storm file path by method '
+                            '- "set_storm_path(storm_path)"')
+        self.storm.set_storm_file(self.storm_path)
+        self.invalid_sourc = self.storm.invalid_sourc(invalid_source_thresh)
+        self.invalid_detec = self.storm.invalid_detec(invalid_detectors_thresh)
+
     def preprocess(self, channels: Optional[int], with_storm: bool = True, low_freq: float = 0.01,
                    high_freq: float = 0.5,
                    path_length_factor: float = 0.6, scale: float = 0.1, invalid_source_thresh: int = 20,
-                   invalid_detectors_thresh: int = 20, with_optical_density=True, bad_channels: [str] = []):
+                   invalid_detectors_thresh: int = 20, with_optical_density=True, bad_channels: [str] = [],
+                   dtype=None, block_size: int = None, max_bad_channels_fraction: float = None,
+                   filter_method: str = FIR, n_jobs: int = 1, channel_quality: ChannelQuality = None,
+                   motion_correction: bool = False):
         """
         Preprocess HbO measurements from a raw fNIRS signals within a SNIRF, across all channels.
         Preprocessing includes:
             drops channels from invalid source and invalid detectors by storm
             convert intensity to optical density
+            wavelet motion correction, if motion_correction is True
             filter low and high frequency bands
             convert from optical density to concentration difference
             convert to micro molar by given scale
@@ -82,6 +167,17 @@ class HbOData:
         @param scale: scale to convert to micro molar
         @param invalid_source_thresh: The threshold value for the Euclidean distance
         @param invalid_detectors_thresh: The threshold value for the Euclidean distance.
+        @param dtype: data type of the HbO measurements (np.float32 halves the memory), float64 if None
+        @param block_size: if given, the recording is preprocessed in blocks of 'block_size' samples without loading
+                           it into memory (see StreamingPreprocessor), for very long recordings
+        @param max_bad_channels_fraction: if more than this fraction of the channels are bad (low SCI, flatline or
+                           saturation, see ChannelQuality), the recording is not preprocessed
+        @param filter_method: 'fir' - mne's default FIR filter, 'iir' - zero-phase butterworth filter (faster)
+        @param n_jobs: number of threads filtering (and motion correcting) the channels, -1 - all the CPUs
+        @param channel_quality: quality of the channels evaluated elsewhere (e.g. on the whole unfiltered recording),
+                           evaluated on the data if None
+        @param motion_correction: if True, applies wavelet motion correction (per channel thresholds) to the optical
+                           density before filtering, see niralysis.utils.motion_correction.wavelet_motion_correction
         @return: data Frame with column - 'time', ...relevant valid channels
                 Each raw represents the processed measurements of the HbO values at a certain time in each channel.
                 If a list of channels is provided returns only the valid listed channels.
@@ -90,25 +186,24 @@ class HbOData:
         # if storm - drop channels from invalid_sourc and invalid_detector
         try:
             if with_storm:
-                if self.storm_path is None:
-                    raise Exception('Could not find a storm\'s path.\n Please set a storm file path by method '
-                                    '- "set_storm_path(storm_path)"')
-                self.storm.set_storm_file(self.storm_path)
-                self.invalid_sourc = self.storm.invalid_sourc(invalid_source_thresh)
-                self.invalid_detec = self.storm.invalid_detec(invalid_detectors_thresh)
-
-            # convert intensity to optical density
-            processed_data = mne.preprocessing.nirs.optical_density(
-                self.raw_data) if with_optical_density else self.raw_data
-            processed_data = self.raw_data
-            # evaluate the quality of the data using a scalp coupling index (SCI)
-            sci = mne.preprocessing.nirs.scalp_coupling_index(processed_data)
-            self.bad_channels_sci = list(compress(processed_data.ch_names, sci < 0.7))
-            # processed_data = processed_data.drop_channels(self.bad_channels_sci)
-
-            # evaluate the quality of the data using a coefficient of variation (CV)
-            cv = 100 * (np.std(processed_data.get_data(), axis=1) / np.mean(processed_data.get_data(), axis=1))
-            self.bad_channels_cv = list(compress(processed_data.ch_names, cv > 7.5))
+                self.set_invalid_optodes(invalid_source_thresh, invalid_detectors_thresh)
+
+            if block_size is not None and with_optical_density:
+                if filter_method != FIR or motion_correction:
+                    raise Exception("Preprocessing in blocks supports only the FIR filter, without motion correction")
+                return self.preprocess_streaming(channels, with_storm, low_freq, high_freq, path_length_factor, scale,
+                                                 bad_channels, dtype, block_size)
+
+            self.load_data()
+            # evaluate the quality of the data using a scalp coupling index (SCI) and a coefficient of variation (CV),
+            # before the expensive steps
+            quality = channel_quality or self.get_channel_quality(optical_density=not with_optical_density)
+            self.bad_channels_sci = quality.bad_channels_sci()
+            self.bad_channels_cv = quality.bad_channels_cv()
+            if max_bad_channels_fraction is not None and quality.bad_fraction() > max_bad_channels_fraction:
+                raise Exception(f"{quality.bad_fraction():.0%} of the channels are bad, the recording is not "
+                                f"preprocessed")
+
             # Go over the channels, if a "short length" channel is dropped, make sure the "long length" channel is also dropped
             # all_lengths = []
             # for channel in self.bad_channels_cv:
@@ -137,41 +232,126 @@ class HbOData:
             # # Display the channels that were dropped
             # print(f"Channels dropped due to high CV: {self.bad_channels_cv}")
             # print(f"Channels dropped due to high SCI: {self.bad_channels_sci}")
-            processed_data = processed_data.drop_channels(self.bad_channels_sci)
 
-            # apply motion correction - Wavelet Filtering
-            # processed_data = self.wavelet_filter_pywt(processed_data)
+            # convert intensity to optical density, drop the channels with low SCI, apply motion correction - Wavelet
+            # Filtering, filter low and high frequency bands and convert from optical density to concentration
+            # difference. Each stage keeps its output, only the stages whose parameters changed since the last call
+            # are recomputed (see PreprocessingPipeline)
+            names, concentrations = self.get_pipeline().run(self.bad_channels_sci, with_optical_density,
+                                                            motion_correction, low_freq, high_freq, filter_method,
+                                                            path_length_factor, n_jobs)
 
-            # filter low and high frequency bands
-            filtered_data = processed_data.filter(l_freq=low_freq,
-                                                  h_freq=high_freq) if with_optical_density else processed_data
+            # extract HbO measurements, drops invalid channels and convert to micro molar
+            self.set_hbo_array(names, concentrations, channels, with_storm, bad_channels, scale, dtype)
 
-            # convert from optical density to concentration difference
-            concentrated_data = mne.preprocessing.nirs.beer_lambert_law(filtered_data, path_length_factor)
-
-            # extract HbO measurements and drops invalid channels
-            channels_to_drop = [concentrated_data.ch_names[i] for i, ch_type in
-                                enumerate(concentrated_data.get_channel_types()) if ch_type != 'hbo' or
-                                self.is_storm_invalid_channel(concentrated_data.ch_names[i], with_storm)]
+            return self.user_data_frame
+        except Exception as e:
+            print(e)
 
-            channels_to_drop = channels_to_drop + [f"{bad_channel} hbo" for bad_channel in bad_channels if
-                                                   f"{bad_channel} hbo" in concentrated_data.ch_names]
-            concentrated_data = concentrated_data.drop_channels(channels_to_drop)
-            # Add channel names dropped to "bad_channels" attribute
-            self.bad_channels += channels_to_drop
+    def get_pipeline(self) -> PreprocessingPipeline:
+        """
+        @return: the preprocessing pipeline of the recording's data, it keeps the stages' outputs between calls to
+                 'preprocess'
+        """
+        if self.pipeline is None or self.pipeline.raw is not self.raw_data:
+            self.pipeline = PreprocessingPipeline(self.raw_data)
+        return self.pipeline
 
-            data_frame = pd.DataFrame(concentrated_data.get_data().T, columns=concentrated_data.ch_names)
+    def preprocess_sweep(self, variants: [dict], **parameters) -> [HbOArray]:
+        """
+        Preprocesses the recording with several variants of the parameters. The variants are run ordered by the
+        pipeline's stages, so the stages they have in common (e.g. the optical density of variants that differ only in
+        their band) are computed once. The HbOData is left as preprocessed by the last variant that was run.
+        @param variants: parameters of each variant, e.g. [{'high_freq': 0.3}, {'high_freq': 0.5}]
+        @param parameters: parameters of all the variants, see 'preprocess'
+        @return: HbOArray of each variant (None if it failed), by the variants' order
+        """
+        settings = [{'channels': None, **parameters, **variant} for variant in variants]
+        defaults = dict(with_optical_density=True, motion_correction=False, low_freq=0.01, high_freq=0.5,
+                        filter_method=FIR, path_length_factor=0.6)
+        order = sorted(range(len(settings)), key=lambda i: [repr(settings[i].get(name, default))
+                                                            for name, default in defaults.items()])
+        hbo_arrays = [None] * len(settings)
+        for i in order:
+            self.bad_channels = []
+            self.hbo_array = None
+            self.preprocess(**settings[i])
+            hbo_arrays[i] = self.hbo_array
+        return hbo_arrays
+
+    def set_hbo_array(self, names: [str], concentrations: np.ndarray, channels: Optional[int], with_storm: bool,
+                      bad_channels: [str], scale: float, dtype=None):
+        """
+        Keeps the valid HbO channels of the concentrations (drops the HbR channels, channels with invalid source or
+        detectors by storm and the given bad channels) as the HbO measurements, converted to micro molar.
+        @param names: concentrations' channels' names ('S1_D1 hbo', 'S1_D1 hbr'...)
+        @param concentrations: (channel, time) concentration differences of the recording's samples, not changed
+        @param channels: A list of channels indexes to focus
+        @param with_storm: if True, drops channels with invalid source or detectors
+        @param bad_channels: channels ('S1_D1') to drop
+        @param scale: scale to convert to micro molar
+        @param dtype: data type of the HbO measurements, float64 if None
+        """
+        registry = get_channel_registry(names)
+        invalid = ~registry.is_hbo | self.get_storm_invalid_mask(registry, with_storm)
+        bad_rows = registry.rows(bad_channels, HBO)
+        # Add channel names dropped to "bad_channels" attribute
+        self.bad_channels += registry.names[invalid].tolist() + registry.names[bad_rows].tolist()
 
-            # convert to micro molar
-            data_frame = scale * data_frame
-            data_frame.insert(0, TIME_COLUMN, concentrated_data.times)
-            self.all_data_frame = data_frame
-            self.user_data_frame = data_frame.iloc[:,
-                                   channels] if channels else data_frame  # set given channels to focus
+        kept = ~invalid
+        kept[bad_rows] = False
+        self.hbo_array = HbOArray(concentrations[kept].astype(dtype or np.float64, copy=False),
+                                  self.raw_data.times + self.time_offset, registry.names[kept].tolist())
+        self.hbo_array.scale(scale)
+        self.channels = channels  # set given channels to focus
+        self.user_data_frame = None
 
-            return self.user_data_frame
-        except Exception as e:
-            print(e)
+    def get_channel_quality(self, optical_density: bool = False) -> ChannelQuality:
+        """
+        Evaluates the quality of the recording's channels (SCI, CV, peak spectral power, flatline and saturation), once
+        per recording, see ChannelQuality.
+        The quality always covers the whole recording (or the window given to 'load_data'), even if it is lazy its data
+        is read from the disk. The file to merge, if given, is merged first so its channels are evaluated as well.
+        @param optical_density: True if the recording's data is already converted to optical density
+        @return: the channels' quality, its 'report' is a table with a row per channel
+        """
+        if self.file_to_merge is not None:
+            self.load_data()
+        paths = [path for path in [self.path, self.merged_path] if path]
+        self.channel_quality = get_channel_quality(self.raw_data, paths, optical_density)
+        return self.channel_quality
+
+    def preprocess_streaming(self, channels: Optional[int], with_storm: bool, low_freq: float, high_freq: float,
+                             path_length_factor: float, scale: float, bad_channels: [str], dtype, block_size: int):
+        """
+        Same as 'preprocess' (with optical density), but the recording is read and processed in blocks, so only the
+        HbO measurements are kept in memory.
+        """
+        raws = [self.raw_data]
+        if self.file_to_merge is not None:
+            raw_data_2 = read_raw_snirf(self.file_to_merge, preload=False)
+            raws.append(raw_data_2.crop(tmin=self.time_offset, tmax=self.time_offset + self.raw_data.times[-1]))
+
+        bad_channels = [f"{bad_channel} hbo" for bad_channel in bad_channels]
+        invalid_channels, dropped_bad_channels = [], []
+
+        def keep_channel(channel_name: str) -> bool:
+            if not channel_name.endswith(' hbo') or self.is_storm_invalid_channel(channel_name, with_storm):
+                invalid_channels.append(channel_name)
+            elif channel_name in bad_channels:
+                dropped_bad_channels.append(channel_name)
+            else:
+                return True
+            return False
+
+        preprocessor = StreamingPreprocessor(raws, block_size, low_freq, high_freq, path_length_factor, scale)
+        self.hbo_array = preprocessor.run(keep_channel, dtype, self.time_offset)
+        self.bad_channels_sci = preprocessor.bad_channels_sci
+        self.bad_channels_cv = preprocessor.bad_channels_cv
+        self.bad_channels += invalid_channels + [channel for channel in bad_channels if channel in dropped_bad_channels]
+        self.channels = channels
+        self.user_data_frame = None
+        return self.user_data_frame
 
     def is_storm_invalid_channel(self, channel_name: str, with_storm: bool) -> bool:
         """
@@ -180,11 +360,17 @@ class HbOData:
         @param with_storm: True to check if a channel should be filtered out by storm
         @return: True if a channel should be filtered
         """
-        if with_storm:
-            source, detector, type = re.split(r"[ _]", channel_name)
-            return (source.lower() in self.invalid_sourc.index.tolist() or detector.lower() in
-                    self.invalid_detec.index.tolist())
-        return False
+        return bool(self.get_storm_invalid_mask(get_channel_registry([channel_name]), with_storm)[0])
+
+    def get_storm_invalid_mask(self, registry: ChannelRegistry, with_storm: bool) -> np.ndarray:
+        """
+        @param registry: the channels' registry
+        @param with_storm: True to check if the channels should be filtered out by storm
+        @return: mask of the channels with invalid source or detector locations (none if with_storm is False)
+        """
+        if not with_storm:
+            return np.zeros(len(registry), dtype=bool)
+        return registry.optodes_mask(self.invalid_sourc.index, self.invalid_detec.index)
 
     def get_hbo_data(self):
         if self.user_data_frame is None:
@@ -197,35 +383,30 @@ class HbOData:
                             "function")
         return self.data_by_areas
 
-    def wavelet_filter_pywt(self, data, wavelet='db4', level=1, threshold=None):
+    def wavelet_filter_pywt(self, data, wavelet=DEFAULT_WAVELET, level=1, threshold=None, n_jobs=1):
         """
-        Apply wavelet filtering using PyWavelets.
-        
+        Apply wavelet filtering using PyWavelets, each channel is thresholded by its own universal threshold (see
+        niralysis.utils.motion_correction).
+
         Args:
             data (mne.io.Raw): Raw data to be filtered.
             wavelet (str): Wavelet type to be used.
             level (int): Decomposition level.
-            threshold (float): Threshold value for wavelet filtering.
-            
+            threshold (float): Threshold value for wavelet filtering, of all the channels or of each channel.
+            n_jobs (int): number of threads, -1 - all the CPUs
+
         Returns:
             mne.io.Raw: Wavelet filtered data.
         """
-        data_array = data.get_data()
-        coeffs = pywt.wavedec(data_array, wavelet, level=level)
-        if threshold is None:
-            sigma = np.median(np.abs(coeffs[-level])) / 0.6745
-            threshold = sigma * np.sqrt(2 * np.log(len(data_array)))
-        coeffs[1:] = [pywt.threshold(i, value=threshold, mode='soft') for i in coeffs[1:]]
-        filtered_data = pywt.waverec(coeffs, wavelet)
-
-        filtered_mne_data = data.copy()
-        filtered_mne_data._data = filtered_data
+        filtered_mne_data = data.copy().load_data()
+        wavelet_motion_correction(filtered_mne_data._data, wavelet, level, threshold, n_jobs)
         return filtered_mne_data
 
-    def set_data_frame(self, bad_channels=None):
+    def set_data_frame(self, bad_channels=None, dtype=None):
         if bad_channels is None:
             bad_channels = []
 
+        self.load_data()
         channels_to_drop = [self.raw_data.ch_names[i] for i, ch_type in
                             enumerate(self.raw_data.get_channel_types()) if ch_type != 'hbo' and ch_type != '757']
         channels_to_drop = channels_to_drop + [f"{bad_channel} hbo" for bad_channel in bad_channels if
@@ -234,9 +415,6 @@ class HbOData:
         # Add channel names dropped to "bad_channels" attribute
         self.bad_channels = bad_channels
 
-        data_frame = pd.DataFrame(data_frame_raw.get_data().T, columns=data_frame_raw.ch_names)
-
-        # convert to micro molar
-        data_frame.insert(0, TIME_COLUMN, data_frame_raw.times)
-        self.all_data_frame = data_frame_raw
-        self.user_data_frame = data_frame
+        self.hbo_array = HbOArray.from_raw(data_frame_raw, self.time_offset, dtype)
+        self.channels = None
+        self.user_data_frame = None
@@ -0,0 +1,105 @@
+import mne
+import numpy as np
+
+from niralysis.HbOData.ChannelQuality import to_optical_density
+from niralysis.utils.beer_lambert import get_beer_lambert_matrix
+from niralysis.utils.filtering import FIR, filter_data
+from niralysis.utils.motion_correction import wavelet_motion_correction
+
+OPTICAL_DENSITY = "optical_density"
+MOTION_CORRECTION = "motion_correction"
+FILTER = "filter"
+BEER_LAMBERT = "beer_lambert"
+STAGES = (OPTICAL_DENSITY, MOTION_CORRECTION, FILTER, BEER_LAMBERT)
+
+
+class PreprocessingPipeline:
+    """
+    The preprocessing of a recording (see HbOData.preprocess) as explicit stages, each stage keeps its last output.
+
+    Stages (and the parameters each of them depends on, on top of the stages before it):
+        optical_density - convert intensity to optical density, drop the channels with low SCI (with_optical_density,
+                          bad_channels_sci)
+        motion_correction - wavelet motion correction (motion_correction)
+        filter - filter low and high frequency bands (low_freq, high_freq, filter_method)
+        beer_lambert - convert from optical density to concentration difference (path_length_factor)
+
+    When the pipeline runs again, the stages before the first one whose parameters changed return their kept outputs,
+    e.g. changing path_length_factor only redoes the Beer-Lambert law. To share the most stages, variants should be run
+    ordered by the stages' parameters, see HbOData.preprocess_sweep.
+    Stage outputs are never changed once created, a stage that changes its input works on a copy.
+
+     Args:
+        raw (mne.io.BaseRaw): preloaded recording, intensity signals (or optical density signals, see
+                with_optical_density). If its data changes, the stages are recomputed.
+
+     Attributes:
+        computed ([str]): the stages computed by the last run (the others were reused)
+
+     Methods:
+        run - runs the pipeline, returns the concentrations' channels' names and (channel, time) data
+        clear - drops the stages' outputs
+    """
+
+    def __init__(self, raw: mne.io.BaseRaw):
+        self.raw = raw
+        self.computed = []
+        self._source = None  # the recording's data the outputs were created from
+        self._outputs = {}  # stage -> (key, output)
+
+    def run(self, bad_channels_sci: [str] = (), with_optical_density: bool = True, motion_correction: bool = False,
+            low_freq: float = 0.01, high_freq: float = 0.5, filter_method: str = FIR,
+            path_length_factor: float = 0.6, n_jobs: int = 1) -> ([str], np.ndarray):
+        """
+        @param bad_channels_sci: channels to drop due to low SCI (see ChannelQuality)
+        @param with_optical_density: if False, the recording is already optical density and is not filtered or
+                                     motion corrected
+        @param motion_correction: if True, applies wavelet motion correction before filtering
+        @param low_freq: the filter's low cut-off frequency
+        @param high_freq: the filter's high cut-off frequency
+        @param filter_method: 'fir' - mne's default FIR filter, 'iir' - zero-phase butterworth filter
+        @param path_length_factor: The partial pathlength factor for beer lambert law
+        @param n_jobs: number of threads of the motion correction and the filter (-1 - all the CPUs)
+        @return: names of the concentrations' channels ('S1_D1 hbo', 'S1_D1 hbr'...), (channel, time) concentrations,
+                 not to be changed
+        """
+        raw = self.raw
+        if self._source is not raw._data:
+            self.clear()
+            self._source = raw._data
+        self.computed = []
+
+        key = (tuple(raw.ch_names), with_optical_density, tuple(sorted(bad_channels_sci)))
+        bad_channels_sci = set(bad_channels_sci)
+        picks = [i for i, name in enumerate(raw.ch_names) if name not in bad_channels_sci]
+        optical_density = self._stage(OPTICAL_DENSITY, key, lambda: (
+            to_optical_density(raw._data)[picks] if with_optical_density else raw._data[picks]))
+
+        key += (motion_correction and with_optical_density,)
+        corrected = self._stage(MOTION_CORRECTION, key, lambda: (
+            wavelet_motion_correction(optical_density.copy(), n_jobs=n_jobs)
+            if motion_correction and with_optical_density else optical_density))
+
+        key += (low_freq, high_freq, filter_method) if with_optical_density else (None,)
+        filtered = self._stage(FILTER, key, lambda: (
+            filter_data(corrected.copy(), raw.info['sfreq'], low_freq, high_freq, filter_method, n_jobs)
+            if with_optical_density else corrected))
+
+        key += (path_length_factor,)
+        names, matrix = get_beer_lambert_matrix(mne.pick_info(raw.info, picks), path_length_factor)
+        concentrations = self._stage(BEER_LAMBERT, key, lambda: matrix @ filtered)
+        return names, concentrations
+
+    def clear(self):
+        self._outputs = {}
+
+    def _stage(self, stage: str, key: tuple, compute):
+        """
+        @return: the stage's kept output if it was created with the same key, otherwise computes and keeps it
+        """
+        if stage not in self._outputs or self._outputs[stage][0] != key:
+            output = compute()
+            output.flags.writeable = False
+            self._outputs[stage] = (key, output)
+            self.computed.append(stage)
+        return self._outputs[stage][1]
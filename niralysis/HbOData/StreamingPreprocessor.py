@@ -0,0 +1,215 @@
+from itertools import compress
+from typing import Callable
+
+import mne
+import numpy as np
+
+from niralysis.HbOData.ChannelQuality import SCI_THRESHOLD, CV_THRESHOLD, get_wavelength_pairs
+from niralysis.HbOData.HbOArray import HbOArray
+from niralysis.utils.beer_lambert import get_beer_lambert_matrix
+from niralysis.utils.filtering import design_fir_filter, StreamingFIRFilter
+
+DEFAULT_BLOCK_SIZE = 10000  # samples
+
+
+class StreamingPreprocessor:
+    """
+    Preprocesses HbO measurements from raw fNIRS intensity signals block by block, so the memory used does not depend
+    on the recording's length.
+
+    The preprocessing is the same as HbOData.preprocess:
+        convert intensity to optical density
+        evaluate the scalp coupling index (SCI) of each channel and drop channels with SCI < 0.7
+        filter low and high frequency bands (mne's default FIR filter, the filter's state is carried between blocks)
+        convert from optical density to concentration difference (Beer-Lambert law)
+        keep the HbO channels, convert to micro molar by given scale
+
+    The recording is read three times: once to get the channels' means and minimums (needed for the optical density),
+    once to compute the SCI and once to create the HbO measurements. Recordings with non-positive intensities are read
+    twice more to clip them as mne does. The results match the batch preprocessing up to floating point errors.
+
+     Args:
+        raws ([mne.io.BaseRaw]): the recording's intensity data, usually not preloaded. If more than one Raw is given,
+                their channels are merged (e.g. a recording saved to two files), they must have the same length.
+        block_size (int): number of samples read and processed at once
+        low_freq, high_freq (float): the filter's band
+        path_length_factor (float): The partial pathlength factor for beer lambert law
+        scale (float): scale to convert to micro molar
+
+     Attributes (set by 'run'):
+        bad_channels_sci ([str]): channels dropped due to low SCI
+        bad_channels_cv ([str]): channels with coefficient of variation above 7.5%
+    """
+
+    def __init__(self, raws: [mne.io.BaseRaw], block_size: int = DEFAULT_BLOCK_SIZE, low_freq: float = 0.01,
+                 high_freq: float = 0.5, path_length_factor: float = 0.6, scale: float = 0.1):
+        self.raws = raws
+        self.block_size = block_size
+        self.low_freq, self.high_freq = low_freq, high_freq
+        self.path_length_factor = path_length_factor
+        self.scale = scale
+        self.sfreq = raws[0].info['sfreq']
+        self.n_times = raws[0].n_times
+        self.ch_names = [name for raw in raws for name in raw.ch_names]
+        if any(raw.n_times != self.n_times for raw in raws):
+            raise ValueError("All the recordings must have the same number of samples")
+        self.bad_channels_sci = None
+        self.bad_channels_cv = None
+
+    def run(self, keep_channel: Callable[[str], bool] = None, dtype=None, time_offset: float = 0) -> HbOArray:
+        """
+        @param keep_channel: gets a concentration channel's name ('S1_D1 hbo'/'S1_D1 hbr'), returns True if it should
+                             be kept, keeps the HbO channels if None
+        @param dtype: data type of the HbO measurements, float64 if None
+        @param time_offset: seconds to add to the recording's times
+        @return: HbOArray of the preprocessed HbO measurements
+        """
+        blocks = self.iter_blocks(keep_channel)
+        channels = next(blocks)
+        data = np.empty((len(channels), self.n_times), dtype=dtype or np.float64)
+        position = 0
+        for block in blocks:
+            data[:, position:position + block.shape[1]] = block
+            position += block.shape[1]
+        times = np.arange(self.n_times) / self.sfreq + time_offset
+        return HbOArray(data, times, channels)
+
+    def iter_blocks(self, keep_channel: Callable[[str], bool] = None):
+        """
+        Generator of the preprocessed HbO measurements, to write them somewhere without holding all of them in memory
+        @param keep_channel: gets a concentration channel's name ('S1_D1 hbo'/'S1_D1 hbr'), returns True if it should
+                             be kept, keeps the HbO channels if None
+        @return: yields the HbO channels' names first, then (channel, time) blocks of measurements by their order
+        """
+        means, stds, minimums = self._intensity_statistics()
+        self.bad_channels_cv = list(compress(self.ch_names, 100 * stds / means > CV_THRESHOLD))
+        od_means, clip = self._optical_density_means(means, minimums)
+
+        sci = self._scalp_coupling_index(od_means, clip, stds == 0)
+        self.bad_channels_sci = list(compress(self.ch_names, sci < SCI_THRESHOLD))
+        kept = np.array([name not in self.bad_channels_sci for name in self.ch_names])
+
+        hbo_names, conversion = self._beer_lambert_matrix(kept)
+        keep_channel = keep_channel or (lambda name: name.endswith(' hbo'))
+        rows = [i for i, name in enumerate(hbo_names) if keep_channel(name)]
+        conversion = self.scale * conversion[rows]
+        yield [hbo_names[i] for i in rows]
+
+        stream = StreamingFIRFilter(design_fir_filter(self.sfreq, self.low_freq, self.high_freq), self.n_times,
+                                    int(kept.sum()))
+        for block in self._iter_optical_density(od_means, clip):
+            filtered = stream.process(block[kept])
+            if filtered.shape[1]:
+                yield conversion @ filtered
+
+    def _iter_intensity(self):
+        for start in range(0, self.n_times, self.block_size):
+            stop = min(start + self.block_size, self.n_times)
+            yield np.concatenate([raw.get_data(start=start, stop=stop) for raw in self.raws])
+
+    def _intensity_statistics(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        @return: the channels' means, standard deviations and minimums, in a single pass
+        """
+        moments = _RunningMoments(len(self.ch_names))
+        minimums = np.full(len(self.ch_names), np.inf)
+        for block in self._iter_intensity():
+            moments.update(block)
+            minimums = np.minimum(minimums, block.min(axis=1, initial=np.inf))
+        return moments.mean, moments.std, minimums
+
+    def _optical_density_means(self, means: np.ndarray, minimums: np.ndarray) -> (np.ndarray, float | None):
+        """
+        Same as mne's optical_density: if there are non-positive intensities, all the values are replaced by their
+        absolute value and clipped from below by the smallest (non-zero) channel minimum. The recording is read again
+        only in that case.
+        @param means, minimums: the channels' means and minimums, see '_intensity_statistics'
+        @return: the channels' means after the above, clipping value (None if not needed)
+        """
+        if np.all(minimums > 0):
+            return means, None
+
+        clip = np.inf
+        for block in self._iter_intensity():
+            channels_minimum = np.abs(block).min(axis=1)
+            clip = min(clip, channels_minimum[channels_minimum > 0].min(initial=np.inf))
+        sums = np.zeros(len(self.ch_names))
+        for block in self._iter_intensity():
+            sums += np.maximum(np.abs(block), clip).sum(axis=1)
+        return sums / self.n_times, clip
+
+    def _iter_optical_density(self, od_means: np.ndarray, clip: float | None):
+        for block in self._iter_intensity():
+            if clip is not None:
+                block = np.maximum(np.abs(block), clip)
+            yield -np.log(block / od_means[:, np.newaxis])
+
+    def _scalp_coupling_index(self, od_means: np.ndarray, clip: float | None, flat: np.ndarray) -> np.ndarray:
+        """
+        Same as mne's scalp_coupling_index, the minimal correlation between the wavelengths of each source-detector
+        pair after a 0.7-1.5 Hz band pass filter.
+        """
+        first, second = get_wavelength_pairs(self.ch_names)
+
+        stream = StreamingFIRFilter(design_fir_filter(self.sfreq, 0.7, 1.5, l_trans_bandwidth=0.3,
+                                                      h_trans_bandwidth=0.3), self.n_times, len(self.ch_names))
+        moments = _RunningMoments(len(self.ch_names), first, second)
+        for block in self._iter_optical_density(od_means, clip):
+            moments.update(stream.process(block))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correlations = np.nan_to_num(moments.correlation, nan=0, posinf=0, neginf=0)
+        sci = np.ones(len(self.ch_names))
+        for i, j, correlation in zip(first, second, correlations):
+            sci[i] = min(sci[i], correlation)
+            sci[j] = min(sci[j], correlation)
+        sci[flat] = 0
+        return sci
+
+    def _beer_lambert_matrix(self, kept: np.ndarray) -> ([str], np.ndarray):
+        """
+        The Beer-Lambert law as a matrix, see 'get_beer_lambert_matrix'.
+        @param kept: mask of the channels that are not dropped
+        @return: names of mne's output channels, (output channel, kept channel) conversion matrix
+        """
+        names = list(compress(self.ch_names, kept))
+        infos = [raw.copy().pick([name for name in raw.ch_names if name in names]).info for raw in self.raws]
+        info = infos[0] if len(infos) == 1 else mne.io.meas_info._merge_info(infos)
+        return get_beer_lambert_matrix(info, self.path_length_factor)
+
+
+class _RunningMoments:
+    """
+    Means, variances and (optionally) covariances between pairs of rows, updated block by block
+    (Chan et al. pairwise algorithm, numerically stable)
+    """
+
+    def __init__(self, n_rows: int, first: np.ndarray = None, second: np.ndarray = None):
+        self.n = 0
+        self.mean = np.zeros(n_rows)
+        self.m2 = np.zeros(n_rows)
+        self.first, self.second = first, second
+        self.co_moment = np.zeros(len(first)) if first is not None else None
+
+    def update(self, block: np.ndarray):
+        n_block = block.shape[1]
+        if n_block == 0:
+            return
+        block_mean = block.mean(axis=1)
+        centered = block - block_mean[:, np.newaxis]
+        n = self.n + n_block
+        delta = block_mean - self.mean
+        self.m2 += (centered ** 2).sum(axis=1) + delta ** 2 * self.n * n_block / n
+        if self.first is not None:
+            self.co_moment += ((centered[self.first] * centered[self.second]).sum(axis=1) +
+                               delta[self.first] * delta[self.second] * self.n * n_block / n)
+        self.mean += delta * n_block / n
+        self.n = n
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.m2 / self.n)
+
+    @property
+    def correlation(self) -> np.ndarray:
+        return self.co_moment / np.sqrt(self.m2[self.first] * self.m2[self.second])
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+from niralysis.SharedReality.Event.Event import Event
+from niralysis.SharedReality.Subject.Subject import Subject
+from niralysis.SharedReality.consts import EVENTS_TABLE_NAMES, EVENTS_CATEGORY, FIRST_WATCH, DISCUSSIONS, \
+    SECOND_WATCH
+from niralysis.utils.consts import TIME_COLUMN
+from niralysis.utils.isc_kernel import bin_signals, get_n_bins, get_timepoints_per_bin, pairwise_pearson, pearson
+
+
+class GroupISC:
+    """
+    The ISC of every subject with the mean of all the other subjects (leave-one-out), for all the events.
+    The subjects' events are stacked once into a (subject, event, time, area) array, padded with NaN to the longest
+    event. The group's sum and the number of subjects with a value are kept once, the leave-one-out mean of subject i
+    is (sum - subject i) / (count - 1 if subject i has a value), so no subject's data is ever copied or summed again.
+    NaN values (invalid areas, events shorter than others) are not part of the means.
+
+     Args:
+        subjects ([Subject]): subjects with events data, all with the same areas (or channels)
+        events ([str]): names of the events, event i is the subject's event of index i (see 'get_event_data_table')
+
+     Attributes:
+        names ([str]): the subjects' names
+        columns ([str]): the areas' (or channels') names
+        signals (np.ndarray): (subject, event, time, area) stack of the subjects' events
+        lengths (np.ndarray): (subject, event) number of samples of each subject's event
+        total, count (np.ndarray): (event, time, area) sum of the subjects' values and number of subjects with a value
+
+     Methods:
+        leave_one_out_mean - (event, time, area) mean of all the subjects but one
+        leave_one_out_subject - Subject instance with the leave-one-out mean's events
+        isc - (subject, event, area) ISC of every subject with its leave-one-out mean, in one batched pass
+        isc_tables - the ISC as a table per subject, see ISC.subjects_ISC_by_events
+        pairwise_isc - (event, area, subject, subject) ISC of every pair of subjects
+    """
+
+    def __init__(self, subjects: [Subject], events: [str] = EVENTS_TABLE_NAMES):
+        self.events = list(events)
+        self.names = [getattr(subject, 'name', str(i)) for i, subject in enumerate(subjects)]
+        tables = [[subject.get_event_data_table(index, event) for index, event in enumerate(self.events)]
+                  for subject in subjects]
+        self.columns = list(tables[0][0].columns.drop(TIME_COLUMN))
+        self.lengths = np.array([[len(table) for table in subject_tables] for subject_tables in tables], dtype=int)
+        self.signals = np.full((len(subjects), len(self.events), self.lengths.max(initial=0), len(self.columns)),
+                               np.nan)
+        self._times = [None] * len(self.events)  # time of each sample since the event's start
+        for i, subject_tables in enumerate(tables):
+            for j, table in enumerate(subject_tables):
+                self.signals[i, j, :len(table)] = table[self.columns].to_numpy(dtype=float)
+                if self._times[j] is None or len(table) > len(self._times[j]):
+                    times = table[TIME_COLUMN].to_numpy(dtype=float)
+                    self._times[j] = times - times[0] if len(times) else times
+
+        valid = ~np.isnan(self.signals)
+        self.count = valid.sum(axis=0)
+        self.total = np.where(valid, self.signals, 0).sum(axis=0)
+
+    def leave_one_out_mean(self, subject: int) -> np.ndarray:
+        """
+        @param subject: the subject's index
+        @return: (event, time, area) mean of all the other subjects, NaN where none of them has a value
+        """
+        return self._leave_one_out(self.signals[subject])
+
+    def leave_one_out_subject(self, subject: int) -> Subject:
+        """
+        @param subject: the subject's index
+        @return: Subject instance with the events of the mean of all the other subjects, 'Time' is the time since the
+                 event's start
+        """
+        mean = self.leave_one_out_mean(subject)
+        events_data = {FIRST_WATCH: {}, DISCUSSIONS: {}, SECOND_WATCH: {}}
+        for index, event in enumerate(self.events):
+            times = self._times[index]
+            table = pd.DataFrame(mean[index, :len(times)], columns=self.columns)
+            table.insert(0, TIME_COLUMN, times)
+            events_data[EVENTS_CATEGORY[index]][event] = Event(event, data_by_area=table)
+        mean_subject = Subject("")
+        mean_subject.events_data = events_data
+        return mean_subject
+
+    def isc(self, sampling_rate: float = 0.02) -> np.ndarray:
+        """
+        The ISC of all the subjects and events at once. Each subject's event is binned by its own length, the bins of
+        the leave-one-out mean after the subject's last bin are not used (see ISC.ISC).
+        @param sampling_rate: sampling rate in seconds. Used to divide the time series to 5 seconds bins.
+        @return: (subject, event, area) ISC of every subject's event with the leave-one-out mean's event
+        """
+        timepoints_per_bin = get_timepoints_per_bin(sampling_rate)
+        binned_means = bin_signals(self._leave_one_out(self.signals), timepoints_per_bin)
+        return pearson(self._binned_signals(timepoints_per_bin), binned_means)
+
+    def pairwise_isc(self, sampling_rate: float = 0.02, chunk_size: int = None) -> np.ndarray:
+        """
+        The inter subject correlation matrix of every event and area, e.g. for pseudo couples baselines. Each
+        subject's binned event is standardized once, the matrix of an area is then a single matrix product (see
+        'pairwise_pearson'). A pair's ISC uses the bins of its shorter event, as in ISC.ISC.
+        @param sampling_rate: sampling rate in seconds. Used to divide the time series to 5 seconds bins.
+        @param chunk_size: number of subjects (matrices' rows) computed at once, bounds the memory of large cohorts,
+                           all of them if None
+        @return: (event, area, subject, subject) ISC of every pair of subjects
+        """
+        binned = self._binned_signals(get_timepoints_per_bin(sampling_rate))
+        return np.stack([pairwise_pearson(binned[:, event], chunk_size) for event in range(len(self.events))]) \
+            if self.events else np.empty((0, len(self.columns), len(self.names), len(self.names)))
+
+    def _binned_signals(self, timepoints_per_bin: int) -> np.ndarray:
+        """
+        @return: (subject, event, bin, area) binned signals, each subject's event is binned by its own length, the bins
+                 after its last bin are NaN
+        """
+        binned = bin_signals(self.signals, timepoints_per_bin)
+        n_bins = np.vectorize(get_n_bins)(self.lengths, timepoints_per_bin)
+        binned[np.arange(binned.shape[2]) >= n_bins[..., np.newaxis]] = np.nan
+        return binned
+
+    def _leave_one_out(self, signals: np.ndarray) -> np.ndarray:
+        """
+        @param signals: (event, time, area) signals of a subject, or the (subject, event, time, area) stack
+        @return: the leave-one-out means of the given subjects
+        """
+        valid = ~np.isnan(signals)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (self.total - np.where(valid, signals, 0)) / (self.count - valid)
+
+    def isc_tables(self, sampling_rate: float = 0.02) -> [pd.DataFrame]:
+        """
+        @return: for every subject, table of ISC values, each row is the ISC values of each area at a certain event
+        """
+        return [pd.DataFrame(subject_isc, index=self.events, columns=self.columns)
+                for subject_isc in self.isc(sampling_rate)]
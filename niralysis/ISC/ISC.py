@@ -2,30 +2,27 @@ from typing import List, Dict
 
 import numpy as np
 import pandas as pd
-from numpy import mean, corrcoef, zeros
 
 from niralysis.SharedReality.Event.Event import Event
 from niralysis.SharedReality.Subject.Subject import Subject
 from niralysis.SharedReality.consts import EVENTS_TABLE_NAMES
 from niralysis.utils.consts import *
 from niralysis.utils.data_manipulation import set_data_by_areas
+from niralysis.ISC.GroupISC import GroupISC
+from niralysis.ISC.ISCEngine import ISCEngine
+from niralysis.utils.isc_bootstrap import bootstrap_isc, percentile_interval, BOOTSTRAP_RESAMPLES, \
+    BOOTSTRAP_CONFIDENCE, BOOTSTRAP_MEMORY_BUDGET
+from niralysis.utils.isc_kernel import batch_isc, bin_signals, binned_batch_isc, get_timepoints_per_bin, isc, \
+    lagged_pearson, peak_lag, pearson, sliding_isc, LAG_SECONDS, SLIDING_WINDOW_SECONDS, SLIDING_STEP_SECONDS
+from niralysis.utils.isc_significance import null_distribution, p_values, PHASE_RANDOMIZATION
 
 
 class ISC:
 
     @staticmethod
     def get_binned_signals(df: pd.DataFrame, timepoints_per_bin: int):
-        n_bins = round(df.shape[0] / timepoints_per_bin)
         df = df.drop(columns=TIME_COLUMN)
-        binned_signal = []
-
-        for i in range(n_bins - 1):
-            start_row = i * timepoints_per_bin
-            end_row = start_row + timepoints_per_bin
-            binned_data = mean(df.iloc[start_row:end_row, :], axis=0)
-            binned_signal.append(binned_data)
-
-        return pd.DataFrame(binned_signal)
+        return pd.DataFrame(bin_signals(df.to_numpy(dtype=float), timepoints_per_bin), columns=df.columns)
 
     @staticmethod
     def ISC(df_A: pd.DataFrame, df_B: pd.DataFrame, sampling_rate: float, by_areas: dict = None) -> np.array:
@@ -53,24 +50,165 @@ class ISC:
             df_A = set_data_by_areas(df_A, by_areas)
             df_B = set_data_by_areas(df_B, by_areas)
 
-        n_channels = df_A.shape[1] - 1
+        # Pearson's correlation coefficient of all the channels at once
+        return isc(ISC.get_signals(df_A), ISC.get_signals(df_B), get_timepoints_per_bin(sampling_rate))
 
-        timepoints_per_bin = 5 / sampling_rate
-        A_binned_signal = ISC.get_binned_signals(df_A, int(timepoints_per_bin))
-        B_binned_signal = ISC.get_binned_signals(df_B, int(timepoints_per_bin))
+    @staticmethod
+    def ISC_significance(df_A: pd.DataFrame, df_B: pd.DataFrame, sampling_rate: float, n_surrogates: int = 10000,
+                         method: str = PHASE_RANDOMIZATION, seed: int = None, two_sided: bool = False,
+                         by_areas: dict = None, n_jobs: int = 1) -> pd.DataFrame:
+        """
+        Calculates the ISC between two subjects' fNIRS measures of a certain event (see 'ISC') and its significance,
+        compared to the ISC of A with surrogates of B's binned signals.
 
-        if (A_binned_signal.shape[0] != B_binned_signal.shape[0]):
-            min_timepoints = min(A_binned_signal.shape[0], B_binned_signal.shape[0])
-            A_binned_signal = A_binned_signal.iloc[:min_timepoints, :]
-            B_binned_signal = B_binned_signal.iloc[:min_timepoints, :]
+        Parameters:
+            df_A, df_B (pd.DataFrame): the subjects' HbO values, see 'ISC'
+            sampling_rate: sampling rate in seconds. Used to divide the time series to 5 seconds bins.
+            n_surrogates: number of surrogates
+            method: 'phase' - phase randomized surrogates, 'shift' - circularly shifted surrogates
+            seed: seed of the surrogates, the same seed gives the same result for any n_jobs
+            two_sided: if True, the absolute ISC values are compared
+            by_areas : A dict that maps channels to brain areas, see 'ISC'
+            n_jobs: number of processes the surrogates are split between (-1 - all the CPUs)
+        Returns:
+            pd.DataFrame: rows 'ISC' and 'p value', a column for each channel (or area)
+        """
+        if by_areas is not None:
+            df_A = set_data_by_areas(df_A, by_areas)
+            df_B = set_data_by_areas(df_B, by_areas)
 
-        channels_corr = zeros(n_channels)
+        timepoints_per_bin = get_timepoints_per_bin(sampling_rate)
+        binned_A = bin_signals(ISC.get_signals(df_A), timepoints_per_bin)
+        binned_B = bin_signals(ISC.get_signals(df_B), timepoints_per_bin)
+        n_bins = min(len(binned_A), len(binned_B))
+        binned_A, binned_B = binned_A[:n_bins], binned_B[:n_bins]
 
-        # Pearson's correlation coefficient of each channel
-        for channel in range(n_channels):
-            channels_corr[channel] = corrcoef(A_binned_signal.iloc[:, channel], B_binned_signal.iloc[:, channel])[0, 1]
+        observed = pearson(binned_A, binned_B)
+        null = null_distribution(binned_A, binned_B, n_surrogates, method, seed, n_jobs=n_jobs)
+        return pd.DataFrame([observed, p_values(observed, null, two_sided)], index=[ISC_ROW, P_VALUE_ROW],
+                            columns=df_A.columns.drop(TIME_COLUMN))
 
-        return channels_corr
+    @staticmethod
+    def ISC_confidence_interval(df_A: pd.DataFrame, df_B: pd.DataFrame, sampling_rate: float,
+                                n_resamples: int = BOOTSTRAP_RESAMPLES, confidence: float = BOOTSTRAP_CONFIDENCE,
+                                seed: int = None, by_areas: dict = None,
+                                memory_budget: int = BOOTSTRAP_MEMORY_BUDGET) -> pd.DataFrame:
+        """
+        Calculates the ISC between two subjects' fNIRS measures of a certain event (see 'ISC') and its bootstrap
+        confidence interval: the time bins are resampled (A's and B's together), all the resamples are correlated as
+        batched array operations.
+
+        Parameters:
+            df_A, df_B (pd.DataFrame): the subjects' HbO values, see 'ISC'
+            sampling_rate: sampling rate in seconds. Used to divide the time series to 5 seconds bins.
+            n_resamples: number of resamples
+            confidence: the interval's confidence level
+            seed: seed of the random numbers
+            by_areas : A dict that maps channels to brain areas, see 'ISC'
+            memory_budget: bytes of the resampled bins, the resamples are evaluated in chunks that fit in it
+        Returns:
+            pd.DataFrame: rows 'ISC', 'CI low' and 'CI high' (percentiles of the resamples), a column for each channel
+                          (or area)
+        """
+        if by_areas is not None:
+            df_A = set_data_by_areas(df_A, by_areas)
+            df_B = set_data_by_areas(df_B, by_areas)
+
+        timepoints_per_bin = get_timepoints_per_bin(sampling_rate)
+        binned_A = bin_signals(ISC.get_signals(df_A), timepoints_per_bin)
+        binned_B = bin_signals(ISC.get_signals(df_B), timepoints_per_bin)
+        n_bins = min(len(binned_A), len(binned_B))
+        binned_A, binned_B = binned_A[:n_bins], binned_B[:n_bins]
+
+        resamples = bootstrap_isc(binned_A, binned_B, n_resamples, seed, memory_budget)
+        low, high = percentile_interval(resamples, confidence)
+        return pd.DataFrame([pearson(binned_A, binned_B), low, high], index=[ISC_ROW, CI_LOW_ROW, CI_HIGH_ROW],
+                            columns=df_A.columns.drop(TIME_COLUMN))
+
+    @staticmethod
+    def dynamic_ISC(df_A: pd.DataFrame, df_B: pd.DataFrame, sampling_rate: float,
+                    window_seconds: float = SLIDING_WINDOW_SECONDS, step_seconds: float = SLIDING_STEP_SECONDS,
+                    by_areas: dict = None) -> pd.DataFrame:
+        """
+        Calculates the time resolved ISC between two subjects' fNIRS measures: the Pearson correlation of each channel
+        over a window that slides along the (not binned) signals, e.g. to follow the synchrony within a video or a
+        discussion.
+
+        Parameters:
+            df_A (pd.DataFrame): subject A's HbO values, columns for 'Time' and channels (see 'ISC')
+            df_B (pd.DataFrame): subject B's HbO values, sample i is aligned with A's sample i
+            sampling_rate: sampling rate in seconds
+            window_seconds: length of the window
+            step_seconds: time between the starts of consecutive windows
+            by_areas : A dict that maps channels to brain areas, if given the ISC is calculated between the mean HbO
+                    values of each brain's area, see 'ISC'
+        Returns:
+            pd.DataFrame: first column - 'Time', A's time at the window's start, each other column is the ISC of a
+                          channel (or area) at each window. '.to_numpy()' of the channels gives the (window, channel)
+                          array.
+        """
+        if by_areas is not None:
+            df_A = set_data_by_areas(df_A, by_areas)
+            df_B = set_data_by_areas(df_B, by_areas)
+
+        window = max(int(round(window_seconds / sampling_rate)), 2)
+        step = max(int(round(step_seconds / sampling_rate)), 1)
+        correlations = sliding_isc(ISC.get_signals(df_A), ISC.get_signals(df_B), window, step)
+
+        dynamic_ISC = pd.DataFrame(correlations, columns=df_A.columns.drop(TIME_COLUMN))
+        dynamic_ISC.insert(0, TIME_COLUMN, df_A[TIME_COLUMN].to_numpy()[::step][:len(correlations)])
+        return dynamic_ISC
+
+    @staticmethod
+    def lagged_ISC(df_A: pd.DataFrame, df_B: pd.DataFrame, sampling_rate: float,
+                   max_lag_seconds: float = LAG_SECONDS, by_areas: dict = None) -> pd.DataFrame:
+        """
+        Calculates the ISC between two subjects' fNIRS measures at every time lag between -max_lag_seconds and
+        max_lag_seconds, e.g. when one partner responds to the other with a delay. The (not binned) signals of all the
+        channels are cross correlated at once with FFT, a lag's correlation uses only the overlapping samples.
+
+        Parameters:
+            df_A (pd.DataFrame): subject A's HbO values, columns for 'Time' and channels (see 'ISC')
+            df_B (pd.DataFrame): subject B's HbO values, sample i is aligned with A's sample i
+            sampling_rate: sampling rate in seconds
+            max_lag_seconds: the largest lag
+            by_areas : A dict that maps channels to brain areas, if given the ISC is calculated between the mean HbO
+                    values of each brain's area, see 'ISC'
+        Returns:
+            pd.DataFrame: each row is the ISC of every channel (or area) at a lag, the index is the lag in seconds,
+                          positive - B follows A
+        """
+        if by_areas is not None:
+            df_A = set_data_by_areas(df_A, by_areas)
+            df_B = set_data_by_areas(df_B, by_areas)
+
+        max_lag = int(round(max_lag_seconds / sampling_rate))
+        correlations = lagged_pearson(ISC.get_signals(df_A), ISC.get_signals(df_B), max_lag)
+        max_lag = (len(correlations) - 1) // 2
+        return pd.DataFrame(correlations, index=np.arange(-max_lag, max_lag + 1) * sampling_rate,
+                            columns=df_A.columns.drop(TIME_COLUMN))
+
+    @staticmethod
+    def peak_lagged_ISC(df_A: pd.DataFrame, df_B: pd.DataFrame, sampling_rate: float,
+                        max_lag_seconds: float = LAG_SECONDS, by_areas: dict = None) -> pd.DataFrame:
+        """
+        Parameters:
+            see 'lagged_ISC'
+        Returns:
+            pd.DataFrame: rows 'peak lag' - the lag (in seconds) of each channel's highest ISC, positive - B follows A,
+                          and 'peak ISC' - the ISC at that lag
+        """
+        lagged = ISC.lagged_ISC(df_A, df_B, sampling_rate, max_lag_seconds, by_areas)
+        lags, peaks = peak_lag(lagged.to_numpy(dtype=float))
+        return pd.DataFrame([lags * sampling_rate, peaks], index=[PEAK_LAG_ROW, PEAK_ISC_ROW], columns=lagged.columns)
+
+    @staticmethod
+    def get_signals(df: pd.DataFrame) -> np.ndarray:
+        """
+        @param df: DataFrame with columns for 'Time' and channels
+        @return: (time, channel) array of the channels' values
+        """
+        return df.drop(columns=TIME_COLUMN).to_numpy(dtype=float)
 
     @staticmethod
     def ISC_by_events(A_events_table: pd.DataFrame, B_events_table: pd.DataFrame, df_A: pd.DataFrame, df_B: pd.DataFrame, sampling_rate: float = 0.02,
@@ -117,20 +255,8 @@ class ISC:
             df_A = set_data_by_areas(df_A, by_areas)
             df_B = set_data_by_areas(df_B, by_areas)
 
-        events_labels = A_events_table[EVENT_COLUMN].tolist()
-        ISC_table = pd.DataFrame(index=events_labels, columns=df_A.columns[1:])
-
-        for i in range(len(events_labels)): # to fix watching order is not necessarily the same, event index in a is
-            # not the same as in be (candidates videos)
-            A_starting_time = A_events_table[START_COLUMN][i]
-            A_ending_time = A_events_table[END_COLUMN][i]
-            A_event = df_A[(df_A[TIME_COLUMN] >= A_starting_time) & (df_A[TIME_COLUMN] <= A_ending_time)]
-
-            B_starting_time = B_events_table[START_COLUMN][i]
-            B_ending_time = B_events_table[END_COLUMN][i]
-            B_event = df_B[(df_B[TIME_COLUMN] >= B_starting_time) & (df_B[TIME_COLUMN] <= B_ending_time)]
-
-            ISC_table.iloc[i] = ISC.ISC(A_event, B_event, sampling_rate)
+        ISC_table = ISC.engines_ISC_by_events(A_events_table, B_events_table, ISCEngine(df_A), ISCEngine(df_B),
+                                              sampling_rate)
 
         if output_path is not None:
             if not output_path.endswith('.csv'):
@@ -140,6 +266,34 @@ class ISC:
         return ISC_table
 
 
+    @staticmethod
+    def engines_ISC_by_events(A_events_table: pd.DataFrame, B_events_table: pd.DataFrame, engine_A: ISCEngine,
+                              engine_B: ISCEngine, sampling_rate: float = 0.02) -> pd.DataFrame:
+        """
+        Same as 'ISC_by_events', from the recordings' cumulative sums: the events' bins are derived from the sums
+        (without slicing the recordings) and all the events are correlated at once. Engines can be reused for any
+        number of events tables.
+            Parameters:
+                A_events_table, B_events_table: tables of events, see 'ISC_by_events'
+                engine_A (ISCEngine): subject A's recording
+                engine_B (ISCEngine): subject B's recording, with the same channels
+                sampling_rate: sampling rate in seconds. Used to divide the time series to 5 seconds bins.
+
+            Returns:
+                pd.DataFrame: table of ISC values, each row is an ISC values of each channel at a certain event.
+        """
+        timepoints_per_bin = get_timepoints_per_bin(sampling_rate)
+        # watching order is not necessarily the same, each subject's event is taken from its own events table
+        windows = zip(A_events_table[START_COLUMN], A_events_table[END_COLUMN],
+                      B_events_table[START_COLUMN], B_events_table[END_COLUMN])
+        binned = [(engine_A.binned(A_start, A_end, timepoints_per_bin),
+                   engine_B.binned(B_start, B_end, timepoints_per_bin)) for A_start, A_end, B_start, B_end in windows]
+
+        ISC_table = pd.DataFrame(index=A_events_table[EVENT_COLUMN].tolist(), columns=engine_A.columns)
+        if binned:
+            ISC_table.iloc[:, :] = binned_batch_isc(binned)
+        return ISC_table
+
     @staticmethod
     def subjects_ISC_by_events(subject_A: Subject, subject_B: Subject, sampling_rate: float = 0.02, output_path=None,
                                use_default_events: bool = False, preprocess_by_event: bool = False):
@@ -170,6 +324,7 @@ class ISC:
             events_labels = subject_A.events_table[EVENT_COLUMN].tolist()
         ISC_table = pd.DataFrame(index=events_labels, columns=df_A.columns[1:])
 
+        events_pairs = []
         for index, event_name in enumerate(events_labels):
             A_event = subject_A.get_event_data_table(index, event_name)
             B_event = subject_B.get_event_data_table(index, event_name)
@@ -177,9 +332,11 @@ class ISC:
                 raise ValueError(f'subject A does not have the event {event_name}')
             if B_event is None:
                 raise ValueError(f'subject B does not have the event {event_name}')
+            events_pairs.append((ISC.get_signals(A_event), ISC.get_signals(B_event)))
 
-
-            ISC_table.iloc[index] = ISC.ISC(A_event, B_event, sampling_rate)
+        # all the events are correlated at once
+        if events_pairs:
+            ISC_table.iloc[:, :] = batch_isc(events_pairs, get_timepoints_per_bin(sampling_rate))
 
         if output_path is not None:
             if not output_path.endswith('.csv'):
@@ -188,6 +345,99 @@ class ISC:
 
         return ISC_table
 
+    @staticmethod
+    def subjects_lagged_ISC_by_events(subject_A: Subject, subject_B: Subject, sampling_rate: float = 0.02,
+                                      max_lag_seconds: float = LAG_SECONDS,
+                                      use_default_events: bool = False) -> (pd.DataFrame, pd.DataFrame):
+        """
+            The peak of the lagged ISC (see 'lagged_ISC') of two Subject Class instances' at every event.
+            Parameters:
+                subject_A (Subject): instance of Subject with contains subject's A data
+                subject_B (Subject): instance of Subject with contains subject's B data
+                sampling_rate: sampling rate in seconds
+                max_lag_seconds: the largest lag
+                use_default_events: if True, the events are the default events (see 'subjects_ISC_by_events')
+
+            Returns:
+                (pd.DataFrame, pd.DataFrame): tables of the peak lags (in seconds, positive - B follows A) and of the
+                peak ISC values, each row is the values of each channel (or area) at a certain event.
+        """
+        if use_default_events:
+            events_labels = EVENTS_TABLE_NAMES
+        else:
+            events_labels = subject_A.events_table[EVENT_COLUMN].tolist()
+
+        max_lag = int(round(max_lag_seconds / sampling_rate))
+        lags, peaks, columns = [], [], None
+        for index, event_name in enumerate(events_labels):
+            A_event = subject_A.get_event_data_table(index, event_name)
+            B_event = subject_B.get_event_data_table(index, event_name)
+            if A_event is None:
+                raise ValueError(f'subject A does not have the event {event_name}')
+            if B_event is None:
+                raise ValueError(f'subject B does not have the event {event_name}')
+            event_lags, event_peaks = peak_lag(lagged_pearson(ISC.get_signals(A_event), ISC.get_signals(B_event),
+                                                              max_lag))
+            lags.append(event_lags * sampling_rate)
+            peaks.append(event_peaks)
+            columns = A_event.columns.drop(TIME_COLUMN)
+
+        return pd.DataFrame(lags, index=events_labels, columns=columns), \
+            pd.DataFrame(peaks, index=events_labels, columns=columns)
+
+    @staticmethod
+    def subjects_ISC_matrix(subjects: List[Subject], sampling_rate: float = 0.02, chunk_size: int = None,
+                            events: List[str] = EVENTS_TABLE_NAMES) -> Dict[int, Dict[str, pd.DataFrame]]:
+        """
+            Function to compute the correlation between the fNIRS measures of every pair of subjects (N x N), for
+            each event and brain area, e.g. for pseudo couples baselines and clustering. See GroupISC.pairwise_isc.
+            Parameters:
+                subjects (List[Subject]): subjects with events data, all with the same areas (or channels)
+                sampling_rate: sampling rate in seconds. Used to divide the time series to 5 seconds bins.
+                chunk_size: number of subjects computed at once, bounds the memory of large cohorts
+                events: names of the events, event i is the subject's event of index i
+
+            Returns:
+                dict: event's index -> area -> (subject, subject) table of ISC values, indexed by the subjects' names
+        """
+        group_isc = GroupISC(subjects, events)
+        matrices = group_isc.pairwise_isc(sampling_rate, chunk_size)
+        return {index: {area: pd.DataFrame(matrices[index, i], index=group_isc.names, columns=group_isc.names)
+                        for i, area in enumerate(group_isc.columns)}
+                for index in range(len(events))}
+
+    @staticmethod
+    def get_binned_events(events: Dict[str, Event], timepoints_per_bin: int) -> np.ndarray:
+        """
+        @param events: events by their names
+        @param timepoints_per_bin: number of samples in a bin
+        @return: (event, bin, channel) binned events, each event is binned by its own length and padded with NaN bins
+        """
+        binned = [bin_signals(ISC.get_signals(event.get_default_data()), timepoints_per_bin)
+                  for event in events.values()]
+        n_bins = max((len(event) for event in binned), default=0)
+        return np.stack([np.pad(event, ((0, n_bins - len(event)), (0, 0)), constant_values=np.nan)
+                         for event in binned])
+
+    @staticmethod
+    def events_ISC_tensor(subject_A_events: Dict[str, Event], subject_B_events: Dict[str, Event],
+                          sampling_rate: float = 0.02) -> np.ndarray:
+        """
+        The ISC of every event of subject A with every event of subject B, in one batched correlation. A pair uses the
+        bins of its shorter event, as in 'ISC'.
+        @param subject_A_events: subject A's events by their names
+        @param subject_B_events: subject B's events by their names, with A's channels (or areas)
+        @param sampling_rate: sampling rate in seconds. Used to divide the time series to 5 seconds bins.
+        @return: (A's event, B's event, channel) ISC values, by the order of the dictionaries
+        """
+        timepoints_per_bin = get_timepoints_per_bin(sampling_rate)
+        binned_A = ISC.get_binned_events(subject_A_events, timepoints_per_bin)
+        binned_B = ISC.get_binned_events(subject_B_events, timepoints_per_bin)
+        n_bins = min(binned_A.shape[1], binned_B.shape[1])
+        binned_A, binned_B = binned_A[:, np.newaxis, :n_bins], binned_B[np.newaxis, :, :n_bins]
+        shape = np.broadcast_shapes(binned_A.shape, binned_B.shape)
+        return pearson(np.broadcast_to(binned_A, shape), np.broadcast_to(binned_B, shape))
+
     @staticmethod
     def subjects_ISC_by_oposed_events(subject_A_events: Dict[str, Event], subject_B_events: Dict[str, Event], sampling_rate: float = 0.02,):
         """
@@ -199,30 +449,28 @@ class ISC:
             - subject A, event II and subject B, event III and
             - subject A, event III and subject B, event I and
             - subject A, event III and subject B, event II and
+            All the pairs are computed at once, see 'events_ISC_tensor'.
 
             Parameters:
-                subject_A_events_list (List[Event]):
+                subject_A_events (Dict[str, Event]): subject A's events by their names
 
-                subject_B_events_list (List[Event]):
+                subject_B_events (Dict[str, Event]): subject B's events by their names
 
                 sampling_rate: sampling rate in seconds. Used to divide the time series to 5 seconds bins.
-                output_path: a pth to csv file, if given the function will save the returned data frame in to the
-                given path.
 
             Returns:
-                pd.DataFrame: table of ISC values, each row is an ISC values of each channel at a certain event.
+                pd.DataFrame: long format table of ISC values, columns - "A's event", "B's event", 'Area' (channel or
+                brain area) and 'ISC', a row for every pair of different events and area.
 
         """
-        columns = (["A's event", "B's event"] +
-                   list(list(subject_A_events.values())[0].get_default_data().drop([TIME_COLUMN], axis=1).columns))
-
-        ISC_table = pd.DataFrame(columns=columns)
-
-        for A_event_name, A_event in subject_A_events.items():
-            for B_event_name, B_event in subject_A_events.items():
-                if A_event_name == B_event_name:
-                    continue
-                isc_score = ISC.ISC(A_event.get_default_data(), B_event.get_default_data(), sampling_rate)
-                ISC_table.loc[len(ISC_table)] = np.concatenate(([A_event_name, B_event_name], isc_score))
-
-        return ISC_table
\ No newline at end of file
+        tensor = ISC.events_ISC_tensor(subject_A_events, subject_B_events, sampling_rate)
+        A_names, B_names = list(subject_A_events), list(subject_B_events)
+        areas = list(list(subject_A_events.values())[0].get_default_data().columns.drop(TIME_COLUMN))
+
+        A_index, B_index, area_index = np.indices(tensor.shape).reshape(3, -1)
+        ISC_table = pd.DataFrame({A_EVENT_COLUMN: np.array(A_names, dtype=object)[A_index],
+                                  B_EVENT_COLUMN: np.array(B_names, dtype=object)[B_index],
+                                  AREA_COLUMN: np.array(areas, dtype=object)[area_index],
+                                  ISC_ROW: tensor.reshape(-1)})
+        # an event is not opposed to itself
+        return ISC_table[ISC_table[A_EVENT_COLUMN] != ISC_table[B_EVENT_COLUMN]].reset_index(drop=True)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from niralysis.utils.consts import TIME_COLUMN
+from niralysis.utils.isc_kernel import get_n_bins
+
+
+class ISCEngine:
+    """
+    Cumulative sums of a recording's signals, created in one pass over the recording. The signals' sum over any range
+    of samples is then the difference of two of its rows, so the bins of any [start, end] window (an event, the whole
+    session, a repeated watch) are derived in constant time per bin, without slicing or re-scanning the samples.
+
+     Args:
+        df (pd.DataFrame): HbO values data table, first column - 'Time' (ascending), each other column is a channel
+                (or a brain area)
+
+     Attributes:
+        columns ([str]): the channels' names
+        times (np.ndarray): the samples' times
+
+     Methods:
+        rows - range of the samples of a time window
+        binned - binned signals of a time window
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.columns = list(df.columns.drop(TIME_COLUMN))
+        self.times = df[TIME_COLUMN].to_numpy(dtype=float)
+        if np.any(np.diff(self.times) < 0):
+            raise ValueError("the data's times are not in ascending order")
+
+        values = df[self.columns].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        has_nan = not valid.all()
+        # the signals are centered first, the bins' correlations do not change and the sums lose less precision
+        self._sums = np.zeros((len(values) + 1, len(self.columns)))
+        if has_nan:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self._offset = np.nan_to_num(np.where(valid, values, 0).sum(axis=0) / valid.sum(axis=0))
+            np.copyto(self._sums[1:], np.where(valid, values - self._offset, 0))
+        else:
+            self._offset = values.mean(axis=0)
+            np.subtract(values, self._offset, out=self._sums[1:])
+        np.cumsum(self._sums[1:], axis=0, out=self._sums[1:])
+        # without NaN values every bin has all its samples, the counts are not needed
+        self._counts = None
+        if has_nan:
+            self._counts = np.zeros((len(values) + 1, len(self.columns)), dtype=np.int32)
+            np.cumsum(valid, axis=0, out=self._counts[1:])
+
+    def rows(self, start: float, end: float) -> (int, int):
+        """
+        @return: first row and end row (exclusive) of the samples with start <= time <= end
+        """
+        return int(np.searchsorted(self.times, start, 'left')), int(np.searchsorted(self.times, end, 'right'))
+
+    def binned(self, start: float, end: float, timepoints_per_bin: int) -> np.ndarray:
+        """
+        Same as 'bin_signals' of the window's samples, NaN values are skipped.
+        @param start: the window's start time
+        @param end: the window's end time (inclusive)
+        @param timepoints_per_bin: number of samples in a bin
+        @return: (bin, channel) binned signals
+        """
+        first, last = self.rows(start, end)
+        edges = first + timepoints_per_bin * np.arange(get_n_bins(last - first, timepoints_per_bin) + 1)
+        sums = np.diff(self._sums[edges], axis=0)
+        counts = np.diff(self._counts[edges], axis=0) if self._counts is not None else timepoints_per_bin
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / counts + self._offset
@@ -56,7 +56,8 @@ class Niralysis:
         """ 
 
 
-    def __init__(self, snirf_fname: str, preprocessing_instructions = PreprocessingInstructions(), file_to_merge=None):
+    def __init__(self, snirf_fname: str, preprocessing_instructions = PreprocessingInstructions(), file_to_merge=None,
+                 lazy: bool = False):
 
         if type(snirf_fname) == pathlib.WindowsPath:
             snirf_fname = str(snirf_fname)
@@ -81,8 +82,12 @@ class Niralysis:
         self.old_sourc_loc = None
         self.old_detc_loc = None
         self.storm_fname = None
-        self.hbo_data = HbOData(snirf_fname, file_to_merge=file_to_merge)
-        self.events_handler = EventsHandler(snirf_fname, file_to_merge=file_to_merge)
+        # recordings preprocessed in blocks are never loaded as a whole
+        lazy = lazy or (preprocessing_instructions is not None and
+                        (preprocessing_instructions.lazy_loading or
+                         preprocessing_instructions.streaming_block_size is not None))
+        self.hbo_data = HbOData(snirf_fname, file_to_merge=file_to_merge, lazy=lazy)
+        self.events_handler = EventsHandler(snirf_fname, file_to_merge=file_to_merge, lazy=lazy)
         self.preprocessing_instructions = preprocessing_instructions
 
 
@@ -95,9 +100,16 @@ class Niralysis:
                                      low_freq=self.preprocessing_instructions.low_freq,
                                      high_freq=self.preprocessing_instructions.high_freq,
                                      path_length_factor=self.preprocessing_instructions.path_length_factor,
-                                     bad_channels=self.preprocessing_instructions.bad_channels)
+                                     bad_channels=self.preprocessing_instructions.bad_channels,
+                                     dtype=self.preprocessing_instructions.dtype,
+                                     block_size=self.preprocessing_instructions.streaming_block_size,
+                                     max_bad_channels_fraction=self.preprocessing_instructions.max_bad_channels_fraction,
+                                     filter_method=self.preprocessing_instructions.filter_method,
+                                     n_jobs=self.preprocessing_instructions.n_jobs,
+                                     motion_correction=self.preprocessing_instructions.motion_correction)
         else:
-            self.hbo_data.set_data_frame(self.preprocessing_instructions.bad_channels)
+            self.hbo_data.set_data_frame(self.preprocessing_instructions.bad_channels,
+                                         self.preprocessing_instructions.dtype)
 
 
     ######## STORM ########
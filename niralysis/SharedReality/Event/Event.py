@@ -1,8 +1,9 @@
 from typing import Optional
 
+from niralysis.HbOData.ChannelQuality import ChannelQuality
 from niralysis.HbOData.HbOData import HbOData
 from niralysis.SharedReality.Subject.PreprocessingInstructions import PreprocessingInstructions
-from niralysis.utils.data_manipulation import set_data_by_areas
+from niralysis.utils.data_manipulation import set_data_by_areas, get_area_validation
 
 
 class Event:
@@ -10,22 +11,28 @@ class Event:
         self.name = name
         self.data = HbOData('', raw_data, data_frame, data_by_area)
 
-    def preprocess(self, instructions: PreprocessingInstructions):
+    def preprocess(self, instructions: PreprocessingInstructions, channel_quality: ChannelQuality = None):
         self.data.preprocess(instructions.channels, with_storm=instructions.with_storm, low_freq=instructions.low_freq,
                              high_freq=instructions.high_freq,
                              path_length_factor=instructions.path_length_factor, scale=instructions.scale,
                              bad_channels=instructions.bad_channels,
-                             with_optical_density=False)
+                             with_optical_density=False, dtype=instructions.dtype,
+                             channel_quality=channel_quality)
+        self.data.release_raw_data()
 
     def get_data(self):
         return self.data.get_hbo_data()
 
     def set_by_areas(self, areas: dict):
         self.data.data_by_areas = set_data_by_areas(self.data.user_data_frame, areas)
+        self.data.area_validation = get_area_validation(self.data.user_data_frame.columns, areas)
 
     def get_data_by_areas(self):
         return self.data.get_hbo_data_by_areas()
 
+    def get_area_validation(self):
+        return self.data.area_validation
+
     def get_default_data(self):
         if self.get_data_by_areas() is not None:
             return self.get_data_by_areas()
@@ -1,91 +1,105 @@
-import copy
 import os
 import pandas as pd
 import matplotlib.pyplot as plt
 from niralysis.SharedReality.SharedReality import SharedReality
 from niralysis.SharedReality.Subject.Subject import Subject
 from niralysis.ISC.ISC import ISC
-from ..Event.Event import Event
+from niralysis.ISC.GroupISC import GroupISC
 from ..Subject.PreprocessingInstructions import PreprocessingInstructions
 from ..consts import *
 from ...EventsHandler.EventsHandler import EventsHandler
 from ...Niralysis import Niralysis
 from ...utils.add_annotations import set_events_from_psychopy_table
 from ...utils.consts import TIME_COLUMN
-from ...utils.data_manipulation import calculate_mean_table, count_nan_values, get_areas_dict
+from ...utils.data_manipulation import calculate_mean_table, calculate_mean_table_interval, count_nan_values, \
+    get_areas_dict
 from ...utils.data_presentation import get_low_auditory_isc_plot
+from ...utils.isc_bootstrap import BOOTSTRAP_RESAMPLES, BOOTSTRAP_CONFIDENCE
+from ...utils.parallel import run_sessions, report_failures, successful_values
+from ...utils.study_manifest import get_study_manifest
 
 
-def process_ISC_by_coupels(folder_path):
+def process_ISC_by_coupels(folder_path, n_jobs: int = 1):
     """
     Processes the ISC between A and B and subjects of all the run folders within the given path.
-    @param folder_path:
+    @param folder_path: the study's root folder, or its StudyManifest
+    @param n_jobs: number of run folders processed in parallel (processes), -1 - all the CPUs
     @return:
     """
 
-    all_df = []
-    all_df_dates = []
-
-    # Iterate through all folders and subfolders
-    for root, dirs, files in os.walk(folder_path):
-        # Check if there are two snirf files, one ending with -A and the other ending with -B
-        snirf_files = [file for file in files if file.endswith(".snirf")]
-        snirf_files_A = [file for file in snirf_files if file.endswith("A.snirf")]
-        snirf_files_B = [file for file in snirf_files if file.endswith("B.snirf")]
-        snirf_files_B_2 = [file for file in snirf_files if file.endswith("B_2.snirf")]
+    sessions = []
 
+    # Iterate through all the run folders
+    for session in get_study_manifest(folder_path).sessions:
         # If both -A and -B files exist in the folder, call the run function
-        if len(snirf_files_A) == 1 and len(snirf_files_B) == 1:
-            has_B_2 = len(snirf_files_B_2) == 1
-            date = root.split('\\')[-1]
-            shared_reality = SharedReality(root, date, has_B_2)
-            ISC_table = shared_reality.run(date)
-            all_df.append(ISC_table)
-            all_df_dates.append(date)
+        if len(session.snirf_files_A) == 1 and len(session.snirf_files_B) == 1:
+            has_B_2 = len(session.snirf_files_B_2) == 1
+            sessions.append((session.root, session.date, has_B_2))
+
+    results = run_sessions(_run_shared_reality, sessions, n_jobs)
+    report_failures(results)
+    all_df = [result.value for result in results if not result.failed]
+    all_df_dates = [result.session[1] for result in results if not result.failed]
 
     main_table = pd.concat(all_df, keys=all_df_dates)
     return main_table
 
 
+def _run_shared_reality(root, date, has_B_2) -> pd.DataFrame:
+    shared_reality = SharedReality(root, date, has_B_2)
+    return shared_reality.run(date)
+
+
+def _load_subject(root, name, subject, preprocess_by_event, file_to_merge=None) -> Subject:
+    subject = Subject.subject_handler(root, name, subject, preprocess_by_events=preprocess_by_event,
+                                      file_to_merge=file_to_merge, raise_errors=True)
+    # the recordings are not needed anymore, and should not be sent back from the worker process
+    subject.release_recordings()
+    return subject
+
+
+def load_subjects(sessions: [tuple], n_jobs: int = 1) -> [Subject]:
+    """
+    Creates the subjects of the given sessions, in parallel if n_jobs > 1
+    @param sessions: (root, snirf file name, subject index (0 - A, 1 - B), preprocess by event, file to merge)
+    @param n_jobs: number of subjects created in parallel (processes), -1 - all the CPUs
+    @return: the subjects that were created successfully, by the order of the sessions
+    """
+    results = run_sessions(_load_subject, sessions, n_jobs)
+    report_failures(results)
+    return successful_values(results)
+
+
 
-def process_ISC_between_all_subjects(folder_path, preprocess_by_event: bool):
+def process_ISC_between_all_subjects(folder_path, preprocess_by_event: bool, n_jobs: int = 1):
     """s
     Processes the ISC between all subjects of all the run folders within the given path.
     For each subject calculates the isc between the subject and the means of al the rest subjects
     Presents the means of all isc calculations
-    @param folder_path:
-    @return:
+    @param folder_path: the study's root folder, or its StudyManifest
+    @param n_jobs: number of subjects created in parallel (processes), -1 - all the CPUs
+    @return: the mean ISC table and the subjects' ISC tables
     """
-    subjects = []
-
-    # Iterate through all folders and sub folders
-    for root, dirs, files in os.walk(folder_path):
-        # Check if there are two snirf files, one ending with -A and the other ending with -B
-        snirf_files = [file for file in files if file.endswith(".snirf")]
-        snirf_files_A = [file for file in snirf_files if file.endswith("A.snirf")]
-        snirf_files_B = [file for file in snirf_files if file.endswith("B.snirf")]
-        snirf_files_B_2 = [file for file in snirf_files if file.endswith("B_2.snirf")]
-
+    sessions = []
 
+    # Iterate through all the run folders
+    for session in get_study_manifest(folder_path).sessions:
         # If -A or -B files exist in the folder, call the run function
-        if len(snirf_files_A) >= 1:
-            Subject.subject_handler(root, snirf_files_A[0], 0, subjects, preprocess_by_event)
+        if len(session.snirf_files_A) >= 1:
+            sessions.append((session.root, session.snirf_files_A[0], 0, preprocess_by_event))
 
-        if len(snirf_files_B) >= 1:
-            file_to_merge = snirf_files_B_2[0] if len(snirf_files_B_2) > 0 else None
-            Subject.subject_handler(root, snirf_files_B[0], 1, subjects, preprocess_by_event,
-                                    file_to_merge=file_to_merge)
+        if len(session.snirf_files_B) >= 1:
+            file_to_merge = session.snirf_files_B_2[0] if len(session.snirf_files_B_2) > 0 else None
+            sessions.append((session.root, session.snirf_files_B[0], 1, preprocess_by_event, file_to_merge))
 
-    merged_data, factor = merge_event_data_table(subjects, preprocess_by_event)
+    subjects = load_subjects(sessions, n_jobs)
+    factor = get_events_factor(subjects) if preprocess_by_event else get_subjects_factor(subjects)
 
-    ISC_tables = []
-    for i, subject in enumerate(subjects):
-        sum_subjects_exclude_i = mean_event_data_table(subject, merged_data, factor if not preprocess_by_event else None)
-        mean_subject = Subject("")
-        mean_subject.events_data = sum_subjects_exclude_i
-        isc_score = ISC.subjects_ISC_by_events(subject, mean_subject, use_default_events=True, preprocess_by_event=preprocess_by_event)
-        get_low_auditory_isc_plot(isc_score, subject, mean_subject)
-        ISC_tables.append(isc_score)
+    # the group's sum is kept once, every subject's leave-one-out mean is derived from it
+    group_isc = GroupISC(subjects)
+    ISC_tables = group_isc.isc_tables()
+    for i, (subject, isc_score) in enumerate(zip(subjects, ISC_tables)):
+        get_low_auditory_isc_plot(isc_score, subject, group_isc.leave_one_out_subject(i))
 
     main = calculate_mean_table(ISC_tables, factor)
     # main.drop(['discussion:A', 'discussion:B', 'open discussion'], axis=0, inplace=True)
@@ -93,38 +107,50 @@ def process_ISC_between_all_subjects(folder_path, preprocess_by_event: bool):
     return main, ISC_tables
 
 
-def process_ISC_between_all_subjects_opposed_events(folder_path, preprocess_by_event: bool):
+def process_ISC_interval_between_all_subjects(folder_path, preprocess_by_event: bool, n_jobs: int = 1,
+                                              n_resamples: int = BOOTSTRAP_RESAMPLES,
+                                              confidence: float = BOOTSTRAP_CONFIDENCE, seed: int = None):
+    """
+    Same as 'process_ISC_between_all_subjects', with the bootstrap confidence interval of the mean ISC table (see
+    'calculate_mean_table_interval')
+    @param folder_path: the study's root folder, or its StudyManifest
+    @param n_jobs: number of subjects created in parallel (processes), -1 - all the CPUs
+    @param n_resamples: number of bootstrap resamples of the subjects
+    @param confidence: the interval's confidence level
+    @param seed: seed of the bootstrap
+    @return: the mean ISC table, the subjects' ISC tables and the mean table's interval (low and high bounds tables)
+    """
+    main, ISC_tables = process_ISC_between_all_subjects(folder_path, preprocess_by_event, n_jobs)
+    return main, ISC_tables, calculate_mean_table_interval(ISC_tables, n_resamples, confidence, seed)
+
+
+def process_ISC_between_all_subjects_opposed_events(folder_path, preprocess_by_event: bool, n_jobs: int = 1):
     """
     Processes the ISC between all subjects of all the run folders within the given path.
     For each subject calculates the isc between the subject event all the other events of the means of al the rest subjects
     Presents the means of all isc calculations
-    @param folder_path:
+    @param folder_path: the study's root folder, or its StudyManifest
+    @param n_jobs: number of subjects created in parallel (processes), -1 - all the CPUs
     @return:
     """
-    subjects = []
-
-    # Iterate through all folders and sub folders
-    for root, dirs, files in os.walk(folder_path):
-        # Check if there are two snirf files, one ending with -A and the other ending with -B
-        snirf_files = [file for file in files if file.endswith(".snirf")]
-        snirf_files_A = [file for file in snirf_files if file.endswith("A.snirf")]
-        snirf_files_B = [file for file in snirf_files if file.endswith("B.snirf")]
+    sessions = []
 
+    # Iterate through all the run folders
+    for session in get_study_manifest(folder_path).sessions:
         # If  -A or -B files exist in the folder, call the run function
-        if len(snirf_files_A) >= 1:
-            Subject.subject_handler(root, snirf_files_A[0], 0, subjects, preprocess_by_event)
+        if len(session.snirf_files_A) >= 1:
+            sessions.append((session.root, session.snirf_files_A[0], 0, preprocess_by_event))
 
-        if len(snirf_files_B) >= 1:
-            Subject.subject_handler(root, snirf_files_B[0], 1, subjects, preprocess_by_event)
+        if len(session.snirf_files_B) >= 1:
+            sessions.append((session.root, session.snirf_files_B[0], 1, preprocess_by_event))
 
-    merged_data, factor = merge_event_data_table(subjects, preprocess_by_event)
+    subjects = load_subjects(sessions, n_jobs)
+    group_isc = GroupISC(subjects)
 
     ISC_tables = []
     tables_title = []
     for i, subject in enumerate(subjects):
-        sum_subjects_exclude_i = mean_event_data_table(subject, merged_data, factor if not preprocess_by_event else None)
-        new_subject = Subject("")
-        new_subject.events_data = sum_subjects_exclude_i
+        new_subject = group_isc.leave_one_out_subject(i)
         first_watch = ISC.subjects_ISC_by_oposed_events(subject.events_data[FIRST_WATCH],
                                                         new_subject.events_data[FIRST_WATCH])
         second_watch = ISC.subjects_ISC_by_oposed_events(subject.events_data[SECOND_WATCH],
@@ -185,120 +211,105 @@ def visualize_ISC_tables(ISC_tables):
     # Show the plots
     plt.show()
 
-def process_diff_between_snirf_and_psychopy(folder_path: str) -> pd.DataFrame:
+def process_diff_between_snirf_and_psychopy(folder_path, n_jobs: int = 1) -> pd.DataFrame:
     """
 
-    @param folder_path:
+    @param folder_path: the study's root folder, or its StudyManifest
+    @param n_jobs: number of run folders processed in parallel (processes), -1 - all the CPUs
     @return: table of differences between event duration in snirf and psychopy timetables
     """
 
-    duration_diff_df = {}
-
-    # Iterate through all folders and subfolders.
-    for root, dirs, files in os.walk(folder_path):
-        # Check if there are two snirf files, one ending with -A and the other ending with -B
-
-        try:
-            snirf_files = [file for file in files if file.endswith(".snirf")]
-            snirf_files_A = [file for file in snirf_files if file.endswith("A.snirf")]
-            psyco_path = [file for file in files if file.endswith(".csv")]
+    sessions = []
 
-            if len(snirf_files_A) == 1 and len(psyco_path) == 1:
-                snirf_path = os.path.join(root, snirf_files_A[0])
-                psyco_path = os.path.join(root, psyco_path[0])
+    # Iterate through all the run folders
+    for session in get_study_manifest(folder_path).sessions:
+        if len(session.snirf_files_A) == 1 and len(session.psychopy_files) == 1:
+            sessions.append((session.path(session.snirf_files_A[0]), session.path(session.psychopy_files[0])))
 
-                # creates timetable according to data from snirf file
-                subject_snirf = Niralysis(snirf_path)
-                subject_snirf.events_handler.set_continuous_events_frame()
-                snirf_event_table = subject_snirf.events_handler.get_continuous_events_frame()
+    results = run_sessions(_get_duration_diff, sessions, n_jobs)
+    report_failures(results)
+    duration_diff_df = {os.path.basename(result.session[0]): result.value for result in results if not result.failed}
 
-                # creates timetable according to data from snirf file
-                psyco_snirf = set_events_from_psychopy_table(snirf_path, psyco_path)
-                subject_psyco = EventsHandler(snirf_path)
-                subject_psyco.raw_data = psyco_snirf
-                subject_psyco.set_continuous_events_frame()
-                psyco_event_table = subject_psyco.get_continuous_events_frame()
+    return pd.DataFrame(duration_diff_df)
 
-                duration_diff = psyco_event_table['Duration'] - snirf_event_table['Duration']
-                duration_diff_df[snirf_files_A[0]] = duration_diff.values
-        except:
-            continue
 
-    return pd.DataFrame(duration_diff_df)
+def _get_duration_diff(snirf_path, psyco_path):
+    # creates timetable according to data from snirf file
+    subject_snirf = Niralysis(snirf_path)
+    subject_snirf.events_handler.set_continuous_events_frame()
+    snirf_event_table = subject_snirf.events_handler.get_continuous_events_frame()
 
+    # creates timetable according to data from snirf file
+    psyco_snirf = set_events_from_psychopy_table(snirf_path, psyco_path)
+    subject_psyco = EventsHandler(snirf_path)
+    subject_psyco.raw_data = psyco_snirf
+    subject_psyco.set_continuous_events_frame()
+    psyco_event_table = subject_psyco.get_continuous_events_frame()
 
-def merge_event_data_table(subjects, preprocess_by_event: bool = False):
-    merged_data = {FIRST_WATCH: {}, DISCUSSIONS: {}, SECOND_WATCH: {}}
-    factor = pd.DataFrame(index=EVENTS_TABLE_NAMES, columns=subjects[0].get_event_data_table(0, EVENTS_TABLE_NAMES[0]).columns)
+    duration_diff = psyco_event_table['Duration'] - snirf_event_table['Duration']
+    return duration_diff.values
 
-    for index, event in enumerate(EVENTS_TABLE_NAMES):
-        data = subjects[0].get_event_data_table(index, event).fillna(0)
-        for subject in subjects[1:]:
-            data = data.add(subject.get_event_data_table(index, event).fillna(0))
 
-        merged_data[EVENTS_CATEGORY[index]][event] = Event(event, data_by_area=data.fillna(0))
-        factor.iloc[index] = data.loc[AREA_VALIDATION] if preprocess_by_event else None
-    factor.drop(columns=[TIME_COLUMN], inplace=True)
-    return merged_data, factor if preprocess_by_event else get_subjects_factor(subjects)
+def get_events_factor(subjects: [Subject]) -> pd.DataFrame:
+    """
+    @return: number of subjects with valid channels in each area (columns) at each event (rows), the subjects' events
+             were preprocessed separately
+    """
+    factor = None
+    for subject in subjects:
+        validation = pd.DataFrame([subject.get_event_area_validation(index, event).loc[AREA_VALIDATION]
+                                   for index, event in enumerate(EVENTS_TABLE_NAMES)], index=EVENTS_TABLE_NAMES)
+        factor = validation if factor is None else factor + validation
+    return factor.drop(columns=[TIME_COLUMN])
 
 def get_subjects_factor(subjects: [Subject]):
-    subjects_factor = subjects[0].get_hbo_data().loc[AREA_VALIDATION]
+    subjects_factor = subjects[0].get_area_validation().loc[AREA_VALIDATION].copy()
     for subject in subjects[1:]:
-        subjects_factor += subject.get_hbo_data().loc[AREA_VALIDATION]
+        subjects_factor += subject.get_area_validation().loc[AREA_VALIDATION]
     return subjects_factor
 
-def mean_event_data_table(subject, event_data_table, factor =None):
-    mean_data = copy.deepcopy(event_data_table)
-    for index, event in enumerate(EVENTS_TABLE_NAMES):
-        factor = factor if factor is not None else mean_data[EVENTS_CATEGORY[index]][event].get_data_by_areas().loc[AREA_VALIDATION]
-        mean_data[EVENTS_CATEGORY[index]][event].data.data_by_areas -= subject.get_event_data_table(index, event).fillna(0)
-        mean_data[EVENTS_CATEGORY[index]][event].data.data_by_areas /= factor
-
-    return mean_data
-
 
-def process_nan_values(folder_path):
+def process_nan_values(folder_path, n_jobs: int = 1):
     """
     Processes the ISC between A and B and subjects of all the run folders within the given path.
-    @param folder_path:
+    @param folder_path: the study's root folder, or its StudyManifest
+    @param n_jobs: number of subjects processed in parallel (processes), -1 - all the CPUs
     @return:
     """
-    subjects = {}
-    data_frames = []
-
-    # Iterate through all folders and sub folders
-    for root, dirs, files in os.walk(folder_path):
-        # Check if there are two snirf files, one ending with -A and the other ending with -B
-        snirf_files = [file for file in files if file.endswith(".snirf")]
-        snirf_files_A = [file for file in snirf_files if file.endswith("A.snirf")]
-        snirf_files_B = [file for file in snirf_files if file.endswith("B.snirf")]
+    sessions = []
 
+    # Iterate through all the run folders
+    for session in get_study_manifest(folder_path).sessions:
         # If both -A and -B files exist in the folder, call the run function
-        if len(snirf_files_A) == 1 and len(snirf_files_B) == 1:
-            path_A = os.path.join(root, snirf_files_A[0])
-            path_B = os.path.join(root, snirf_files_B[0])
-            subject_A = Subject(path_A, old_area_dict)
-            subjects[subject_A.name] = count_nan_values(subject_A.get_hbo_data())
-            subject_B = Subject(path_B, old_area_dict)
-            subjects[subject_B.name] = count_nan_values(subject_B.get_hbo_data())
-
-    return subjects
-
-
-def create_all_heatmaps(folder_path, save_images_path, candidate_choices_path):
-    # Iterate through all folders and subfolders
-    for root, dirs, files in os.walk(folder_path):
-        # Check if there are two snirf files, one ending with -A and the other ending with -B
-        snirf_files = [file for file in files if file.endswith(".snirf")]
-        snirf_files_A = [file for file in snirf_files if file.endswith("A.snirf")]
-        snirf_files_B = [file for file in snirf_files if file.endswith("B.snirf")]
-        snirf_files_B_2 = [file for file in snirf_files if file.endswith("B_2.snirf")]
+        if len(session.snirf_files_A) == 1 and len(session.snirf_files_B) == 1:
+            sessions.append((session.path(session.snirf_files_A[0]),))
+            sessions.append((session.path(session.snirf_files_B[0]),))
+
+    results = run_sessions(_count_subject_nan_values, sessions, n_jobs)
+    report_failures(results)
+    return dict(successful_values(results))
+
+
+def _count_subject_nan_values(path):
+    subject = Subject(path, old_area_dict)
+    return subject.name, count_nan_values(subject.get_hbo_data())
+
 
+def create_all_heatmaps(folder_path, save_images_path, candidate_choices_path, n_jobs: int = 1):
+    sessions = []
+    # Iterate through all the run folders
+    for session in get_study_manifest(folder_path).sessions:
         # If both -A and -B files exist in the folder, call the run function
-        if len(snirf_files_A) == 1 and len(snirf_files_B) == 1:
-            has_B_2 = len(snirf_files_B_2) == 1
-            date = root.split('\\')[-1]
-            shared_reality = SharedReality(root, date, has_B_2)
-            shared_reality.get_wavelet_coherence_maps(save_images_path, candidate_choices_path)
+        if len(session.snirf_files_A) == 1 and len(session.snirf_files_B) == 1:
+            has_B_2 = len(session.snirf_files_B_2) == 1
+            sessions.append((session.root, session.date, has_B_2, save_images_path, candidate_choices_path))
+
+    report_failures(run_sessions(_create_heatmaps, sessions, n_jobs))
+
+
+def _create_heatmaps(root, date, has_B_2, save_images_path, candidate_choices_path):
+    shared_reality = SharedReality(root, date, has_B_2)
+    shared_reality.get_wavelet_coherence_maps(save_images_path, candidate_choices_path)
+
 
 
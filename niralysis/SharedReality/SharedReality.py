@@ -1,10 +1,14 @@
+import os
+
 import pandas as pd
 
 from .Subject.Subject import Subject
 from .consts import *
 from ..utils.consts import *
 from ..utils.data_manipulation import get_data_in_time_range, get_data_frames_with_equal_rows_number
+from niralysis.HbOData.ChannelRegistry import get_channel_registry
 from niralysis.ISC.ISC import ISC
+from niralysis.ISC.ISCEngine import ISCEngine
 from niralysis.Niralysis import Niralysis
 from ..WaveletCoherence.WaveletCoherence import WaveletCoherence
 
@@ -12,12 +16,13 @@ from ..WaveletCoherence.WaveletCoherence import WaveletCoherence
 class SharedReality:
     def __init__(self, root, name, has_B_2 = False):
         self.date = name
-        self.subject_A_path = root + f"\\{name}_A.snirf"
-        self.subject_B_path = root + f"\\{name}_B.snirf"
+        self.subject_A_path = os.path.join(root, f"{name}_A.snirf")
+        self.subject_B_path = os.path.join(root, f"{name}_B.snirf")
         self.subject_A = Subject.subject_handler(root, name + "_A.snirf",0)
         self.subject_B = Subject.subject_handler(root, name + "_B.snirf", 1,
                                                  file_to_merge=name + "_B_2.snirf" if has_B_2 else None)
         self.ISC_table = None
+        self.isc_engines = None
         self.wavelet_coherence = {}
 
 
@@ -75,22 +80,9 @@ class SharedReality:
         else:
             raise ValueError("Invalid subject")
 
-        # Get the column names (Remove first column - "Time" column)
-        columns = data.columns[1:]
-
-        # Split the columns into two halves: S1-S10 and D1-D8 (first device), and S11-S20 and D9-D16 (second device)
-        first_device_columns = [col for col in columns if int(col[1:col.index("_")]) < 11]
-        second_device_columns = [col for col in columns if int(col[1:col.index("_")]) >= 11]
-
-        # Perform addition for the first device columns and subtraction for the second device columns
-        flipped_first_device_columns = [f"S{int(col[1:col.index('_')]) + 10}_D{int(col[col.index('D')+1:col.index(' ')]) + 8}" for col in first_device_columns]
-        flipped_second_device_columns = [f"S{int(col[1:col.index('_')]) - 10}_D{int(col[col.index('D')+1:col.index(' ')]) - 8}" for col in second_device_columns]
-
-        # Combine the flipped columns
-        flipped_columns = flipped_first_device_columns + flipped_second_device_columns
-
-        # Add the time column back to the columns list
-        flipped_columns = ["Time"] + flipped_columns
+        # Addition for the first device columns (S1-S10, D1-D8) and subtraction for the second device columns
+        # (S11-S20, D9-D16), each column keeps its place and its chromophore, the "Time" column is kept
+        flipped_columns = get_channel_registry(data.columns).flipped_names()
 
         # Rename the columns in the original data
         data.columns = flipped_columns
@@ -99,6 +91,23 @@ class SharedReality:
             self.subject_A.set_hbo_data_columns(flipped_columns)
         elif subject == SUBJECT_B:
             self.subject_B.set_hbo_data_columns(flipped_columns)
+        self.isc_engines = None
+
+    def get_isc_engines(self) -> (ISCEngine, ISCEngine):
+        """
+        @return: cumulative sums of subject A's and subject B's data during the session, created once, every ISC of
+                 the session's time windows is derived from them
+        """
+        if self.isc_engines is None:
+            A_begining = self.subject_A.events_table[START_COLUMN].iloc[0]
+            B_begining = self.subject_B.events_table[START_COLUMN].iloc[0]
+            A_end = self.subject_A.events_table[END_COLUMN].iloc[-1]
+            B_end = self.subject_B.events_table[END_COLUMN].iloc[-1]
+            A_data = get_data_in_time_range(self.subject_A.get_hbo_data(), A_begining, A_end)
+            B_data = get_data_in_time_range(self.subject_B.get_hbo_data(), B_begining, B_end)
+            A_data, B_data = get_data_frames_with_equal_rows_number(A_data, B_data)
+            self.isc_engines = ISCEngine(A_data), ISCEngine(B_data)
+        return self.isc_engines
 
     def run(self, date) -> pd.DataFrame:
 
@@ -106,16 +115,9 @@ class SharedReality:
         #     self.flip_device_order(SUBJECT_A)
         # if not self.check_device_order(SUBJECT_B):
         #     self.flip_device_order(SUBJECT_B)
-        A_begining = self.subject_A.events_table[START_COLUMN].iloc[0]
-        B_begining = self.subject_B.events_table[START_COLUMN].iloc[0]
-        A_end = self.subject_A.events_table[END_COLUMN].iloc[-1]
-        B_end = self.subject_B.events_table[END_COLUMN].iloc[-1]
-        A_data = get_data_in_time_range(self.subject_A.get_hbo_data(), A_begining, A_end)
-        B_data = get_data_in_time_range(self.subject_B.get_hbo_data(), B_begining, B_end)
-        A_data, B_data = get_data_frames_with_equal_rows_number(A_data, B_data)
-
-        self.ISC_table = ISC.ISC_by_events(self.subject_A.events_table, self.subject_B.events_table,
-                                           A_data,B_data)
+        engine_A, engine_B = self.get_isc_engines()
+        self.ISC_table = ISC.engines_ISC_by_events(self.subject_A.events_table, self.subject_B.events_table,
+                                                   engine_A, engine_B)
 
         A_pre_choice, B_pre_choice, post_choice, control = self.candidates_handler(date)
         df = pd.DataFrame(index=TABLE_ROWS, columns=self.ISC_table.columns)
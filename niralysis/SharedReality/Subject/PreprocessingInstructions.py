@@ -10,7 +10,10 @@ class PreprocessingInstructions:
                  path_length_factor: float = DEFAULT_PATH_LENGTH_FACTOR, scale: float = DEFAULT_SCALE,
                  invalid_source_thresh: int = DEFAULT_INVALID_SOURCE_THRESH,
                  invalid_detectors_thresh: int = DEFAULT_INVALID_DETECTORS_THRESH,
-                 bad_channels: [str] = []):
+                 bad_channels: [str] = [], lazy_loading: bool = False, dtype=None,
+                 streaming_block_size: int = None, max_bad_channels_fraction: float = None,
+                 filter_method: str = DEFAULT_FILTER_METHOD, n_jobs: int = DEFAULT_N_JOBS,
+                 motion_correction: bool = DEFAULT_MOTION_CORRECTION):
         self.channels = channels
         self.with_storm = with_storm
         self.low_freq, self.high_freq = low_freq, high_freq
@@ -19,4 +22,11 @@ class PreprocessingInstructions:
         self.invalid_source_thresh = invalid_source_thresh
         self.invalid_detectors_thresh = invalid_detectors_thresh
         self.areas_dict = areas_dict
-        self.bad_channels = bad_channels
\ No newline at end of file
+        self.bad_channels = bad_channels
+        self.lazy_loading = lazy_loading
+        self.dtype = dtype
+        self.streaming_block_size = streaming_block_size
+        self.max_bad_channels_fraction = max_bad_channels_fraction
+        self.filter_method = filter_method
+        self.n_jobs = n_jobs
+        self.motion_correction = motion_correction
\ No newline at end of file
@@ -9,19 +9,29 @@ from niralysis.utils.consts import *
 import pandas as pd
 import mne
 
-from niralysis.utils.data_manipulation import set_data_by_areas, get_areas_dict
+from niralysis.utils.data_manipulation import set_data_by_areas, get_areas_dict, get_area_validation
+from niralysis.utils.filtering import filter_raw, FIR
+from niralysis.utils.hbo_cache import get_hbo_cache
+from niralysis.utils.motion_correction import wavelet_motion_correction
+from niralysis.utils.snirf_loader import read_raw_snirf, read_raw_snirf_window, shared_copy
 
 
 class Subject:
     def __init__(self, path: str, preprocess_by_events: bool = False,
                  preprocessing_instructions: PreprocessingInstructions = None, file_to_merge=None):
         self.preprocessing_instructions = preprocessing_instructions
+        self.channel_quality = None
         if not path:
             self.events_data = None
         else:
             self.path = path
-            self.name = path.split('\\')[-1].replace('.snirf', '')
-            self.subject = Niralysis(path, preprocessing_instructions, file_to_merge)
+            self.name = os.path.basename(path).replace('.snirf', '')
+            hbo_cache = get_hbo_cache() if not preprocess_by_events else None
+            cache_key = hbo_cache.key(path, file_to_merge, preprocessing_instructions, HBO_CACHE_MODE) \
+                if hbo_cache is not None else None
+            cached_tables = hbo_cache.load(cache_key) if hbo_cache is not None else None
+            # with cached tables the recording's data is never needed, only its events are read
+            self.subject = Niralysis(path, preprocessing_instructions, file_to_merge, lazy=cached_tables is not None)
             self.subject.events_handler.set_continuous_events_frame()
             self.events_table = self.subject.events_handler.get_continuous_events_frame()
             self.events_data = None
@@ -29,46 +39,153 @@ class Subject:
             self.data_by_ares = False
             print(f"creating subject {self.name} data")
             if not self.preprocess_by_events:
-                self.subject.set_full_hbo_data()
-                self.set_data_by_areas()
+                if cached_tables is not None:
+                    self.set_cached_hbo_data(*cached_tables)
+                else:
+                    if self.is_lazy():
+                        # only the events' time span (with some padding for the filter) is read from the disk, the
+                        # channels' quality is evaluated on that window and not on the whole recording
+                        self.subject.hbo_data.load_data(self.events_table[START_COLUMN].min() - EVENT_WINDOW_PADDING,
+                                                        self.events_table[END_COLUMN].max() + EVENT_WINDOW_PADDING)
+                    self.subject.set_full_hbo_data()
+                    self.subject.hbo_data.release_raw_data()
+                    self.set_data_by_areas()
+                    if hbo_cache is not None:
+                        hbo_cache.store(cache_key, self.subject.hbo_data.get_hbo_data(),
+                                        self.subject.hbo_data.data_by_areas, self.subject.hbo_data.area_validation)
                 self.set_events_data()
             else:
-                self.subject.hbo_data.raw_data = 0
+                self.check_channel_quality()
+                if preprocessing_instructions is not None and preprocessing_instructions.filter_method != FIR:
+                    # the IIR filter leaves no cardiac band in the events' data, the SCI is evaluated on the whole
+                    # unfiltered recording instead
+                    self.channel_quality = self.subject.hbo_data.get_channel_quality()
+                self.subject.hbo_data.release_raw_data()
                 self.set_events_data()
 
 
 
+    def release_recordings(self):
+        """
+        Drops the references to the recording's data once the subject's tables were created, so its memory can be freed
+        (and the subject can be sent to another process cheaply)
+        """
+        self.subject.hbo_data.release_raw_data()
+        self.subject.events_handler.raw_data = None
+
+    def check_channel_quality(self):
+        """
+        Skips hopeless subjects before their events are filtered and preprocessed: raises if more than the
+        instructions' 'max_bad_channels_fraction' of the recording's channels are bad (see ChannelQuality)
+        """
+        max_bad_fraction = getattr(self.preprocessing_instructions, "max_bad_channels_fraction", None)
+        if max_bad_fraction is None:
+            return
+        bad_fraction = self.subject.hbo_data.get_channel_quality().bad_fraction()
+        if bad_fraction > max_bad_fraction:
+            raise ValueError(f"{self.name}: {bad_fraction:.0%} of the channels are bad")
+
+    def is_lazy(self) -> bool:
+        """
+        @return: True if only the events' windows of the recording are read from the disk, padded by
+                 EVENT_WINDOW_PADDING seconds on both sides to keep the filters' edge effects out of the events
+        """
+        return self.preprocessing_instructions is not None and self.preprocessing_instructions.lazy_loading
+
     def get_hbo_data(self):
         if self.data_by_ares:
             return self.subject.hbo_data.get_hbo_data_by_areas()
         return self.subject.hbo_data.get_hbo_data()
 
+    def get_area_validation(self) -> pd.DataFrame | None:
+        """
+        @return: the number of valid channels of each area (see 'get_area_validation'), None if the subject has no areas
+        """
+        return self.subject.hbo_data.area_validation if self.data_by_ares else None
+
+    def set_cached_hbo_data(self, channels_table: pd.DataFrame, areas_table: pd.DataFrame = None,
+                            area_validation: pd.DataFrame = None):
+        """
+        Sets the subject's HbO tables from the HbO cache instead of creating them from the recording
+        @param channels_table: HbO values data table, first column - 'Time', each other column is a channel
+        @param areas_table: HbO values data table by brain areas, None if the subject has no areas
+        @param area_validation: the number of valid channels of each area, None if the subject has no areas
+        """
+        self.subject.hbo_data.user_data_frame = channels_table
+        self.subject.hbo_data.data_by_areas = areas_table
+        self.subject.hbo_data.area_validation = area_validation
+        self.subject.hbo_data.bad_channels = self.preprocessing_instructions.bad_channels
+        self.data_by_ares = areas_table is not None
+
     def set_hbo_data_columns(self, columns):
         self.subject.hbo_data.columns = columns
 
     def set_events_data(self):
         events_data = {FIRST_WATCH: {}, DISCUSSIONS: {}, SECOND_WATCH: {}}
+        # read and filter the recording once for all the events
+        filtered_recording = self.get_filtered_recording() if self.preprocess_by_events and not self.is_lazy() else None
         for index, event in self.events_table.iterrows():
-            event_instance = self.get_event_data(event, self.preprocessing_instructions)
+            event_instance = self.get_event_data(event, self.preprocessing_instructions, filtered_recording)
             if self.preprocess_by_events:
                 event_instance.set_by_areas(self.preprocessing_instructions.areas_dict)
             events_data[EVENTS_CATEGORY[index]][event[EVENT_COLUMN]] = event_instance
 
         self.events_data = events_data
 
-    def get_event_data(self, event_details: pd.Series, preprocessing_instructions: PreprocessingInstructions = None) -> Event:
+    def get_filtered_recording(self) -> mne.io.BaseRaw:
+        """
+        @return: the whole recording converted to optical density and filtered, its data is read-only and meant to be
+                shared by the events (see 'get_event_data')
+        """
+        raw_data = mne.preprocessing.nirs.optical_density(read_raw_snirf(self.path))
+        raw_data = self.filter_recording(raw_data)
+        raw_data._data.flags.writeable = False
+        return raw_data
+
+    def filter_recording(self, raw_data: mne.io.BaseRaw) -> mne.io.BaseRaw:
+        """
+        Filters optical density data in place, by the instructions' filter method and number of jobs. If the
+        instructions ask for motion correction, the data is wavelet motion corrected first.
+        """
+        instructions = self.preprocessing_instructions
+        if instructions is None:
+            return filter_raw(raw_data, 0.01, 0.5)
+        if getattr(instructions, "motion_correction", False):
+            wavelet_motion_correction(raw_data._data, n_jobs=instructions.n_jobs)
+        return filter_raw(raw_data, 0.01, 0.5, instructions.filter_method, instructions.n_jobs)
+
+    def get_event_data(self, event_details: pd.Series, preprocessing_instructions: PreprocessingInstructions = None,
+                       filtered_recording: mne.io.BaseRaw = None) -> Event:
+        """
+        @param event_details: the event's row in the events table
+        @param preprocessing_instructions: instructions for the event's preprocessing (preprocess by events mode)
+        @param filtered_recording: the result of 'get_filtered_recording', if not given it will be created
+        @return: Event instance with the event's data
+        """
         if not self.preprocess_by_events:
             data = self.get_hbo_data()
             event_data = data[(data[TIME_COLUMN] >= event_details[START_COLUMN]) & (data[TIME_COLUMN] <= event_details[END_COLUMN])]
             event_data.reset_index(drop=True, inplace=True)
             event = Event(event_details[EVENT_COLUMN], data_by_area=event_data)
-        else:
-            raw_data = mne.io.read_raw_snirf(self.path, preload=True)
+            event.data.area_validation = self.get_area_validation()
+        elif self.is_lazy():
+            # read only the event's window (with some padding for the filter) from the disk
+            raw_data = read_raw_snirf_window(self.path, event_details[START_COLUMN], event_details[END_COLUMN],
+                                             padding=EVENT_WINDOW_PADDING)
+            window_start = max(event_details[START_COLUMN] - EVENT_WINDOW_PADDING, 0)
             raw_data = mne.preprocessing.nirs.optical_density(raw_data)
-            raw_data = raw_data.filter(l_freq=0.01, h_freq=0.5)
-            raw_data.crop(event_details[START_COLUMN], event_details[END_COLUMN])
+            raw_data = self.filter_recording(raw_data)
+            raw_data.crop(event_details[START_COLUMN] - window_start,
+                          min(event_details[END_COLUMN] - window_start, raw_data.times[-1]))
+            event = Event(event_details[EVENT_COLUMN], raw_data=raw_data)
+            event.preprocess(preprocessing_instructions, self.channel_quality)
+        else:
+            if filtered_recording is None:
+                filtered_recording = self.get_filtered_recording()
+            # crops a view of the filtered recording, the event's data is copied only when it is changed
+            raw_data = shared_copy(filtered_recording).crop(event_details[START_COLUMN], event_details[END_COLUMN])
             event = Event(event_details[EVENT_COLUMN], raw_data=raw_data)
-            event.preprocess(preprocessing_instructions)
+            event.preprocess(preprocessing_instructions, self.channel_quality)
         return event
 
     def get_event_data_table(self, index, name):
@@ -77,13 +194,24 @@ class Subject:
             return None
         return category.get(name).get_data_by_areas()
 
+    def get_event_area_validation(self, index, name) -> pd.DataFrame | None:
+        """
+        @return: the number of valid channels of each area in the event's data (see 'get_area_validation')
+        """
+        category = self.events_data[EVENTS_CATEGORY[index]]
+        if category is None:
+            return None
+        return category.get(name).get_area_validation()
+
     def set_data_by_areas(self):
         areas = self.preprocessing_instructions.areas_dict
         self.data_by_ares = areas is not None
         if areas is None:
             return
 
-        self.subject.hbo_data.data_by_areas = set_data_by_areas(self.subject.hbo_data.get_hbo_data(), areas)
+        channels_table = self.subject.hbo_data.get_hbo_data()
+        self.subject.hbo_data.data_by_areas = set_data_by_areas(channels_table, areas)
+        self.subject.hbo_data.area_validation = get_area_validation(channels_table.columns, areas)
 
     @staticmethod
     def get_subjects_preprocessing_instructions(path: str) -> (str, PreprocessingInstructions):
@@ -102,19 +230,20 @@ class Subject:
 
 
     @staticmethod
-    def subject_handler(root, name, subject, subjects_list=None, preprocess_by_events=False, file_to_merge=None):
+    def subject_handler(root, name, subject, subjects_list=None, preprocess_by_events=False, file_to_merge=None,
+                        raise_errors: bool = False):
         path = os.path.join(root, name)
         file_to_merge_path = os.path.join(root, file_to_merge) if file_to_merge is not None else None
         preprocessing_instructions = Subject.get_subjects_preprocessing_instructions(path)
         if preprocessing_instructions is None:
-            date = root.split('\\')[-1]
+            date = os.path.basename(os.path.normpath(root))
             templates = templates_handler(date)
             template = templates[subject] if templates is not None else None
             temp_dict = get_areas_dict(template)
             preprocessing_instructions = PreprocessingInstructions(areas_dict=temp_dict)
 
         if preprocessing_instructions.areas_dict is None:
-            date = root.split('\\')[-1]
+            date = os.path.basename(os.path.normpath(root))
             templates = templates_handler(date)
             if templates[subject] == 'S':
                 temp_dict = new_small
@@ -135,5 +264,7 @@ class Subject:
                     subjects_list.append(subject)
                 return subject
             except Exception as e:
+                if raise_errors:
+                    raise
                 print(f"{name} failed: {e}")
 
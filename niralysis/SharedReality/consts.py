@@ -178,6 +178,11 @@ DEFAULT_PATH_LENGTH_FACTOR = 0.6
 DEFAULT_SCALE = 0.1
 DEFAULT_INVALID_SOURCE_THRESH = 20
 DEFAULT_INVALID_DETECTORS_THRESH = 20
+DEFAULT_FILTER_METHOD = "fir"  # 'fir' - mne's default FIR filter, 'iir' - zero-phase butterworth filter
+DEFAULT_N_JOBS = 1
+DEFAULT_MOTION_CORRECTION = False  # wavelet motion correction of the optical density, before filtering
+HBO_CACHE_MODE = "set_data_frame"  # the flow that creates the subjects' HbO tables, part of the HbO cache's key
+EVENT_WINDOW_PADDING = 100  # seconds read around an event in lazy loading, to keep the filters' edge effects out of it
 
 
 # candidate choices and score xlsx
@@ -1,9 +1,9 @@
-import mne
 import os
 import pandas as pd
 import numpy as np
 import datetime
 from niralysis.utils.consts import *
+from niralysis.utils.snirf_loader import read_raw_snirf
 from datetime import timezone
 
 
@@ -91,17 +91,17 @@ def set_events_from_psychopy_table(snirf_path,psychopy_path):
 
     The method sets the events in the SNIRF file according to the Psychopy file
     """
-    snirf = mne.io.read_raw_snirf(snirf_path, preload=True)
+    snirf = read_raw_snirf(snirf_path)
     psychopy = pd.read_csv(psychopy_path)
     delay = get_delay(get_rec_start_time(snirf), get_exp_start_time(psychopy_path))  #datetime.datetime.fromtimestamp(psychopy['StartTime'][0])
     snirf.annotations.description = np.array(EVENTS)
     snirf.annotations.onset = np.array([get_event_info(event, delay, psychopy, idx) for idx, event in enumerate(EVENTS)], dtype=float)
     return snirf
 
-def set_events_from_rec_delay(events_file_path, subject_B_path):
+def set_events_from_rec_delay(events_file_path, subject_B_path, preload=True):
 
-    events_snirf = mne.io.read_raw_snirf(events_file_path, preload=True)
-    snirf_b = mne.io.read_raw_snirf(subject_B_path, preload=True)
+    events_snirf = read_raw_snirf(events_file_path, preload=False)
+    snirf_b = read_raw_snirf(subject_B_path, preload)
     delay = get_delay(get_rec_start_time(events_snirf), get_rec_start_time(snirf_b))
     if delay < 0:
         snirf_b.annotations.onset = events_snirf.annotations.onset - abs(delay)
@@ -112,10 +112,10 @@ def set_events_from_rec_delay(events_file_path, subject_B_path):
     
     return snirf_b
 
-def set_events_from_original_file(path, events_file):
+def set_events_from_original_file(path, events_file, preload=True):
 
-    snirf = mne.io.read_raw_snirf(path, preload=True)
-    snirf.set_annotations(mne.io.read_raw_snirf(events_file, preload=True).annotations)
+    snirf = read_raw_snirf(path, preload)
+    snirf.set_annotations(read_raw_snirf(events_file, preload=False).annotations)
 
     return snirf
 
@@ -0,0 +1,27 @@
+import mne
+import numpy as np
+from mne.io.constants import FIFF
+
+_matrices = {}
+
+
+def get_beer_lambert_matrix(info: mne.Info, path_length_factor: float) -> ([str], np.ndarray):
+    """
+    mne's beer_lambert_law is linear in the optical density, so it is computed once per montage (channels, optodes'
+    locations and wavelengths) by applying it to an identity matrix.
+    @param info: info of the optical density (or intensity) channels
+    @param path_length_factor: The partial pathlength factor for beer lambert law
+    @return: names of mne's output channels ('S1_D1 hbo'...), (output channel, input channel) conversion matrix
+    """
+    locations = np.array([channel['loc'] for channel in info['chs']])
+    key = (tuple(info.ch_names), locations.tobytes(), path_length_factor)
+    if key not in _matrices:
+        info = info.copy()
+        for channel in info['chs']:
+            channel['coil_type'] = FIFF.FIFFV_COIL_FNIRS_OD
+        identity = mne.io.RawArray(np.eye(len(info.ch_names)), info, verbose=False)
+        concentrations = mne.preprocessing.nirs.beer_lambert_law(identity, path_length_factor)
+        matrix = concentrations.get_data()
+        matrix.flags.writeable = False
+        _matrices[key] = (concentrations.ch_names, matrix)
+    return _matrices[key]
@@ -6,6 +6,15 @@ END_COLUMN = 'End'
 START_COLUMN = 'Start'
 DURATION_COLUMN = 'Duration'
 EVENT_COLUMN = 'Event'
+ISC_ROW = 'ISC'
+P_VALUE_ROW = 'p value'
+CI_LOW_ROW = 'CI low'
+CI_HIGH_ROW = 'CI high'
+PEAK_LAG_ROW = 'peak lag'
+PEAK_ISC_ROW = 'peak ISC'
+A_EVENT_COLUMN = "A's event"
+B_EVENT_COLUMN = "B's event"
+AREA_COLUMN = 'Area'
 
 
 # event markers
@@ -1,7 +1,13 @@
+import numpy as np
 import pandas as pd
+from scipy import sparse
+
+from niralysis.HbOData.ChannelRegistry import get_channel_registry
 
 from niralysis.SharedReality.consts import *
 from niralysis.utils.consts import TIME_COLUMN
+from niralysis.utils.isc_bootstrap import bootstrap_means, percentile_interval, BOOTSTRAP_RESAMPLES, \
+    BOOTSTRAP_CONFIDENCE, BOOTSTRAP_MEMORY_BUDGET
 
 
 def set_data_by_areas(df: pd.DataFrame, areas: dict) -> pd.DataFrame:
@@ -16,25 +22,71 @@ def set_data_by_areas(df: pd.DataFrame, areas: dict) -> pd.DataFrame:
     @param areas: dictionary that associate brain areas and channels - keys: brain area name, value: a list of
             channels names.
     @return: HbO values data table, first column - 'Time', each other column is a certain brain's area measurements
-            values. Each row is the value of all the brain's area in a given time
+            values. Each row is the value of all the brain's area in a given time. The number of channels of each area
+            is not part of the table, see 'get_area_validation'
 
     """
-    data_by_area = pd.DataFrame()
-    valid_area = {}
-    valid_channels_count = {}
-    data_by_area[TIME_COLUMN] = df[TIME_COLUMN]
-    for area in areas.keys():
-        valid_channels = [f"{channel} hbo" for channel in areas[area] if f"{channel} hbo" in df.columns]
-        data_by_area[area] =df[valid_channels].mean(axis=1)
-        valid_area[area] = 1 if len(valid_channels) > 0 else 0
-        valid_channels_count[area] = len(valid_channels)
+    membership, counts = get_area_projection(df.columns, areas)
+    data_by_area = pd.DataFrame(project_to_areas(df.to_numpy(dtype=float), membership, counts),
+                                index=df.index, columns=list(areas.keys()))
+    data_by_area.insert(0, TIME_COLUMN, df[TIME_COLUMN])
+    return data_by_area
 
-    valid_area[TIME_COLUMN] = 1
-    valid_channels_count[TIME_COLUMN] = 1
-    data_by_area.loc[AREA_VALIDATION] = valid_area
-    data_by_area.loc[VALID_CHANNELS] = valid_channels_count
 
-    return data_by_area
+def get_area_validation(columns, areas: dict) -> pd.DataFrame:
+    """
+    Metadata of a table created by 'set_data_by_areas', kept apart from its time series.
+    @param columns: columns of the channels' data table ('Time', 'S1_D1 hbo'...)
+    @param areas: dictionary that associate brain areas and channels - keys: brain area name, value: a list of
+            channels names.
+    @return: table with two rows: 'area validation' - 1 if the area has valid channels, 0 otherwise, 'valid channels' -
+             number of the area's valid channels. Columns - 'Time' (always 1) and the areas.
+    """
+    _, counts = get_area_projection(columns, areas)
+    validation = pd.DataFrame([(counts > 0).astype(int), counts.astype(int)], index=[AREA_VALIDATION, VALID_CHANNELS],
+                              columns=list(areas.keys()))
+    validation.insert(0, TIME_COLUMN, 1)
+    return validation
+
+
+_area_projections = {}
+
+
+def get_area_projection(columns, areas: dict) -> (sparse.csr_matrix, np.ndarray):
+    """
+    Channel to area projection, created once per channels and areas dictionary (montage template).
+    @param columns: the data's columns, channels' names ('S1_D1 hbo'), other columns (e.g. 'Time') belong to no area
+    @param areas: dictionary that associate brain areas and channels - keys: brain area name, value: a list of
+            channels names.
+    @return: sparse (column, area) matrix, 1 if the column is an HbO channel of the area, number of channels of
+             each area
+    """
+    key = (tuple(columns), tuple((area, tuple(channels)) for area, channels in areas.items()))
+    if key not in _area_projections:
+        membership = get_channel_registry(columns).area_mask(areas)
+        _area_projections[key] = (sparse.csr_matrix(membership, dtype=float), membership.sum(axis=0))
+    return _area_projections[key]
+
+
+def project_to_areas(values: np.ndarray, membership: sparse.csr_matrix, counts: np.ndarray = None) -> np.ndarray:
+    """
+    Mean of each area's channels with a single (sparse) matrix product, NaN values are skipped (like pandas' mean).
+    @param values: (..., time, column) values, e.g. a recording or a stack of events with the same columns
+    @param membership: (column, area) matrix, see 'get_area_projection'
+    @param counts: number of channels of each area, if known
+    @return: (..., time, area) means, NaN for areas without (non NaN) channels
+    """
+    flat = values.reshape(-1, values.shape[-1])
+    missing = np.isnan(flat)
+    if missing.any():
+        sums = (membership.T @ np.where(missing, 0, flat).T).T
+        counts = (membership.T @ (~missing).T.astype(float)).T
+    else:
+        sums = (membership.T @ flat.T).T
+        counts = membership.sum(axis=0).A1 if counts is None else counts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    return means.reshape(values.shape[:-1] + (membership.shape[1],))
 
 
 def set_before_and_after_difference_table(ISC_table: pd.DataFrame, events: [str]):
@@ -70,6 +122,26 @@ def calculate_mean_table(data_tables: [pd.DataFrame], factor):
 
     return mean_table / factor
 
+
+def calculate_mean_table_interval(data_tables: [pd.DataFrame], n_resamples: int = BOOTSTRAP_RESAMPLES,
+                                  confidence: float = BOOTSTRAP_CONFIDENCE, seed: int = None,
+                                  memory_budget: int = BOOTSTRAP_MEMORY_BUDGET) -> (pd.DataFrame, pd.DataFrame):
+    """
+    Bootstrap confidence interval of 'calculate_mean_table': the tables (subjects) are resampled with replacement, all
+    the resamples are evaluated as batched array operations. Empty cells (NaN) are not part of the means.
+
+    @param data_tables: A list of data frames, all with the same structure (columns and indexes)
+    @param n_resamples: number of resamples
+    @param confidence: the interval's confidence level
+    @param seed: seed of the random numbers
+    @param memory_budget: bytes of the resampled tables, the resamples are evaluated in chunks that fit in it
+    @return: tables of the interval's low and high bounds, with the data tables' structure
+    """
+    values = np.stack([data_table.to_numpy(dtype=float) for data_table in data_tables])
+    low, high = percentile_interval(bootstrap_means(values, n_resamples, seed, memory_budget), confidence)
+    return (pd.DataFrame(low, index=data_tables[0].index, columns=data_tables[0].columns),
+            pd.DataFrame(high, index=data_tables[0].index, columns=data_tables[0].columns))
+
 def count_nan_values(df):
     """
     Count the number of NaN values in each column of the DataFrame.
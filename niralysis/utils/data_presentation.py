@@ -21,18 +21,6 @@ def get_low_auditory_isc_plot(isc_table: pd.DataFrame, subject: Subject, mean: S
             else:
                 time = mean_event_data_table["Time"] - mean_event_data_table["Time"][0]
                 subject_hbo_values = subject_hbo_values[:len(time)]
-            if "area validation" in subject_hbo_values:
-                subject_hbo_values.drop("area validation", inplace=True)
-            if "valid channels" in subject_hbo_values:
-                subject_hbo_values.drop("valid channels", inplace=True)
-            if "area validation" in mean_hbo_values:
-                mean_hbo_values.drop("area validation", inplace=True)
-            if "valid channels" in mean_hbo_values:
-                mean_hbo_values.drop("valid channels", inplace=True)
-            if "area validation" in time:
-                time.drop("area validation", inplace=True)
-            if "valid channels" in time:
-                time.drop("valid channels", inplace=True)
             # If last values in mean_hbo_values or subject_hbo_values is NaN, remove it
             mean_hbo_values = mean_hbo_values.dropna()
             subject_hbo_values = subject_hbo_values.dropna()
@@ -0,0 +1,222 @@
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import mne
+import numpy as np
+from scipy.signal import fftconvolve
+
+from niralysis.utils.parallel import get_n_jobs
+
+FIR = "fir"
+IIR = "iir"
+FILTER_METHODS = (FIR, IIR)
+IIR_ORDER = 4  # butterworth order, doubled by the zero-phase (forward-backward) filtering
+
+
+def design_fir_filter(sfreq: float, l_freq: float | None, h_freq: float | None, **kwargs) -> np.ndarray:
+    """
+    Designs the same FIR filter mne uses by default in 'raw.filter'.
+    @param sfreq: sampling frequency (Hz)
+    @param l_freq: low cut-off frequency (Hz), None for a low-pass filter
+    @param h_freq: high cut-off frequency (Hz), None for a high-pass filter
+    @param kwargs: other arguments of 'mne.filter.create_filter' (transition bandwidths etc.)
+    @return: the filter's coefficients
+    """
+    return mne.filter.create_filter(None, sfreq, l_freq, h_freq, verbose=False, **kwargs)
+
+
+class StreamingFIRFilter:
+    """
+    Zero-phase FIR filtering of a long signal that is given in consecutive blocks.
+
+    The output is the same as mne's (overlap-add) FIR filtering of the whole signal, including its 'reflect_limited'
+    padding of the edges, but only the last len(h) samples are kept in memory between blocks (overlap-save).
+
+     Args:
+        h (np.ndarray): linear-phase FIR filter, see 'design_fir_filter'
+        n_times (int): length of the whole signal, needed to pad its end
+        n_channels (int): number of channels (rows) of each block
+
+     Methods:
+        process - filters the next block of the signal, returns the filtered samples that are ready. The output lags
+                  behind the input, the remaining samples are returned after the last block.
+    """
+
+    def __init__(self, h: np.ndarray, n_times: int, n_channels: int):
+        self.h = h
+        self.n_times = n_times
+        if n_times < len(h):
+            warnings.warn(f"filter_length ({len(h)}) is longer than the signal ({n_times}), distortion is likely. "
+                          f"Reduce filter length or filter a longer signal.", RuntimeWarning)
+        self.n_edge = max(min(len(h), n_times) - 1, 0)
+        self.delay = self.n_edge + (len(h) - 1) // 2
+        self._history = np.zeros((n_channels, len(h) - 1))  # last samples of the padded signal
+        self._head = np.empty((n_channels, 0))  # first samples of the signal, until the start's padding is known
+        self._tail = np.empty((n_channels, 0))  # last samples of the signal, for the end's padding
+        self._n_received = 0
+        self._n_filtered = 0  # number of samples of the padded signal that went through the filter
+        self._n_emitted = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        @param block: (channel, time) next samples of the signal
+        @return: (channel, time) the next filtered samples, might be empty
+        """
+        self._n_received += block.shape[1]
+        if self._n_received > self.n_times:
+            raise ValueError(f"Got {self._n_received} samples, more than the signal's length {self.n_times}")
+        is_last = self._n_received == self.n_times
+
+        self._tail = np.concatenate([self._tail, block], axis=1)[:, -(self.n_edge + 1):]
+        padded = []
+        if self._head is not None:
+            # the start is padded by reflecting the first n_edge + 1 samples
+            self._head = np.concatenate([self._head, block], axis=1)
+            if self._head.shape[1] <= self.n_edge and not is_last:
+                return np.empty((block.shape[0], 0))
+            head, self._head = self._head, None
+            padded += [2 * head[:, :1] - head[:, self.n_edge:0:-1], head]
+        else:
+            padded.append(block)
+        if is_last:
+            padded.append(2 * self._tail[:, -1:] - self._tail[:, -2:-self.n_edge - 2:-1])
+            # signals shorter than the filter are padded with zeros beyond the reflected samples (as mne does), the
+            # filter's delay is flushed through with them
+            padded.append(np.zeros((block.shape[0], (len(self.h) - 1) // 2)))
+
+        return self._filter(np.concatenate(padded, axis=1), is_last)
+
+    def _filter(self, padded: np.ndarray, is_last: bool) -> np.ndarray:
+        signal = np.concatenate([self._history, padded], axis=1)
+        filtered = fftconvolve(signal, self.h[np.newaxis, :], mode="valid", axes=1)
+        self._history = signal[:, signal.shape[1] - self._history.shape[1]:]
+
+        # the filtered sample i of the padded signal is the output sample i - delay
+        first = self._n_filtered
+        self._n_filtered += padded.shape[1]
+        start = max(self._n_emitted + self.delay - first, 0)
+        stop = min(self.n_times + self.delay - first, filtered.shape[1])
+        output = filtered[:, start:stop] if stop > start else np.empty((padded.shape[0], 0))
+        self._n_emitted += output.shape[1]
+        if is_last and self._n_emitted != self.n_times:
+            raise RuntimeError("The signal is shorter than the filter's delay")
+        return output
+
+
+_filter_designs = {}
+
+
+def get_filter_design(sfreq: float, l_freq: float | None, h_freq: float | None, method: str = FIR):
+    """
+    Designs a filter once per sampling frequency, band and method, later calls (for other subjects and events)
+    return the same design.
+    @param sfreq: sampling frequency (Hz)
+    @param l_freq: low cut-off frequency (Hz), None for a low-pass filter
+    @param h_freq: high cut-off frequency (Hz), None for a high-pass filter
+    @param method: 'fir' - mne's default FIR filter, 'iir' - butterworth filter in second-order sections
+    @return: FIR coefficients (read-only array) or mne's iir_params dict (with 'sos')
+    """
+    if method not in FILTER_METHODS:
+        raise ValueError(f"Unknown filter method {method}, expected one of {FILTER_METHODS}")
+    key = (float(sfreq), l_freq, h_freq, method)
+    if key not in _filter_designs:
+        if method == FIR:
+            design = design_fir_filter(sfreq, l_freq, h_freq)
+            design.flags.writeable = False
+        else:
+            if l_freq is not None and h_freq is not None:
+                f_pass, btype = [l_freq, h_freq], "bandpass"
+            elif l_freq is not None:
+                f_pass, btype = l_freq, "highpass"
+            else:
+                f_pass, btype = h_freq, "lowpass"
+            design = mne.filter.construct_iir_filter(dict(order=IIR_ORDER, ftype="butter", output="sos"), f_pass,
+                                                     sfreq=sfreq, btype=btype, verbose=False)
+        _filter_designs[key] = design
+    return _filter_designs[key]
+
+
+def apply_fir_filter(data: np.ndarray, h: np.ndarray, n_jobs: int | None = 1) -> np.ndarray:
+    """
+    Zero-phase FIR filtering of (channel, time) data in place, the same as mne's FIR filtering.
+    @param data: (channel, time) array, changed in place
+    @param h: FIR coefficients, see 'get_filter_design'
+    @param n_jobs: number of threads, the channels are split between them (-1 - all the CPUs)
+    @return: the filtered data
+    """
+    n_channels, n_times = data.shape
+    chunks = [chunk for chunk in np.array_split(np.arange(n_channels), get_n_jobs(n_jobs)) if len(chunk)]
+
+    def filter_chunk(chunk: np.ndarray):
+        rows = slice(chunk[0], chunk[-1] + 1)
+        data[rows] = StreamingFIRFilter(h, n_times, len(chunk)).process(data[rows])
+
+    if len(chunks) <= 1:
+        for chunk in chunks:
+            filter_chunk(chunk)
+    else:
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            list(executor.map(filter_chunk, chunks))
+    return data
+
+
+def filter_data(data: np.ndarray, sfreq: float, l_freq: float | None, h_freq: float | None, method: str = FIR,
+                n_jobs: int | None = 1) -> np.ndarray:
+    """
+    Filters (channel, time) data in place (like 'mne.filter.filter_data'), with a cached filter design.
+    @param data: (channel, time) float64 array, changed in place
+    @param sfreq: sampling frequency (Hz)
+    @param l_freq: low cut-off frequency (Hz), None for a low-pass filter
+    @param h_freq: high cut-off frequency (Hz), None for a high-pass filter
+    @param method: 'fir' - mne's default FIR filter (the default), 'iir' - zero-phase butterworth filter, much faster
+                   for low cut-off frequencies that need very long FIR filters
+    @param n_jobs: number of workers filtering the channels (-1 - all the CPUs)
+    @return: the filtered data
+    """
+    design = get_filter_design(sfreq, l_freq, h_freq, method)
+    if method == FIR:
+        return apply_fir_filter(data, design, n_jobs)
+    return mne.filter.filter_data(data, sfreq, l_freq, h_freq, method=IIR, iir_params=design,
+                                  n_jobs=get_n_jobs(n_jobs), copy=False, verbose=False)
+
+
+def filter_raw(raw: mne.io.BaseRaw, l_freq: float | None, h_freq: float | None, method: str = FIR,
+               n_jobs: int | None = 1) -> mne.io.BaseRaw:
+    """
+    Filters a preloaded Raw instance in place (like 'raw.filter'), with a cached filter design, see 'filter_data'.
+    @param raw: preloaded Raw instance, its data must be writable (see 'ensure_writable')
+    @param l_freq: low cut-off frequency (Hz), None for a low-pass filter
+    @param h_freq: high cut-off frequency (Hz), None for a high-pass filter
+    @param method: 'fir' or 'iir', see 'filter_data'
+    @param n_jobs: number of workers filtering the channels (-1 - all the CPUs)
+    @return: the same Raw instance
+    """
+    filter_data(raw._data, raw.info["sfreq"], l_freq, h_freq, method, n_jobs)
+    return raw
+
+
+def apply_fir_filter_stack(data: np.ndarray, lengths: [int], h: np.ndarray) -> np.ndarray:
+    """
+    Zero-phase FIR filtering of a stack of recordings with one FFT convolution, in place.
+    Each recording is padded at its own edges (mne's 'reflect_limited' padding), so the result is the same as filtering
+    each of them alone with mne.
+    @param data: (recording, channel, time) array, recording i is in its first lengths[i] samples, changed in place
+    @param lengths: number of samples of each recording
+    @param h: FIR coefficients, see 'get_filter_design'
+    @return: the filtered data
+    """
+    n_recordings, n_channels, _ = data.shape
+    lengths = np.asarray(lengths, dtype=int)
+    edges = np.maximum(np.minimum(len(h), lengths) - 1, 0)
+    padded = np.zeros((n_recordings, n_channels, (lengths + 2 * edges).max()))
+    for i, (n_times, n_edge) in enumerate(zip(lengths, edges)):
+        signal = data[i, :, :n_times]
+        padded[i, :, :n_edge] = 2 * signal[:, :1] - signal[:, n_edge:0:-1]
+        padded[i, :, n_edge:n_edge + n_times] = signal
+        padded[i, :, n_edge + n_times:n_times + 2 * n_edge] = 2 * signal[:, -1:] - signal[:, -2:-n_edge - 2:-1]
+
+    filtered = fftconvolve(padded, h[np.newaxis, np.newaxis, :], mode="full", axes=2)
+    for i, (n_times, n_edge) in enumerate(zip(lengths, edges)):
+        delay = n_edge + (len(h) - 1) // 2
+        data[i, :, :n_times] = filtered[i, :, delay:delay + n_times]
+    return data
@@ -0,0 +1,279 @@
+import argparse
+import hashlib
+import json
+import multiprocessing.util
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from niralysis.SharedReality.consts import AREA_VALIDATION, VALID_CHANNELS
+
+HBO_CACHE_DIR_ENV = "NIRALYSIS_CACHE_DIR"
+HBO_CACHE_VERSION = 2  # bump when the preprocessing results change, old entries will never be read again
+STATS_FILE = "stats.log"  # a line of hits and misses per flush, appended by every process
+HASH_CHUNK_SIZE = 4 * 1024 ** 2
+
+
+class HbOCache:
+    """
+    Persistent, content-addressed cache of preprocessed HbO tables.
+
+    An entry holds the channels table (HbOData.user_data_frame), the areas table (HbOData.data_by_areas) and the
+    areas' validation (HbOData.area_validation) of a single recording. Its key is a hash of the SNIRF file's content,
+    the content of the merged file (if any), the preprocessing mode and every field of the preprocessing instructions,
+    so any change in the inputs creates a new entry. Tables are stored column-wise as numpy arrays in an uncompressed '.npz' file.
+
+    Hits and misses are counted in memory, every process appends its new counts to the folder's single stats file when
+    it stores an entry and when it exits (see 'flush_stats'). Loading never writes to the folder, so a read-only folder
+    or a broken stats file never fails a lookup.
+
+    Args:
+        directory (str): folder of the cache's files, created if needed
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def key(self, path: str, file_to_merge: str = None, preprocessing_instructions=None, mode: str = "") -> str:
+        """
+        @param path: path to the SNIRF file
+        @param file_to_merge: path to a SNIRF file that is merged into the first one, None if there is none
+        @param preprocessing_instructions: PreprocessingInstructions instance used to create the tables
+        @param mode: name of the preprocessing flow, to tell apart tables created differently from the same inputs
+        @return: the entry's key
+        """
+        instructions = vars(preprocessing_instructions) if preprocessing_instructions is not None else None
+        description = {"version": HBO_CACHE_VERSION,
+                       "file": file_hash(path),
+                       "file_to_merge": file_hash(file_to_merge) if file_to_merge is not None else None,
+                       "mode": mode,
+                       "instructions": instructions}
+        encoded = json.dumps(description, sort_keys=True, default=_to_json)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def load(self, key: str) -> (pd.DataFrame, pd.DataFrame, pd.DataFrame):
+        """
+        @param key: entry's key, see 'key'
+        @return: channels table, areas table and areas' validation (None if they were not created), None if there is
+                 no such entry
+        """
+        entry_path = self._entry_path(key)
+        if not os.path.exists(entry_path):
+            self._count("misses")
+            return None
+
+        with np.load(entry_path, allow_pickle=False) as entry:
+            channels_table = pd.DataFrame(entry["channels_values"], columns=entry["channels_columns"].tolist())
+            areas_table, area_validation = None, None
+            if "areas_values" in entry:
+                areas_table = pd.DataFrame(entry["areas_values"], columns=entry["areas_columns"].tolist())
+            if "areas_validation" in entry:
+                area_validation = pd.DataFrame(entry["areas_validation"].astype(int),
+                                               columns=entry["areas_columns"].tolist(),
+                                               index=[AREA_VALIDATION, VALID_CHANNELS])
+        self._count("hits")
+        return channels_table, areas_table, area_validation
+
+    def store(self, key: str, channels_table: pd.DataFrame, areas_table: pd.DataFrame = None,
+              area_validation: pd.DataFrame = None):
+        """
+        @param key: entry's key, see 'key'
+        @param channels_table: HbO values data table, first column - 'Time', each other column is a channel
+        @param areas_table: HbO values data table by brain areas (see 'set_data_by_areas'), optional
+        @param area_validation: the areas table's validation (see 'get_area_validation'), optional
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        arrays = {"channels_values": channels_table.to_numpy(dtype=float),
+                  "channels_columns": np.array(channels_table.columns, dtype=str)}
+        if areas_table is not None:
+            arrays["areas_values"] = areas_table.to_numpy(dtype=float)
+            arrays["areas_columns"] = np.array(areas_table.columns, dtype=str)
+        if area_validation is not None:
+            arrays["areas_validation"] = area_validation.to_numpy(dtype=float)
+
+        # write to a temporary file first, so other processes never read a partially written entry
+        temporary_path = self._entry_path(key) + f".{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(temporary_path, self._entry_path(key))
+        flush_stats()
+
+    def stats(self) -> dict:
+        """
+        @return: number of hits and misses of all the processes that used the cache (the flushed counts and this
+                 process's counts that were not flushed yet), number of entries and their size in bytes
+        """
+        with _counters_lock:
+            stats = dict(_process_counters().get(os.path.abspath(self.directory), {"hits": 0, "misses": 0}))
+        for counters in _read_counters(os.path.join(self.directory, STATS_FILE)):
+            stats["hits"] += counters.get("hits", 0)
+            stats["misses"] += counters.get("misses", 0)
+        entries = [entry.path for entry in self._scan() if entry.name.endswith(".npz")]
+        stats["entries"] = len(entries)
+        stats["size"] = sum(os.path.getsize(entry) for entry in entries)
+        return stats
+
+    def clear(self):
+        for entry in self._scan():
+            if entry.name.endswith(".npz") or entry.name == STATS_FILE:
+                os.remove(entry.path)
+        with _counters_lock:
+            _process_counters().pop(os.path.abspath(self.directory), None)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _scan(self) -> [os.DirEntry]:
+        return list(os.scandir(self.directory)) if os.path.isdir(self.directory) else []
+
+    def _count(self, counter: str):
+        with _counters_lock:
+            counters = _process_counters().setdefault(os.path.abspath(self.directory), {"hits": 0, "misses": 0})
+            counters[counter] += 1
+
+
+_counters = {}  # this process's hits and misses that were not flushed yet, by cache folder
+_counters_pid = None  # process of the counters, a forked process starts its own counters
+_counters_lock = threading.Lock()
+
+
+def _process_counters() -> dict:
+    """
+    @return: this process's counters, by cache folder. The first call in a process registers 'flush_stats' to run
+             when the process exits (multiprocessing's finalizers also run in the pool's worker processes, which
+             skip atexit)
+    """
+    global _counters_pid
+    if _counters_pid != os.getpid():
+        _counters.clear()
+        _counters_pid = os.getpid()
+        multiprocessing.util.Finalize(None, flush_stats, exitpriority=0)
+    return _counters
+
+
+def _read_counters(path: str) -> [dict]:
+    """
+    @return: the counters of each line of a stats file, lines that can't be read (e.g. a partially written line) are
+             skipped, none if the file can't be read
+    """
+    try:
+        with open(path) as file:
+            lines = file.readlines()
+    except OSError:
+        return []
+    counters = []
+    for line in lines:
+        try:
+            line_counters = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(line_counters, dict):
+            counters.append(line_counters)
+    return counters
+
+
+def flush_stats():
+    """
+    Appends this process's new counts to the stats file of each cache folder it used, a single short line written at
+    once, so processes never overwrite each other's counts and the folder keeps a single stats file. Folders that
+    can't be written to are skipped, their counts are kept for the next flush.
+    """
+    with _counters_lock:
+        counters = _process_counters()
+        for directory, stats in list(counters.items()):
+            if not any(stats.values()):
+                continue
+            line = (json.dumps(stats) + "\n").encode()
+            try:
+                os.makedirs(directory, exist_ok=True)
+                stats_file = os.open(os.path.join(directory, STATS_FILE), os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                                     0o666)
+                try:
+                    os.write(stats_file, line)
+                finally:
+                    os.close(stats_file)
+            except OSError:
+                continue
+            del counters[directory]
+
+
+_file_hashes = {}
+
+
+def file_hash(path: str) -> str:
+    """
+    Hashes a file's content, the result is kept in memory as long as the file's modification time and size are the
+    same, so every file is hashed once per process.
+    @param path: path to a file
+    @return: sha256 of the file's content
+    """
+    path = os.path.abspath(str(path))
+    stat = os.stat(path)
+    stamp = (path, stat.st_mtime_ns, stat.st_size)
+    if stamp not in _file_hashes:
+        sha = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+                sha.update(chunk)
+        _file_hashes[stamp] = sha.hexdigest()
+    return _file_hashes[stamp]
+
+
+def _to_json(value):
+    if isinstance(value, (pd.Series, pd.Index, np.ndarray)):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+_hbo_cache_dir = None
+
+
+def set_hbo_cache_dir(directory: str | None):
+    """
+    Turns the HbO cache on (or off if None), by default the cache is on only if the 'NIRALYSIS_CACHE_DIR' environment
+    variable is set.
+    @param directory: folder of the cache's files
+    """
+    global _hbo_cache_dir
+    _hbo_cache_dir = directory
+
+
+def get_hbo_cache() -> HbOCache | None:
+    """
+    @return: the HbO cache, None if it is turned off
+    """
+    directory = _hbo_cache_dir or os.environ.get(HBO_CACHE_DIR_ENV)
+    return HbOCache(directory) if directory else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m niralysis.utils.hbo_cache",
+                                     description="Manage the cache of preprocessed HbO tables")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--dir", default=None, help=f"cache folder (default: ${HBO_CACHE_DIR_ENV})")
+    args = parser.parse_args(argv)
+
+    directory = args.dir or _hbo_cache_dir or os.environ.get(HBO_CACHE_DIR_ENV)
+    if not directory:
+        parser.error(f"no cache folder, use --dir or set {HBO_CACHE_DIR_ENV}")
+    cache = HbOCache(directory)
+
+    if args.command == "clear":
+        cache.clear()
+        print(f"cleared {directory}")
+        return
+
+    stats = cache.stats()
+    print(f"cache: {directory}")
+    print(f"hits: {stats['hits']}")
+    print(f"misses: {stats['misses']}")
+    print(f"entries: {stats['entries']}")
+    print(f"size: {stats['size'] / 1024 ** 2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
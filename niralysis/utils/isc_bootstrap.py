@@ -0,0 +1,84 @@
+import warnings
+
+import numpy as np
+
+from niralysis.utils.isc_kernel import pearson
+
+BOOTSTRAP_RESAMPLES = 1000
+BOOTSTRAP_CONFIDENCE = 0.95
+BOOTSTRAP_MEMORY_BUDGET = 256 * 1024 ** 2
+
+
+def resample_indexes(n: int, n_resamples: int, seed: int = None) -> np.ndarray:
+    """
+    @param n: number of samples (subjects, bins...)
+    @param n_resamples: number of resamples
+    @param seed: seed of the random numbers
+    @return: (resample, n) indexes, drawn with replacement, all the resamples are drawn up front
+    """
+    return np.random.default_rng(seed).integers(0, n, (n_resamples, n))
+
+
+def get_chunk_size(bytes_per_resample: int, memory_budget: int = BOOTSTRAP_MEMORY_BUDGET) -> int:
+    """
+    @return: number of resamples evaluated at once so their arrays fit in the memory budget (at least one)
+    """
+    return max(1, memory_budget // max(bytes_per_resample, 1))
+
+
+def bootstrap_means(values: np.ndarray, n_resamples: int = BOOTSTRAP_RESAMPLES, seed: int = None,
+                    memory_budget: int = BOOTSTRAP_MEMORY_BUDGET) -> np.ndarray:
+    """
+    Group means of resampled subjects. NaN values are not part of the means.
+    @param values: (subject, ...) e.g. the subjects' (subject, event, area) ISC values
+    @param n_resamples: number of resamples
+    @param seed: seed of the random numbers
+    @param memory_budget: bytes of the resampled values, the resamples are evaluated in chunks that fit in it
+    @return: (resample, ...) the means of the resampled subjects
+    """
+    indexes = resample_indexes(len(values), n_resamples, seed)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0)
+    means = np.empty((n_resamples,) + values.shape[1:])
+    chunk_size = get_chunk_size(2 * values.size * values.itemsize, memory_budget)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for first in range(0, n_resamples, chunk_size):
+            chunk = indexes[first:first + chunk_size]
+            means[first:first + chunk_size] = filled[chunk].sum(axis=1) / valid[chunk].sum(axis=1)
+    return means
+
+
+def bootstrap_isc(binned_A: np.ndarray, binned_B: np.ndarray, n_resamples: int = BOOTSTRAP_RESAMPLES,
+                  seed: int = None, memory_budget: int = BOOTSTRAP_MEMORY_BUDGET) -> np.ndarray:
+    """
+    ISC of resampled bins, A's and B's bins are resampled together.
+    @param binned_A: (bin, channel) A's binned signals
+    @param binned_B: (bin, channel) B's binned signals, the same number of bins
+    @param n_resamples: number of resamples
+    @param seed: seed of the random numbers
+    @param memory_budget: bytes of the resampled bins, the resamples are evaluated in chunks that fit in it
+    @return: (resample, channel) ISC values
+    """
+    indexes = resample_indexes(len(binned_A), n_resamples, seed)
+    correlations = np.empty((n_resamples, binned_A.shape[1]))
+    # the correlation holds a few arrays of the resampled bins' size
+    chunk_size = get_chunk_size(8 * binned_A.size * binned_A.itemsize, memory_budget)
+    for first in range(0, n_resamples, chunk_size):
+        chunk = indexes[first:first + chunk_size]
+        correlations[first:first + chunk_size] = pearson(binned_A[chunk], binned_B[chunk])
+    return correlations
+
+
+def percentile_interval(resamples: np.ndarray, confidence: float = BOOTSTRAP_CONFIDENCE) -> (np.ndarray, np.ndarray):
+    """
+    @param resamples: (resample, ...) the statistic of each resample
+    @param confidence: the interval's confidence level
+    @return: the interval's low and high bounds, percentiles of the resamples (NaN resamples are skipped)
+    """
+    if not len(resamples):
+        return np.full(resamples.shape[1:], np.nan), np.full(resamples.shape[1:], np.nan)
+    tail = (1 - confidence) / 2 * 100
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN slices (e.g. invalid areas) are NaN
+        low, high = np.nanpercentile(resamples, [tail, 100 - tail], axis=0)
+    return low, high
@@ -0,0 +1,246 @@
+import numpy as np
+from scipy import fft
+
+BIN_SECONDS = 5  # the ISC is calculated between the signals' means over bins of 5 seconds
+SLIDING_WINDOW_SECONDS = 30  # default window and step of the time resolved ISC
+SLIDING_STEP_SECONDS = 1
+LAG_SECONDS = 10  # default range of the lagged ISC, -10 to 10 seconds
+SLIDING_MOMENTS = 6  # count, sum of A, sum of B, sum of A^2, sum of B^2, sum of A*B
+SLIDING_ISC_MEMORY_BUDGET = 256 * 1024 ** 2
+
+
+def get_timepoints_per_bin(sampling_rate: float) -> int:
+    """
+    @param sampling_rate: sampling rate in seconds (time between samples)
+    @return: number of samples in a bin
+    """
+    return int(BIN_SECONDS / sampling_rate)
+
+
+def get_n_bins(n_times: int, timepoints_per_bin: int) -> int:
+    """
+    @return: number of full bins of a signal of n_times samples - round(n_times / timepoints_per_bin) - 1, the last
+             (possibly partial) bin is always dropped
+    """
+    return max(int(round(n_times / timepoints_per_bin)) - 1, 0)
+
+
+def bin_signals(data: np.ndarray, timepoints_per_bin: int) -> np.ndarray:
+    """
+    Means of the signals over consecutive bins, with one reshape and one mean. NaN values are skipped, a bin of NaN
+    values only is NaN.
+    @param data: (..., time, channel) signals
+    @param timepoints_per_bin: number of samples in a bin
+    @return: (..., bin, channel) binned signals, see 'get_n_bins'
+    """
+    n_times, n_channels = data.shape[-2:]
+    n_bins = get_n_bins(n_times, timepoints_per_bin)
+    bins = data[..., :n_bins * timepoints_per_bin, :].reshape(data.shape[:-2] + (n_bins, timepoints_per_bin,
+                                                                                 n_channels))
+    valid = ~np.isnan(bins)
+    if valid.all():
+        return bins.mean(axis=-2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid, bins, 0).sum(axis=-2) / valid.sum(axis=-2)
+
+
+def pearson(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Pearson's correlation coefficient of every column of a with the same column of b, all at once from the
+    standardized columns. Rows where a or b is NaN are skipped, columns with less than two such rows or with a
+    constant signal are NaN.
+    @param a: (..., row, column) array
+    @param b: array of a's shape
+    @return: (..., column) correlations
+    """
+    valid = ~(np.isnan(a) | np.isnan(b))
+    n = valid.sum(axis=-2, keepdims=True)
+    a, b = np.where(valid, a, 0), np.where(valid, b, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = np.where(valid, a - a.sum(axis=-2, keepdims=True) / n, 0)
+        b = np.where(valid, b - b.sum(axis=-2, keepdims=True) / n, 0)
+        a /= np.sqrt((a * a).sum(axis=-2, keepdims=True))
+        b /= np.sqrt((b * b).sum(axis=-2, keepdims=True))
+        correlations = (a * b).sum(axis=-2)
+    correlations[n[..., 0, :] < 2] = np.nan
+    return np.clip(correlations, -1, 1)
+
+
+def isc(data_A: np.ndarray, data_B: np.ndarray, timepoints_per_bin: int) -> np.ndarray:
+    """
+    ISC of every channel between two subjects' signals, the longer binned signal is cut to the shorter one's length.
+    @param data_A: (..., time, channel) subject A's signals
+    @param data_B: (..., time, channel) subject B's signals, may have a different number of samples
+    @param timepoints_per_bin: number of samples in a bin
+    @return: (..., channel) correlations between the binned signals
+    """
+    binned_A, binned_B = bin_signals(data_A, timepoints_per_bin), bin_signals(data_B, timepoints_per_bin)
+    n_bins = min(binned_A.shape[-2], binned_B.shape[-2])
+    return pearson(binned_A[..., :n_bins, :], binned_B[..., :n_bins, :])
+
+
+def batch_isc(pairs, timepoints_per_bin: int) -> np.ndarray:
+    """
+    ISC of a batch of event pairs of different lengths with one correlation: every pair is binned and cut to its
+    shorter signal (see 'isc'), the binned pairs are padded with NaN bins to a common length.
+    @param pairs: [(A's (time, channel) signals, B's (time, channel) signals)], all with the same channels
+    @return: (pair, channel) correlations
+    """
+    return binned_batch_isc([(bin_signals(data_A, timepoints_per_bin), bin_signals(data_B, timepoints_per_bin))
+                             for data_A, data_B in pairs])
+
+
+def binned_batch_isc(binned) -> np.ndarray:
+    """
+    ISC of a batch of binned event pairs, see 'batch_isc'
+    @param binned: [(A's (bin, channel) binned signals, B's (bin, channel) binned signals)], all with the same channels
+    @return: (pair, channel) correlations
+    """
+    if not binned:
+        return np.empty((0, 0))
+    n_channels = binned[0][0].shape[-1]
+    n_bins = max(min(len(binned_A), len(binned_B)) for binned_A, binned_B in binned)
+    stacked = np.full((2, len(binned), n_bins, n_channels), np.nan)
+    for i, (binned_A, binned_B) in enumerate(binned):
+        length = min(len(binned_A), len(binned_B))
+        stacked[0, i, :length], stacked[1, i, :length] = binned_A[:length], binned_B[:length]
+    return pearson(stacked[0], stacked[1])
+
+
+def sliding_isc(data_A: np.ndarray, data_B: np.ndarray, window: int, step: int = 1,
+                memory_budget: int = SLIDING_ISC_MEMORY_BUDGET) -> np.ndarray:
+    """
+    Time resolved ISC - the correlation of every channel over a rolling window of samples. The windows' moments (count,
+    sums, sums of squares and of products) are differences of running sums, so each window costs the same whatever
+    its length and nothing is recomputed between overlapping windows. Samples where A or B is NaN are skipped.
+    @param data_A: (time, channel) subject A's signals
+    @param data_B: (time, channel) subject B's signals, aligned with A's (the longer one is cut)
+    @param window: number of samples in a window
+    @param step: number of samples between the starts of consecutive windows
+    @param memory_budget: bytes of the running sums, the channels are processed in chunks that fit in it
+    @return: (window, channel) correlations, window i starts at sample i * step
+    """
+    n_times = min(len(data_A), len(data_B))
+    n_channels = data_A.shape[1]
+    starts = np.arange(0, max(n_times - window + 1, 0), step)
+    correlations = np.empty((len(starts), n_channels))
+    chunk_size = max(1, memory_budget // (SLIDING_MOMENTS * 8 * (n_times + 1)))
+
+    for first in range(0, n_channels, chunk_size):
+        columns = slice(first, first + chunk_size)
+        a, b = data_A[:n_times, columns], data_B[:n_times, columns]
+        valid = ~(np.isnan(a) | np.isnan(b))
+        # centered signals, the running sums of squares lose less precision
+        with np.errstate(invalid='ignore', divide='ignore'):
+            n = valid.sum(axis=0)
+            a = np.where(valid, a - np.nan_to_num(np.where(valid, a, 0).sum(axis=0) / n), 0)
+            b = np.where(valid, b - np.nan_to_num(np.where(valid, b, 0).sum(axis=0) / n), 0)
+
+        running = np.zeros((SLIDING_MOMENTS, n_times + 1, a.shape[1]))
+        for moment, values in enumerate((valid, a, b, a * a, b * b, a * b)):
+            np.cumsum(values, axis=0, out=running[moment, 1:])
+        count, sum_a, sum_b, sum_aa, sum_bb, sum_ab = running[:, starts + window] - running[:, starts]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            covariance = sum_ab - sum_a * sum_b / count
+            variance_a = np.maximum(sum_aa - sum_a * sum_a / count, 0)
+            variance_b = np.maximum(sum_bb - sum_b * sum_b / count, 0)
+            window_correlations = covariance / np.sqrt(variance_a * variance_b)
+        window_correlations[count < 2] = np.nan
+        correlations[:, columns] = np.clip(window_correlations, -1, 1)
+    return correlations
+
+
+def pairwise_pearson(data: np.ndarray, chunk_size: int = None) -> np.ndarray:
+    """
+    Correlation of every pair of subjects, for every column, with matrix products. Without NaN values each subject's
+    columns are standardized once and every column's (subject, subject) matrix is one product. Otherwise rows where one
+    of the pair is NaN are skipped (as in 'pearson'), from products of the signals, their squares and their masks.
+    @param data: (subject, row, column) array, e.g. the subjects' binned signals of an event
+    @param chunk_size: number of subjects (rows of the matrices) computed at once, all of them if None
+    @return: (column, subject, subject) correlations
+    """
+    n_subjects = data.shape[0]
+    chunk_size = chunk_size or n_subjects
+    signals = np.moveaxis(data, 2, 0)  # (column, subject, row)
+    valid = ~np.isnan(signals)
+    correlations = np.empty((signals.shape[0], n_subjects, n_subjects))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # centered signals, the products lose less precision
+        n = valid.sum(axis=-1, keepdims=True)
+        signals = np.where(valid, signals - np.where(valid, signals, 0).sum(axis=-1, keepdims=True) / n, 0)
+
+        if valid.all():
+            signals /= np.sqrt((signals * signals).sum(axis=-1, keepdims=True))
+            for first in range(0, n_subjects, chunk_size):
+                rows = slice(first, first + chunk_size)
+                correlations[:, rows] = signals[:, rows] @ signals.swapaxes(1, 2)
+        else:
+            mask, squares = valid.astype(float), signals * signals
+            for first in range(0, n_subjects, chunk_size):
+                rows = slice(first, first + chunk_size)
+                count = mask[:, rows] @ mask.swapaxes(1, 2)
+                sum_a, sum_b = signals[:, rows] @ mask.swapaxes(1, 2), mask[:, rows] @ signals.swapaxes(1, 2)
+                sum_aa, sum_bb = squares[:, rows] @ mask.swapaxes(1, 2), mask[:, rows] @ squares.swapaxes(1, 2)
+                sum_ab = signals[:, rows] @ signals.swapaxes(1, 2)
+                covariance = sum_ab - sum_a * sum_b / count
+                variance = np.maximum(sum_aa - sum_a * sum_a / count, 0) * np.maximum(sum_bb - sum_b * sum_b / count, 0)
+                chunk = covariance / np.sqrt(variance)
+                chunk[count < 2] = np.nan
+                correlations[:, rows] = chunk
+    return np.clip(correlations, -1, 1)
+
+
+def lagged_pearson(data_A: np.ndarray, data_B: np.ndarray, max_lag: int) -> np.ndarray:
+    """
+    Correlation of every channel of A with the same channel of B shifted by each lag in [-max_lag, max_lag], all the
+    lags and channels at once with FFT cross-correlations. At lag k sample t of A is paired with sample t + k of B
+    (k > 0 - B follows A), a lag's correlation uses only the overlapping samples, samples where A or B is NaN are
+    skipped.
+    @param data_A: (time, channel) subject A's signals
+    @param data_B: (time, channel) subject B's signals, aligned with A's (the longer one is cut)
+    @param max_lag: the largest lag, in samples
+    @return: (lag, channel) correlations, row i is lag i - max_lag
+    """
+    n_times = min(len(data_A), len(data_B))
+    max_lag = max(min(max_lag, n_times - 2), 0)
+    if n_times < 2:
+        return np.full((2 * max_lag + 1, data_A.shape[1]), np.nan)
+    a, b = data_A[:n_times], data_B[:n_times]
+    valid_a, valid_b = ~np.isnan(a), ~np.isnan(b)
+    # centered signals, the sums of squares lose less precision
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = np.where(valid_a, a - np.nan_to_num(np.where(valid_a, a, 0).sum(axis=0) / valid_a.sum(axis=0)), 0)
+        b = np.where(valid_b, b - np.nan_to_num(np.where(valid_b, b, 0).sum(axis=0) / valid_b.sum(axis=0)), 0)
+
+    n_fft = fft.next_fast_len(n_times + max_lag)
+    spectra_A = fft.rfft(np.stack([valid_a.astype(float), a, a * a]), n_fft, axis=1).conj()
+    spectra_B = fft.rfft(np.stack([valid_b.astype(float), b, b * b]), n_fft, axis=1)
+    # count, sum of A, sum of B, sum of A^2, sum of B^2, sum of A*B of every lag's overlapping samples
+    products = np.stack([spectra_A[0] * spectra_B[0], spectra_A[1] * spectra_B[0], spectra_A[0] * spectra_B[1],
+                         spectra_A[2] * spectra_B[0], spectra_A[0] * spectra_B[2], spectra_A[1] * spectra_B[1]])
+    sums = fft.irfft(products, n_fft, axis=1)
+    lags = np.arange(-max_lag, max_lag + 1) % n_fft
+    count, sum_a, sum_b, sum_aa, sum_bb, sum_ab = sums[:, lags]
+    count = np.round(count)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = sum_ab - sum_a * sum_b / count
+        variance_a = np.maximum(sum_aa - sum_a * sum_a / count, 0)
+        variance_b = np.maximum(sum_bb - sum_b * sum_b / count, 0)
+        correlations = covariance / np.sqrt(variance_a * variance_b)
+    correlations[count < 2] = np.nan
+    return np.clip(correlations, -1, 1)
+
+
+def peak_lag(correlations: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    @param correlations: (lag, channel) correlations of 'lagged_pearson', row i is lag i - max_lag
+    @return: the lag (in samples) of each channel's highest correlation and the correlation, NaN for channels without
+             correlations
+    """
+    max_lag = (len(correlations) - 1) // 2
+    has_values = ~np.isnan(correlations).all(axis=0)
+    rows = np.argmax(np.where(np.isnan(correlations), -np.inf, correlations), axis=0)
+    peaks = correlations[rows, np.arange(correlations.shape[1])]
+    return np.where(has_values, rows - max_lag, np.nan), np.where(has_values, peaks, np.nan)
@@ -0,0 +1,135 @@
+import numpy as np
+
+from niralysis.utils.isc_kernel import pearson
+from niralysis.utils.parallel import get_n_jobs, run_sessions
+
+PHASE_RANDOMIZATION = "phase"
+CIRCULAR_SHIFT = "shift"
+SURROGATE_METHODS = (PHASE_RANDOMIZATION, CIRCULAR_SHIFT)
+SURROGATES_BATCH_SIZE = 1000
+
+
+def phase_randomized(signals: np.ndarray, n_surrogates: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Surrogates with the signals' power spectrum and random phases. All the channels of a surrogate get the same
+    phases, so the correlations between the channels are kept. NaN values are replaced by the channel's mean.
+    @param signals: (time, channel) signals, e.g. binned signals
+    @param n_surrogates: number of surrogates
+    @param rng: random numbers generator
+    @return: (surrogate, time, channel) surrogates
+    """
+    n_times = signals.shape[0]
+    with np.errstate(invalid='ignore'):
+        means = np.nanmean(signals, axis=0)
+    spectrum = np.fft.rfft(np.nan_to_num(signals - means), axis=0)
+    phases = rng.uniform(0, 2 * np.pi, (n_surrogates, spectrum.shape[0]))
+    phases[:, 0] = 0  # the mean and the Nyquist frequency stay real
+    if n_times % 2 == 0:
+        phases[:, -1] = 0
+    surrogates = np.fft.irfft(spectrum * np.exp(1j * phases)[..., np.newaxis], n=n_times, axis=1)
+    return surrogates + means
+
+
+def circularly_shifted(signals: np.ndarray, n_surrogates: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    @param signals: (time, channel) signals, e.g. binned signals
+    @param n_surrogates: number of surrogates
+    @param rng: random numbers generator
+    @return: (surrogate, time, channel) the signals, each surrogate rotated in time by a random shift (never 0)
+    """
+    n_times = signals.shape[0]
+    shifts = rng.integers(1, max(n_times, 2), n_surrogates)
+    return signals[(np.arange(n_times) + shifts[:, np.newaxis]) % max(n_times, 1)]
+
+
+def get_surrogates(signals: np.ndarray, n_surrogates: int, rng: np.random.Generator,
+                   method: str = PHASE_RANDOMIZATION) -> np.ndarray:
+    if method == PHASE_RANDOMIZATION:
+        return phase_randomized(signals, n_surrogates, rng)
+    if method == CIRCULAR_SHIFT:
+        return circularly_shifted(signals, n_surrogates, rng)
+    raise ValueError(f"unknown surrogates method '{method}', should be one of {SURROGATE_METHODS}")
+
+
+def _null_batch(binned_A: np.ndarray, binned_B: np.ndarray, n_surrogates: int, seed: np.random.SeedSequence,
+                method: str) -> np.ndarray:
+    surrogates = get_surrogates(binned_B, n_surrogates, np.random.default_rng(seed), method)
+    if np.isnan(binned_A).any() or np.isnan(surrogates).any():
+        return pearson(np.broadcast_to(binned_A, surrogates.shape), surrogates)
+    # A is standardized once for all the surrogates
+    standardized_A = binned_A - binned_A.mean(axis=0)
+    standardized_A /= np.sqrt((standardized_A * standardized_A).sum(axis=0))
+    surrogates -= surrogates.mean(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlations = np.einsum('stc,tc->sc', surrogates, standardized_A) / \
+            np.sqrt(np.einsum('stc,stc->sc', surrogates, surrogates))
+    return np.clip(correlations, -1, 1)
+
+
+def null_distribution(binned_A: np.ndarray, binned_B: np.ndarray, n_surrogates: int = 10000,
+                      method: str = PHASE_RANDOMIZATION, seed: int = None,
+                      batch_size: int = SURROGATES_BATCH_SIZE, n_jobs: int = 1) -> np.ndarray:
+    """
+    ISC of A's signals with surrogates of B's signals. The surrogates are created and correlated in batches, every
+    batch is a single (surrogate, bin, channel) correlation. Each batch has its own seed (spawned from the given
+    seed), so the result is the same for any n_jobs.
+    @param binned_A: (bin, channel) A's binned signals
+    @param binned_B: (bin, channel) B's binned signals
+    @param n_surrogates: number of surrogates
+    @param method: 'phase' - phase randomization, 'shift' - circular shifts
+    @param seed: seed of the random numbers, None - a different result every call
+    @param batch_size: number of surrogates correlated at once, bounds the memory
+    @param n_jobs: number of processes the batches are split between (-1 - all the CPUs)
+    @return: (surrogate, channel) ISC values
+    """
+    if method not in SURROGATE_METHODS:
+        raise ValueError(f"unknown surrogates method '{method}', should be one of {SURROGATE_METHODS}")
+    sizes = [min(batch_size, n_surrogates - start) for start in range(0, n_surrogates, batch_size)]
+    batches = [(binned_A, binned_B, size, seed, method)
+               for size, seed in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes)))]
+    if get_n_jobs(n_jobs) <= 1:
+        nulls = [_null_batch(*batch) for batch in batches]
+    else:
+        results = run_sessions(_null_batch, batches, n_jobs)
+        for result in results:
+            if result.failed:
+                raise Exception(result.error)
+        nulls = [result.value for result in results]
+    return np.concatenate(nulls) if nulls else np.empty((0, binned_A.shape[1]))
+
+
+def pseudo_couples_null(binned_A: np.ndarray, binned_B: np.ndarray, n_surrogates: int = 10000,
+                        seed: int = None) -> np.ndarray:
+    """
+    ISC of pseudo couples - A of one couple with B of another couple, drawn at random, all of them in one
+    correlation. Couples of different lengths are NaN padded, a pair uses the bins of its shorter signal.
+    @param binned_A: (couple, bin, channel) the couples' A binned signals
+    @param binned_B: (couple, bin, channel) the couples' B binned signals
+    @param n_surrogates: number of pseudo couples
+    @param seed: seed of the random numbers
+    @return: (surrogate, channel) ISC values
+    """
+    n_couples = binned_A.shape[0]
+    if n_couples < 2:
+        raise ValueError("pseudo couples need at least two couples")
+    rng = np.random.default_rng(seed)
+    couples_A = rng.integers(0, n_couples, n_surrogates)
+    # B is never of A's couple
+    couples_B = (couples_A + rng.integers(1, n_couples, n_surrogates)) % n_couples
+    return pearson(binned_A[couples_A], binned_B[couples_B])
+
+
+def p_values(observed: np.ndarray, null: np.ndarray, two_sided: bool = False) -> np.ndarray:
+    """
+    @param observed: (channel) ISC values
+    @param null: (surrogate, channel) ISC values of the surrogates
+    @param two_sided: if True, compares the absolute values
+    @return: (channel) the fraction of surrogates with an ISC as high as the observed one, (count + 1) / (n + 1), NaN
+             where the observed ISC is NaN
+    """
+    if two_sided:
+        observed, null = np.abs(observed), np.abs(null)
+    with np.errstate(invalid='ignore'):
+        exceeding = (null >= observed).sum(axis=0)
+        values = (exceeding + 1) / ((~np.isnan(null)).sum(axis=0) + 1)
+    return np.where(np.isnan(observed), np.nan, values)
@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pywt
+
+from niralysis.utils.parallel import get_n_jobs
+
+DEFAULT_WAVELET = "db4"
+MAD_TO_SIGMA = 0.6745  # median absolute deviation of a standard normal distribution
+
+
+def wavelet_thresholds(details: np.ndarray, n_times: int) -> np.ndarray:
+    """
+    Universal threshold of each channel, sigma * sqrt(2 * ln(n)), sigma is estimated from the median absolute value of
+    the channel's finest detail coefficients.
+    @param details: (channel, coefficient) finest detail coefficients
+    @param n_times: number of samples of the signals
+    @return: threshold of each channel
+    """
+    sigma = np.median(np.abs(details), axis=-1) / MAD_TO_SIGMA
+    return sigma * np.sqrt(2 * np.log(n_times))
+
+
+def wavelet_motion_correction(data: np.ndarray, wavelet: str = DEFAULT_WAVELET, level: int = 1,
+                              threshold: float | np.ndarray = None, n_jobs: int | None = 1) -> np.ndarray:
+    """
+    Wavelet motion correction of (channel, time) signals in place: the detail coefficients of every channel are soft
+    thresholded by the channel's own threshold, all the channels are decomposed together.
+    @param data: (channel, time) array (optical density), changed in place
+    @param wavelet: wavelet type, see pywt.wavelist()
+    @param level: decomposition level
+    @param threshold: threshold of all the channels or of each channel, the channels' universal thresholds if None
+                      (see 'wavelet_thresholds')
+    @param n_jobs: number of threads, the channels are split between them (-1 - all the CPUs)
+    @return: the corrected data
+    """
+    n_channels, n_times = data.shape
+    thresholds = np.broadcast_to(threshold, n_channels) if threshold is not None else None
+
+    def correct_chunk(chunk: np.ndarray):
+        rows = slice(chunk[0], chunk[-1] + 1)
+        coefficients = pywt.wavedec(data[rows], wavelet, level=level, axis=-1)
+        values = wavelet_thresholds(coefficients[-1], n_times) if thresholds is None else thresholds[rows]
+        coefficients[1:] = [pywt.threshold(details, values[:, np.newaxis], mode='soft') for details in coefficients[1:]]
+        # the reconstruction is one sample longer for signals of odd length
+        data[rows] = pywt.waverec(coefficients, wavelet, axis=-1)[:, :n_times]
+
+    chunks = [chunk for chunk in np.array_split(np.arange(n_channels), get_n_jobs(n_jobs)) if len(chunk)]
+    if len(chunks) <= 1:
+        for chunk in chunks:
+            correct_chunk(chunk)
+    else:
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            list(executor.map(correct_chunk, chunks))
+    return data
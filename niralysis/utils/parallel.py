@@ -0,0 +1,91 @@
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Any
+
+
+class SessionResult:
+    """
+    Outcome of a single session's work.
+
+     Args:
+        session (tuple): the arguments the work was called with
+        value: the work's return value, None if it failed
+        error (str): the failure's traceback, None if it succeeded
+    """
+
+    def __init__(self, session: tuple, value: Any = None, error: str = None):
+        self.session = session
+        self.value = value
+        self.error = error
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+
+def get_n_jobs(n_jobs: int | None) -> int:
+    """
+    @param n_jobs: number of processes, None or 1 - no parallelism, -1 - all the CPUs
+    @return: the actual number of processes
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return max(n_jobs, 1)
+
+
+def _run_session(work: Callable, session: tuple) -> SessionResult:
+    try:
+        return SessionResult(session, value=work(*session))
+    except Exception:
+        return SessionResult(session, error=traceback.format_exc())
+
+
+def run_sessions(work: Callable, sessions: [tuple], n_jobs: int | None = 1) -> [SessionResult]:
+    """
+    Runs independent per-session work, in a bounded pool of processes if n_jobs > 1.
+    A session that raises does not stop the others, its traceback is kept in its result.
+
+    @param work: module level function (it is pickled to the worker processes), called as work(*session)
+    @param sessions: the arguments of each call
+    @param n_jobs: maximal number of processes, None or 1 - runs in the current process, -1 - all the CPUs
+    @return: a result for each session, in the order of 'sessions' (regardless of the order they finished in)
+    """
+    n_jobs = min(get_n_jobs(n_jobs), len(sessions))
+    if n_jobs <= 1:
+        return [_run_session(work, session) for session in sessions]
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [executor.submit(_run_session, work, session) for session in sessions]
+        results = []
+        for session, future in zip(sessions, futures):
+            try:
+                results.append(future.result())
+            except Exception:
+                # the worker itself failed (e.g. it was killed or its result could not be pickled)
+                results.append(SessionResult(session, error=traceback.format_exc()))
+        return results
+
+
+def report_failures(results: [SessionResult]) -> [SessionResult]:
+    """
+    Prints the failed sessions and their errors.
+    @param results: results of 'run_sessions'
+    @return: the failed sessions' results
+    """
+    failures = [result for result in results if result.failed]
+    if failures:
+        print(f"{len(failures)} of {len(results)} sessions failed:")
+        for failure in failures:
+            print(f"{failure.session} failed:\n{failure.error}")
+    return failures
+
+
+def successful_values(results: [SessionResult]) -> [Any]:
+    """
+    @param results: results of 'run_sessions'
+    @return: the values of the sessions that succeeded, by their order
+    """
+    return [result.value for result in results if not result.failed]
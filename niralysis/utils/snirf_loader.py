@@ -0,0 +1,194 @@
+import copy
+import os
+import threading
+from collections import OrderedDict
+
+import mne
+
+DEFAULT_RAW_CACHE_BYTES = 2 * 1024 ** 3  # 2 GB of preloaded recordings
+DEFAULT_RAW_CACHE_ENTRIES = 256
+
+
+class RawCache:
+    """
+    Process-wide cache of SNIRF recordings read by mne.
+
+    Recordings are keyed by their absolute path, modification time and size, so a file that changed on disk is read
+    again. Every caller gets its own Raw instance (info, annotations and channel list can be changed freely) but all
+    of them share the same read-only data buffer. Code that modifies the samples in place must call
+    'ensure_writable' first, which copies the buffer only for that instance (copy-on-write).
+
+    Recordings can also be cached without their data (preload=False), in that case only the file's header is kept in
+    memory and the data is read from disk on demand, see 'read_raw_snirf_window'.
+
+    Cached recordings are evicted in least recently used order once the total size of their data exceeds 'max_bytes'
+    or once there are more than 'max_entries' of them.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_RAW_CACHE_BYTES, max_entries: int = DEFAULT_RAW_CACHE_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._recordings = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: str, preload: bool = True) -> mne.io.BaseRaw:
+        """
+        @param path: path to a SNIRF file
+        @param preload: if False, the recording's data is left on disk
+        @return: a Raw instance sharing its (read-only) data with every other instance of the same file
+        """
+        key = self._key(path) + (preload,)
+        raw = self.lookup(key)
+        if raw is not None:
+            return raw
+
+        raw = mne.io.read_raw_snirf(path, preload=preload, verbose=False)
+        if preload:
+            raw._data.flags.writeable = False
+
+        with self._lock:
+            if key in self._recordings:
+                # another thread read the same file meanwhile, its recording is shared instead
+                raw = self._recordings[key]
+                self._recordings.move_to_end(key)
+            else:
+                self._recordings[key] = raw
+                self._size += _data_size(raw)
+                self._evict()
+            return shared_copy(raw)
+
+    def get_loaded(self, path: str) -> mne.io.BaseRaw | None:
+        """
+        @param path: path to a SNIRF file
+        @return: the preloaded recording if it is already cached, None otherwise. Never reads the file.
+        """
+        return self.lookup(self._key(path) + (True,))
+
+    def lookup(self, key: tuple) -> mne.io.BaseRaw | None:
+        with self._lock:
+            raw = self._recordings.get(key)
+            if raw is None:
+                return None
+            self._recordings.move_to_end(key)
+            return shared_copy(raw)
+
+    def clear(self):
+        with self._lock:
+            self._recordings.clear()
+            self._size = 0
+
+    def set_limit(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    @property
+    def size(self) -> int:
+        """
+        @return: number of bytes held by the cached recordings
+        """
+        return self._size
+
+    def __len__(self):
+        return len(self._recordings)
+
+    def _evict(self):
+        # always keep the most recent recording, even if it is larger than the limit on its own
+        while len(self._recordings) > 1 and (self._size > self.max_bytes or
+                                             len(self._recordings) > self.max_entries):
+            _, raw = self._recordings.popitem(last=False)
+            self._size -= _data_size(raw)
+
+    @staticmethod
+    def _key(path: str) -> tuple:
+        return file_stamp(path)
+
+
+def file_stamp(path: str) -> tuple:
+    """
+    @param path: path to a file
+    @return: (absolute path, modification time, size), changes whenever the file is changed
+    """
+    path = os.path.abspath(str(path))
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def _data_size(raw: mne.io.BaseRaw) -> int:
+    return raw._data.nbytes if raw.preload else 0
+
+
+def shared_copy(raw: mne.io.BaseRaw) -> mne.io.BaseRaw:
+    """
+    Copies a Raw instance without copying its data buffer.
+    @param raw: Raw instance
+    @return: new Raw instance, with its own info and annotations, that shares the data buffer of 'raw'
+    """
+    if not raw.preload:
+        return raw.copy()
+    return copy.deepcopy(raw, {id(raw._data): raw._data})
+
+
+def ensure_writable(raw: mne.io.BaseRaw) -> mne.io.BaseRaw:
+    """
+    Makes sure the data of a (possibly shared) Raw instance can be changed in place, copies the data if it can't.
+    @param raw: preloaded Raw instance
+    @return: the same Raw instance
+    """
+    if raw.preload and not raw._data.flags.writeable:
+        raw._data = raw._data.copy()
+    return raw
+
+
+_raw_cache = RawCache()
+
+
+def read_raw_snirf(path: str, preload: bool = True) -> mne.io.BaseRaw:
+    """
+    Reads a SNIRF file through the process-wide recordings cache, the file is read from disk only once.
+    @param path: path to a SNIRF file
+    @param preload: if False only the file's header is read, the data stays on disk until it is requested
+    @return: Raw instance, if preloaded its data buffer is shared and read-only (see 'ensure_writable')
+    """
+    return _raw_cache.get(path, preload)
+
+
+def read_raw_snirf_window(path: str, start: float, end: float, picks: [str] = None,
+                          padding: float = 0) -> mne.io.BaseRaw:
+    """
+    Reads only a time window of a SNIRF file.
+    The samples of the window are read in chunks from the file's HDF5 'dataTimeSeries' dataset, the rest of the
+    recording is never loaded. If the whole recording is already in the cache, the window is taken from it instead.
+
+    @param path: path to a SNIRF file
+    @param start: window's starting time (seconds)
+    @param end: window's ending time (seconds)
+    @param picks: names of the channels to keep, all channels if None
+    @param padding: seconds to add before and after the window (clipped to the recording's edges), useful to avoid
+            filters' edge effects before cropping to the exact window
+    @return: preloaded Raw instance of the window (its data might be shared and read-only, see 'ensure_writable')
+    """
+    raw = _raw_cache.get_loaded(path)
+    if raw is None:
+        raw = _raw_cache.get(path, preload=False)
+
+    raw.crop(tmin=max(start - padding, 0), tmax=min(end + padding, raw.times[-1]))
+    if picks is not None:
+        raw.pick(picks)
+    return raw.load_data(verbose=False)
+
+
+def clear_raw_cache():
+    _raw_cache.clear()
+
+
+def set_raw_cache_limit(max_bytes: int):
+    """
+    @param max_bytes: maximal number of bytes of recordings' data kept in memory
+    """
+    _raw_cache.set_limit(max_bytes)
+
+
+def get_raw_cache() -> RawCache:
+    return _raw_cache
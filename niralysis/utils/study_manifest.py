@@ -0,0 +1,161 @@
+import json
+import os
+
+MANIFEST_VERSION = 1
+
+SNIRF_A_SUFFIX = "A.snirf"
+SNIRF_B_SUFFIX = "B.snirf"
+SNIRF_B_2_SUFFIX = "B_2.snirf"
+EVENTS_FILE_SUFFIX = "_events_file.snirf"
+PSYCHOPY_SUFFIX = ".csv"
+INSTRUCTIONS_SUFFIX = ".xlsx"
+STUDY_FILES_SUFFIXES = (".snirf", PSYCHOPY_SUFFIX, INSTRUCTIONS_SUFFIX)
+
+
+class Session:
+    """
+    The study files of a single run folder.
+
+     Args:
+        root (str): the folder's path
+        files (dict): file name -> (size in bytes, modification time in nanoseconds), of the folder's study files
+    """
+
+    def __init__(self, root: str, files: dict):
+        self.root = root
+        self.files = files
+
+    @property
+    def date(self) -> str:
+        """
+        @return: the session's name, the name of its folder (e.g. '31012024_0900')
+        """
+        return os.path.basename(os.path.normpath(self.root))
+
+    @property
+    def snirf_files_A(self) -> [str]:
+        return self._files_ending_with(SNIRF_A_SUFFIX)
+
+    @property
+    def snirf_files_B(self) -> [str]:
+        return self._files_ending_with(SNIRF_B_SUFFIX)
+
+    @property
+    def snirf_files_B_2(self) -> [str]:
+        return self._files_ending_with(SNIRF_B_2_SUFFIX)
+
+    @property
+    def events_files(self) -> [str]:
+        return self._files_ending_with(EVENTS_FILE_SUFFIX)
+
+    @property
+    def psychopy_files(self) -> [str]:
+        return self._files_ending_with(PSYCHOPY_SUFFIX)
+
+    @property
+    def instructions_files(self) -> [str]:
+        return self._files_ending_with(INSTRUCTIONS_SUFFIX)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _files_ending_with(self, suffix: str) -> [str]:
+        return [name for name in self.files if name.endswith(suffix)]
+
+
+class StudyManifest:
+    """
+    Index of a study's folder tree: the SNIRF (A, B, B_2, events file), psychopy (.csv) and preprocessing instructions
+    (.xlsx) files of every run folder, with their sizes and modification times.
+
+    The tree is scanned once. Later updates list again only the folders whose modification time changed (a file was
+    added, removed or renamed in them), the other folders cost a single 'stat'. If a manifest path is given, the
+    manifest is saved to it as JSON and loaded from it on the next run, so a study on a network drive is not walked
+    again on every analysis.
+
+     Args:
+        folder_path (str): the study's root folder
+        manifest_path (str): JSON file to persist the manifest in, optional
+
+     Methods:
+        update - rescans the changed folders, returns their paths
+        sessions - the run folders that have study files, in a stable (sorted, top-down) order
+    """
+
+    def __init__(self, folder_path: str, manifest_path: str = None):
+        self.folder_path = os.path.abspath(str(folder_path))
+        self.manifest_path = manifest_path
+        self._directories = self._load() if manifest_path is not None else {}
+        self.update()
+
+    @property
+    def sessions(self) -> [Session]:
+        return [Session(os.path.normpath(os.path.join(self.folder_path, relative)), entry["files"])
+                for relative, entry in self._directories.items() if entry["files"]]
+
+    def update(self, full: bool = False) -> [str]:
+        """
+        Rescans the folders that changed since the last scan.
+        A file that was changed in place (without adding or removing files in its folder) is detected only by a full
+        scan.
+        @param full: rescan all the folders
+        @return: paths of the rescanned folders
+        """
+        directories = {}
+        rescanned = []
+        stack = [""]
+        while stack:
+            relative = stack.pop()
+            absolute = os.path.join(self.folder_path, relative)
+            try:
+                modification_time = os.stat(absolute).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            entry = self._directories.get(relative)
+            if full or entry is None or entry["mtime_ns"] != modification_time:
+                entry = _scan_directory(absolute, modification_time)
+                rescanned.append(absolute)
+            directories[relative] = entry
+            stack.extend(os.path.join(relative, name) for name in reversed(entry["subdirs"]))
+
+        changed = bool(rescanned) or directories.keys() != self._directories.keys()
+        self._directories = directories
+        if changed and self.manifest_path is not None:
+            self.save()
+        return rescanned
+
+    def save(self):
+        content = {"version": MANIFEST_VERSION, "folder_path": self.folder_path, "directories": self._directories}
+        temporary_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(content, file)
+        os.replace(temporary_path, self.manifest_path)
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as file:
+            content = json.load(file)
+        if content.get("version") != MANIFEST_VERSION or content.get("folder_path") != self.folder_path:
+            return {}
+        return content["directories"]
+
+
+def _scan_directory(path: str, modification_time: int) -> dict:
+    subdirs, files = [], {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append(entry.name)
+            elif entry.name.endswith(STUDY_FILES_SUFFIXES):
+                stat = entry.stat()
+                files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return {"mtime_ns": modification_time, "subdirs": sorted(subdirs), "files": dict(sorted(files.items()))}
+
+
+def get_study_manifest(study) -> StudyManifest:
+    """
+    @param study: a StudyManifest (used as is), or the path of a study's root folder (scanned now)
+    @return: the study's manifest
+    """
+    return study if isinstance(study, StudyManifest) else StudyManifest(study)
@@ -0,0 +1,49 @@
+import mne
+import numpy as np
+import pytest
+
+from niralysis.HbOData.BatchPreprocessor import BatchPreprocessor
+from niralysis.HbOData.HbOData import HbOData
+
+SFREQ = 10.0
+
+
+def create_raw(n_times: int, seed: int) -> mne.io.RawArray:
+    """Intensity signals of 3 sources and 2 detectors, with a heart beat"""
+    rng = np.random.default_rng(seed)
+    pairs = [(source, detector) for source in range(1, 4) for detector in range(1, 3)]
+    names = [f"S{source}_D{detector} {wavelength}" for source, detector in pairs for wavelength in (760, 850)]
+    info = mne.create_info(names, SFREQ, 'fnirs_cw_amplitude')
+    for channel, name in zip(info['chs'], names):
+        source, detector = int(name[1]), int(name[4])
+        source_location, detector_location = np.array([source, 0, 0]) / 100, np.array([source, 3, 0]) / 100
+        channel['loc'][:3] = (source_location + detector_location) / 2
+        channel['loc'][3:6], channel['loc'][6:9] = source_location, detector_location
+        channel['loc'][9] = int(name[-3:])
+    times = np.arange(n_times) / SFREQ
+    data = 1 + 0.02 * np.sin(2 * np.pi * 0.05 * times) + 0.01 * np.sin(2 * np.pi * 1.1 * times) + \
+        0.003 * rng.standard_normal((len(names), n_times))
+    return mne.io.RawArray(data, info, verbose=False)
+
+
+@pytest.mark.parametrize('filter_method, motion_correction', [('fir', False), ('iir', False), ('fir', True)])
+def test_batch_matches_single_recordings(filter_method, motion_correction):
+    """Testing the stacked preprocessing of recordings of different lengths gives the same results as preprocessing
+    each of them alone"""
+    raws = [create_raw(n_times, seed) for seed, n_times in enumerate([3000, 2500, 3000])]
+    raws[1]._data[0, 10] = -1  # negative intensities are clipped
+
+    singles = [HbOData('', raw.copy()) for raw in raws]
+    for hbo_data in singles:
+        hbo_data.preprocess(None, with_storm=False, bad_channels=['S2_D1'], filter_method=filter_method,
+                            motion_correction=motion_correction)
+    batch = [HbOData('', raw.copy()) for raw in raws]
+    preprocessor = BatchPreprocessor(batch, filter_method=filter_method, motion_correction=motion_correction)
+    assert preprocessor.run(bad_channels=['S2_D1']) == batch
+
+    for single, batched in zip(singles, batch):
+        assert list(batched.hbo_array.channels) == list(single.hbo_array.channels)
+        assert batched.bad_channels == single.bad_channels
+        assert np.allclose(batched.hbo_array.times, single.hbo_array.times)
+        expected = single.hbo_array.data
+        assert np.allclose(batched.hbo_array.data, expected, rtol=0, atol=1e-10 * np.abs(expected).max())
@@ -0,0 +1,63 @@
+import mne
+import numpy as np
+
+from niralysis.HbOData import HbOData as HbOData_module
+from niralysis.HbOData.ChannelQuality import ChannelQuality
+from niralysis.HbOData.HbOData import HbOData
+
+SFREQ = 10.0
+
+
+def create_intensity():
+    """Two good pairs (a shared heart beat), a pair without a heart beat, a flat channel and a saturated channel"""
+    rng = np.random.default_rng(0)
+    times = np.arange(3000) / SFREQ
+    heart_beat = np.sin(2 * np.pi * 1.1 * times)
+    names = ['S1_D1 760', 'S1_D1 850', 'S2_D1 760', 'S2_D1 850', 'S3_D1 760', 'S3_D1 850', 'S4_D1 760', 'S4_D1 850']
+    data = 1 + 0.01 * heart_beat + 0.001 * rng.standard_normal((len(names), len(times)))
+    data[4:6] = 1 + 0.01 * rng.standard_normal((2, len(times)))
+    data[6, 100:] = 1
+    data[7] = np.minimum(data[7], 1.005)
+    return data, names
+
+
+def test_quality_report():
+    """Testing each metric flags the right channels"""
+    data, names = create_intensity()
+    quality = ChannelQuality.from_data(data, names, SFREQ)
+    report = quality.report
+    assert list(report.index) == names
+    assert (report.loc[names[:4], 'sci'] > 0.9).all()
+    # the SCI is of the source-detector pair, the flat channel's pair fails too
+    assert quality.bad_channels_sci() == names[4:]
+    assert report['flat'].tolist() == [False] * 6 + [True, False]
+    assert report['saturated'].tolist() == [False] * 7 + [True]
+    assert np.allclose(report['cv'], 100 * data.std(axis=1) / data.mean(axis=1))
+    assert quality.bad_fraction() == 0.5
+
+
+def test_data_is_not_changed():
+    data, names = create_intensity()
+    original = data.copy()
+    ChannelQuality.from_data(data, names, SFREQ)
+    assert np.array_equal(data, original)
+
+
+def test_quality_covers_the_merged_file(tmp_path, monkeypatch):
+    """Testing that the channels of the file to merge are merged before the quality of a lazy recording is evaluated"""
+    data, names = create_intensity()
+    merged_names = [name.replace('_D1', '_D2') for name in names]
+    info = mne.create_info(names, SFREQ, 'fnirs_cw_amplitude')
+    # a lazy recording, its data is left on the disk
+    mne.io.RawArray(data, info, verbose=False).save(tmp_path / 'A_raw.fif', verbose=False)
+    hbo_data = HbOData("", raw_data=mne.io.read_raw_fif(tmp_path / 'A_raw.fif', preload=False, verbose=False))
+    merged_path = tmp_path / 'B_2.snirf'
+    merged_path.write_bytes(b'')
+    hbo_data.file_to_merge = str(merged_path)
+    # the merged file is a copy of the recording with other detectors
+    monkeypatch.setattr(HbOData_module, 'read_raw_snirf_window', lambda path, start, end: mne.io.read_raw_fif(
+        tmp_path / 'A_raw.fif', preload=True, verbose=False).rename_channels(dict(zip(names, merged_names))))
+
+    report = hbo_data.get_channel_quality().report
+    assert list(report.index) == names + merged_names
+    assert report.loc[merged_names, 'sci'].equals(report.loc[names, 'sci'].set_axis(merged_names))
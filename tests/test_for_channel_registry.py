@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from niralysis.HbOData.ChannelRegistry import ChannelRegistry, get_channel_registry
+from niralysis.HbOData.HbOData import HbOData
+
+NAMES = ['Time', 'S1_D1 hbo', 'S1_D1 hbr', 'S12_D9 hbo', 'S12_D9 hbr', 'S3_D2 hbo']
+
+
+def test_parsed_table():
+    registry = ChannelRegistry(NAMES)
+    assert registry.source.tolist() == [-1, 1, 1, 12, 12, 3]
+    assert registry.detector.tolist() == [-1, 1, 1, 9, 9, 2]
+    assert registry.device.tolist() == [-1, 0, 0, 1, 1, 0]
+    assert registry.is_hbo.tolist() == [False, True, False, True, False, True]
+    assert get_channel_registry(NAMES) is get_channel_registry(tuple(NAMES))
+
+
+def test_masks_and_rows():
+    registry = ChannelRegistry(NAMES)
+    assert registry.pair_mask(['S12_D9', 'S3_D2 760']).tolist() == [False, False, False, True, True, True]
+    assert registry.optodes_mask(['s3'], ['d9']).tolist() == [False, False, False, True, True, True]
+    assert registry.rows(['S3_D2', 'S7_D7', 'S1_D1']).tolist() == [5, 1]
+    areas = {'a': ['S1_D1', 'S3_D2'], 'b': ['S7_D7']}
+    assert registry.area_mask(areas).tolist() == [[False, False], [True, False], [False, False], [False, False],
+                                                  [False, False], [True, False]]
+
+
+def test_flipped_names():
+    assert ChannelRegistry(NAMES).flipped_names() == ['Time', 'S11_D9 hbo', 'S11_D9 hbr', 'S2_D1 hbo', 'S2_D1 hbr',
+                                                      'S13_D10 hbo']
+
+
+def test_storm_invalid_channels():
+    hbo_data = HbOData('')
+    hbo_data.invalid_sourc = pd.DataFrame(index=['s3'])
+    hbo_data.invalid_detec = pd.DataFrame(index=['d9'])
+    registry = ChannelRegistry(NAMES)
+    assert hbo_data.get_storm_invalid_mask(registry, True).tolist() == [False, False, False, True, True, True]
+    assert not hbo_data.get_storm_invalid_mask(registry, False).any()
+    assert hbo_data.is_storm_invalid_channel('S12_D9 hbo', True)
+    assert not np.any([hbo_data.is_storm_invalid_channel(name, True) for name in NAMES[1:3]])
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from niralysis.SharedReality.consts import AREA_VALIDATION, VALID_CHANNELS
+from niralysis.utils.consts import TIME_COLUMN
+from niralysis.utils.data_manipulation import calculate_mean_table_interval, get_area_projection, get_area_validation, \
+    project_to_areas, set_data_by_areas
+
+AREAS = {'left': ['S1_D1', 'S1_D2', 'S9_D9'], 'right': ['S2_D1'], 'empty': ['S7_D7']}
+
+
+def create_table():
+    values = np.random.default_rng(0).standard_normal((50, 3))
+    values[10, 0] = np.nan
+    table = pd.DataFrame(values, columns=['S1_D1 hbo', 'S1_D2 hbo', 'S2_D1 hbo'])
+    table.insert(0, TIME_COLUMN, np.arange(50) / 10)
+    return table
+
+
+def test_areas_are_nan_aware_means():
+    table = create_table()
+    data_by_area = set_data_by_areas(table, AREAS)
+    assert data_by_area.index.equals(table.index)
+    assert list(data_by_area.columns) == [TIME_COLUMN, 'left', 'right', 'empty']
+    assert np.allclose(data_by_area['left'], table[['S1_D1 hbo', 'S1_D2 hbo']].mean(axis=1))
+    assert np.allclose(data_by_area['right'], table['S2_D1 hbo'])
+    assert data_by_area['empty'].isna().all()
+
+
+def test_area_validation_is_apart_from_the_data():
+    validation = get_area_validation(create_table().columns, AREAS)
+    assert list(validation.index) == [AREA_VALIDATION, VALID_CHANNELS]
+    assert validation.to_dict(orient='list') == {TIME_COLUMN: [1, 1], 'left': [1, 2], 'right': [1, 1], 'empty': [0, 0]}
+
+
+def test_projection_of_a_stack():
+    """Testing a stack of events is projected at once, and the projection is created once"""
+    table = create_table()
+    membership, counts = get_area_projection(table.columns, AREAS)
+    assert get_area_projection(table.columns, AREAS)[0] is membership
+    assert counts.tolist() == [2, 1, 0]
+    events = np.stack([table.to_numpy()[:20], table.to_numpy()[20:40]])
+    projected = project_to_areas(events, membership, counts)
+    assert projected.shape == (2, 20, 3)
+    assert np.allclose(projected[1], project_to_areas(table.to_numpy()[20:40], membership), equal_nan=True)
+
+
+def test_mean_table_interval():
+    rng = np.random.default_rng(3)
+    tables = [pd.DataFrame(rng.normal(0.3, 0.1, (4, 2)), index=list('abcd'), columns=['left', 'right'])
+              for _ in range(30)]
+    tables[0].loc['a', 'left'] = np.nan
+    low, high = calculate_mean_table_interval(tables, n_resamples=2000, seed=0, memory_budget=10 * 1024)
+    mean = pd.concat(tables).groupby(level=0).mean()
+    assert low.index.equals(mean.index) and list(low.columns) == ['left', 'right']
+    assert (low < mean).all().all() and (mean < high).all().all()
+    standard_error = pd.concat(tables).groupby(level=0).std(ddof=0) / np.sqrt(30)
+    assert np.allclose(high - low, 2 * 1.96 * standard_error, rtol=0.15)
+    low_again, _ = calculate_mean_table_interval(tables, n_resamples=2000, seed=0)
+    pd.testing.assert_frame_equal(low, low_again)
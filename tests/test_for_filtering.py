@@ -0,0 +1,86 @@
+import mne
+import numpy as np
+import pytest
+
+from niralysis.HbOData.StreamingPreprocessor import StreamingPreprocessor, _RunningMoments
+from niralysis.utils.filtering import design_fir_filter, StreamingFIRFilter, filter_raw, get_filter_design, FIR, IIR
+
+
+@pytest.mark.parametrize('block_size', [1, 500, 3000, 20000])
+def test_streaming_filter_matches_mne(block_size):
+    """Testing that filtering block by block gives the same result as mne's filtering of the whole signal"""
+    signal = np.random.default_rng(0).normal(size=(3, 20000)).cumsum(axis=1)
+    expected = mne.filter.filter_data(signal, 10.0, 0.01, 0.5, verbose=False)
+
+    stream = StreamingFIRFilter(design_fir_filter(10.0, 0.01, 0.5), signal.shape[1], signal.shape[0])
+    filtered = np.concatenate([stream.process(signal[:, start:start + block_size])
+                               for start in range(0, signal.shape[1], block_size)], axis=1)
+    assert np.allclose(filtered, expected, rtol=0, atol=1e-10 * np.abs(expected).max())
+
+
+@pytest.mark.parametrize('block_size', [1, 400, 1500])
+def test_streaming_filter_of_a_signal_shorter_than_the_filter(block_size):
+    """Testing a signal shorter than half of the filter (3301 coefficients), mne only warns about it"""
+    signal = np.random.default_rng(4).normal(size=(3, 1500)).cumsum(axis=1)
+    with pytest.warns(RuntimeWarning):
+        expected = mne.filter.filter_data(signal, 10.0, 0.01, 0.5, verbose=False)
+
+    with pytest.warns(RuntimeWarning):
+        stream = StreamingFIRFilter(design_fir_filter(10.0, 0.01, 0.5), signal.shape[1], signal.shape[0])
+    filtered = np.concatenate([stream.process(signal[:, start:start + block_size])
+                               for start in range(0, signal.shape[1], block_size)], axis=1)
+    assert np.allclose(filtered, expected, rtol=0, atol=1e-10 * np.abs(expected).max())
+
+
+def test_running_moments():
+    """Testing the block by block means, standard deviations and correlations"""
+    data = np.random.default_rng(1).normal(size=(4, 1001)) + np.arange(4)[:, np.newaxis]
+    moments = _RunningMoments(4, np.array([0, 1]), np.array([2, 3]))
+    for start in range(0, data.shape[1], 97):
+        moments.update(data[:, start:start + 97])
+    assert np.allclose(moments.mean, data.mean(axis=1))
+    assert np.allclose(moments.std, data.std(axis=1))
+    assert np.allclose(moments.correlation, [np.corrcoef(data[0], data[2])[0, 1], np.corrcoef(data[1], data[3])[0, 1]])
+
+
+def test_optical_density_statistics_read_the_recording_once():
+    """Testing the means, minimums and clipping of the optical density, and that positive intensities are read once"""
+    data = 2 + np.random.default_rng(3).random((4, 1000))
+    raw = mne.io.RawArray(data, mne.create_info(4, 10.0, 'fnirs_cw_amplitude'), verbose=False)
+    preprocessor = StreamingPreprocessor([raw], block_size=300)
+    passes = []
+    iter_intensity = preprocessor._iter_intensity
+    preprocessor._iter_intensity = lambda: passes.append(1) or iter_intensity()
+
+    means, stds, minimums = preprocessor._intensity_statistics()
+    assert np.allclose(means, data.mean(axis=1)) and np.allclose(minimums, data.min(axis=1))
+    assert preprocessor._optical_density_means(means, minimums) == (means, None)
+    assert len(passes) == 1
+
+    raw._data[1, 10], raw._data[2, 20] = -0.5, 0
+    means, stds, minimums = preprocessor._intensity_statistics()
+    od_means, clip = preprocessor._optical_density_means(means, minimums)
+    assert clip == 0.5
+    assert np.allclose(od_means, np.maximum(np.abs(raw._data), 0.5).mean(axis=1))
+
+
+def create_raw():
+    data = np.random.default_rng(2).normal(size=(4, 5000)).cumsum(axis=1)
+    return mne.io.RawArray(data, mne.create_info(4, 10.0, 'fnirs_od'), verbose=False)
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_fir_filter_matches_mne(n_jobs):
+    """Testing the FIR filter with a cached design gives the same result as mne's default filter"""
+    raw = create_raw()
+    expected = raw.copy().filter(0.01, 0.5, verbose=False).get_data()
+    filtered = filter_raw(raw, 0.01, 0.5, FIR, n_jobs).get_data()
+    assert np.allclose(filtered, expected, rtol=0, atol=1e-10 * np.abs(expected).max())
+
+
+def test_iir_filter_design_is_cached():
+    raw = create_raw()
+    assert get_filter_design(10.0, 0.01, 0.5, IIR) is get_filter_design(10.0, 0.01, 0.5, IIR)
+    expected = raw.copy().filter(0.01, 0.5, method='iir', iir_params=dict(order=4, ftype='butter', output='sos'),
+                                 verbose=False).get_data()
+    assert np.allclose(filter_raw(raw, 0.01, 0.5, IIR).get_data(), expected)
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+from niralysis.ISC.GroupISC import GroupISC
+from niralysis.ISC.ISC import ISC
+from niralysis.SharedReality.Event.Event import Event
+from niralysis.SharedReality.Subject.Subject import Subject
+from niralysis.SharedReality.consts import EVENTS_TABLE_NAMES, EVENTS_CATEGORY, FIRST_WATCH, DISCUSSIONS, \
+    SECOND_WATCH
+from niralysis.utils.consts import A_EVENT_COLUMN, AREA_COLUMN, B_EVENT_COLUMN, ISC_ROW, TIME_COLUMN
+from niralysis.utils.data_manipulation import get_area_validation
+
+AREAS = {'left': ['S1_D1'], 'right': ['S2_D1'], 'front': ['S3_D1']}
+
+
+def create_subject(seed: int, lengths: [int]) -> Subject:
+    rng = np.random.default_rng(seed)
+    shared = np.random.default_rng(100).standard_normal((max(lengths), len(AREAS))).cumsum(axis=0)
+    events_data = {FIRST_WATCH: {}, DISCUSSIONS: {}, SECOND_WATCH: {}}
+    for index, (event, length) in enumerate(zip(EVENTS_TABLE_NAMES, lengths)):
+        table = pd.DataFrame(shared[:length] + 3 * rng.standard_normal((length, len(AREAS))), columns=list(AREAS))
+        table.insert(0, TIME_COLUMN, 100 * index + np.arange(length) * 0.1)
+        events_data[EVENTS_CATEGORY[index]][event] = Event(event, data_by_area=table)
+        events_data[EVENTS_CATEGORY[index]][event].data.area_validation = get_area_validation(
+            ['S1_D1 hbo', 'S2_D1 hbo', 'S3_D1 hbo'], AREAS)
+    subject = Subject("")
+    subject.events_data = events_data
+    subject.events_table = pd.DataFrame({'Event': EVENTS_TABLE_NAMES})
+    return subject
+
+
+def test_leave_one_out_matches_the_copied_means():
+    """Testing the ISC of every subject with its leave-one-out mean against the mean of a copy of the other subjects'
+    events (events of equal lengths)"""
+    lengths = [600 + 40 * index for index in range(len(EVENTS_TABLE_NAMES))]
+    subjects = [create_subject(seed, lengths) for seed in range(4)]
+
+    ISC_tables = GroupISC(subjects).isc_tables(sampling_rate=0.1)
+    for i, (subject, ISC_table) in enumerate(zip(subjects, ISC_tables)):
+        expected = []
+        for index, event in enumerate(EVENTS_TABLE_NAMES):
+            others = [other.get_event_data_table(index, event).copy() for j, other in enumerate(subjects) if j != i]
+            mean_table = sum(others[1:], others[0]) / len(others)
+            expected.append(ISC.ISC(subject.get_event_data_table(index, event), mean_table, 0.1))
+        assert list(ISC_table.index) == EVENTS_TABLE_NAMES
+        assert np.allclose(ISC_table.to_numpy(dtype=float), expected)
+
+
+def test_missing_values_are_not_part_of_the_mean():
+    lengths = [500] * len(EVENTS_TABLE_NAMES)
+    subjects = [create_subject(seed, lengths) for seed in range(3)]
+    subjects[1].get_event_data_table(0, EVENTS_TABLE_NAMES[0])['left'] = np.nan
+    group_isc = GroupISC(subjects)
+
+    mean = group_isc.leave_one_out_mean(0)
+    tables = [subject.get_event_data_table(0, EVENTS_TABLE_NAMES[0]) for subject in subjects]
+    assert np.allclose(mean[0, :, 0], tables[2]['left'])
+    assert np.allclose(mean[0, :, 1], (tables[1]['right'] + tables[2]['right']) / 2)
+    mean_table = group_isc.leave_one_out_subject(0).get_event_data_table(0, EVENTS_TABLE_NAMES[0])
+    assert np.allclose(mean_table['right'], mean[0, :, 1]) and mean_table[TIME_COLUMN].iloc[0] == 0
+
+
+def test_all_pairs_matrix():
+    """Testing every pair's ISC (with events of different lengths) against the ISC of the pair's events"""
+    subjects = [create_subject(seed, [400 + 30 * seed] * len(EVENTS_TABLE_NAMES)) for seed in range(5)]
+    subjects[3].get_event_data_table(1, EVENTS_TABLE_NAMES[1]).loc[50:120, 'right'] = np.nan
+    matrices = ISC.subjects_ISC_matrix(subjects, sampling_rate=0.1, chunk_size=2)
+    assert len(matrices) == len(EVENTS_TABLE_NAMES) and list(matrices[0]) == list(AREAS)
+
+    for index in (0, 1):
+        tables = [subject.get_event_data_table(index, EVENTS_TABLE_NAMES[index]) for subject in subjects]
+        for i in range(len(subjects)):
+            for j in range(len(subjects)):
+                expected = ISC.ISC(tables[i], tables[j], 0.1)
+                assert np.allclose([matrices[index][area].iloc[i, j] for area in AREAS], expected)
+
+
+def test_opposed_events_tensor():
+    """Testing every pair of different events of A and B against the ISC of the pair's events"""
+    subject_A = create_subject(0, [300 + 50 * index for index in range(len(EVENTS_TABLE_NAMES))])
+    subject_B = create_subject(1, [420 - 20 * index for index in range(len(EVENTS_TABLE_NAMES))])
+    events_A, events_B = subject_A.events_data[FIRST_WATCH], subject_B.events_data[FIRST_WATCH]
+
+    ISC_table = ISC.subjects_ISC_by_oposed_events(events_A, events_B, sampling_rate=0.1)
+    assert list(ISC_table.columns) == [A_EVENT_COLUMN, B_EVENT_COLUMN, AREA_COLUMN, ISC_ROW]
+    assert len(ISC_table) == len(events_A) * (len(events_B) - 1) * len(AREAS)
+    assert (ISC_table[A_EVENT_COLUMN] != ISC_table[B_EVENT_COLUMN]).all()
+    for (A_name, B_name), pair in ISC_table.groupby([A_EVENT_COLUMN, B_EVENT_COLUMN]):
+        expected = ISC.ISC(events_A[A_name].get_default_data(), events_B[B_name].get_default_data(), 0.1)
+        assert list(pair[AREA_COLUMN]) == list(AREAS)
+        assert np.allclose(pair[ISC_ROW], expected)
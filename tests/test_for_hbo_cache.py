@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from niralysis.SharedReality.Subject.PreprocessingInstructions import PreprocessingInstructions
+from niralysis.SharedReality.consts import AREA_VALIDATION, VALID_CHANNELS
+from niralysis.utils.hbo_cache import HbOCache
+from niralysis.utils.parallel import run_sessions
+
+
+def test_tables_round_trip(tmp_path):
+    """Testing that the cached tables are the same as the stored ones"""
+    cache = HbOCache(str(tmp_path))
+    channels = pd.DataFrame({'Time': [0.0, 0.1, 0.2], 'S1_D1 hbo': [1.0, 2.0, np.nan]})
+    areas = pd.DataFrame({'Time': [0.0, 0.1, 0.2], 'left TPJ': [1.0, 2.0, np.nan]})
+    validation = pd.DataFrame({'Time': [1, 1], 'left TPJ': [1, 2]}, index=[AREA_VALIDATION, VALID_CHANNELS])
+
+    assert cache.load('key') is None
+    cache.store('key', channels, areas, validation)
+    cached_channels, cached_areas, cached_validation = cache.load('key')
+    pd.testing.assert_frame_equal(cached_channels, channels)
+    pd.testing.assert_frame_equal(cached_areas, areas)
+    pd.testing.assert_frame_equal(cached_validation, validation)
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_key_depends_on_content_and_instructions(tmp_path):
+    """Testing that changing the file's content or the instructions changes the key"""
+    cache = HbOCache(str(tmp_path))
+    path = tmp_path / 'rec_A.snirf'
+    path.write_bytes(b'first')
+    key = cache.key(str(path), preprocessing_instructions=PreprocessingInstructions())
+    assert key == cache.key(str(path), preprocessing_instructions=PreprocessingInstructions())
+    assert key != cache.key(str(path), preprocessing_instructions=PreprocessingInstructions(low_freq=0.02))
+    path.write_bytes(b'second')
+    assert key != cache.key(str(path), preprocessing_instructions=PreprocessingInstructions())
+
+
+def load_entry(directory: str) -> bool:
+    return HbOCache(directory).load('key') is not None
+
+
+def test_load_never_writes_to_the_folder(tmp_path):
+    """Testing that a lookup does not write the stats and ignores a broken stats file"""
+    cache = HbOCache(str(tmp_path))
+    cache.store('key', pd.DataFrame({'Time': [0.0], 'S1_D1 hbo': [1.0]}))
+    (tmp_path / 'stats.log').write_text('{"hits": 5, "misses": 0}\n{"hits": ')
+    files = sorted(os.listdir(tmp_path))
+    assert cache.load('key') is not None and cache.load('other key') is None
+    assert sorted(os.listdir(tmp_path)) == files
+    assert cache.stats()['hits'] == 6 and cache.stats()['misses'] == 1
+    assert HbOCache(str(tmp_path / 'missing')).load('key') is None
+    assert not (tmp_path / 'missing').exists()
+
+
+def test_worker_processes_stats_are_added(tmp_path):
+    """Testing that the counters of the pool's worker processes are flushed when they exit"""
+    cache = HbOCache(str(tmp_path))
+    cache.store('key', pd.DataFrame({'Time': [0.0], 'S1_D1 hbo': [1.0]}))
+    for _ in range(2):
+        results = run_sessions(load_entry, [(str(tmp_path),)] * 4, n_jobs=2)
+        assert all(result.value for result in results)
+    assert cache.stats()['hits'] == 8
+    # every process appends to the same stats file
+    assert sorted(os.listdir(tmp_path)) == ['key.npz', 'stats.log']
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+from niralysis.ISC.ISC import ISC
+from niralysis.ISC.ISCEngine import ISCEngine
+from niralysis.utils.consts import END_COLUMN, EVENT_COLUMN, PEAK_ISC_ROW, PEAK_LAG_ROW, START_COLUMN, TIME_COLUMN
+from niralysis.utils.isc_kernel import batch_isc, bin_signals, isc, pearson
+
+
+def create_table(n_times: int, seed: int) -> pd.DataFrame:
+    values = np.random.default_rng(seed).standard_normal((n_times, 4)).cumsum(axis=0)
+    table = pd.DataFrame(values, columns=['S1_D1 hbo', 'S1_D2 hbo', 'S2_D1 hbo', 'S2_D2 hbo'])
+    table.insert(0, TIME_COLUMN, np.arange(n_times) / 10)
+    return table
+
+
+def test_isc_matches_binned_corrcoef():
+    """Testing the ISC against binning each channel in a loop and numpy's corrcoef"""
+    table_A, table_B = create_table(1230, 0), create_table(1100, 1)
+    values_A, values_B = table_A.to_numpy()[:, 1:], table_B.to_numpy()[:, 1:]
+    n_bins = round(len(table_B) / 50) - 1
+    binned_A = np.array([values_A[i * 50:(i + 1) * 50].mean(axis=0) for i in range(n_bins)])
+    binned_B = np.array([values_B[i * 50:(i + 1) * 50].mean(axis=0) for i in range(n_bins)])
+    expected = [np.corrcoef(binned_A[:, channel], binned_B[:, channel])[0, 1] for channel in range(4)]
+    assert np.allclose(ISC.ISC(table_A, table_B, 0.1), expected)
+    assert np.allclose(bin_signals(values_B, 50), binned_B)
+
+
+def test_nan_values_are_skipped():
+    signals = np.random.default_rng(2).standard_normal((2, 40, 3))
+    a, b = signals[0].copy(), signals[1]
+    a[5:10, 0] = np.nan
+    a[:, 1] = np.nan
+    correlations = pearson(a, b)
+    kept = np.r_[0:5, 10:40]
+    assert np.isclose(correlations[0], np.corrcoef(a[kept, 0], b[kept, 0])[0, 1])
+    assert np.isnan(correlations[1])
+    assert np.isclose(correlations[2], np.corrcoef(a[:, 2], b[:, 2])[0, 1])
+
+
+def test_batch_of_events_of_different_lengths():
+    pairs = [(create_table(n_times, seed).to_numpy()[:, 1:], create_table(n_times + 77, seed + 10).to_numpy()[:, 1:])
+             for seed, n_times in enumerate([300, 1000, 620])]
+    expected = [isc(data_A, data_B, 50) for data_A, data_B in pairs]
+    assert np.allclose(batch_isc(pairs, 50), expected)
+
+
+def test_engine_matches_sliced_events():
+    """Testing the ISC of events derived from the cumulative sums against slicing each event from the recording"""
+    table_A, table_B = create_table(5000, 3), create_table(4800, 4)
+    table_B[TIME_COLUMN] += 2.05
+    table_A.iloc[700:800, 2] = np.nan
+    events_A = pd.DataFrame({EVENT_COLUMN: ['a', 'b', 'c'], START_COLUMN: [0, 120.03, 300], END_COLUMN: [90, 250, 420]})
+    events_B = events_A.assign(**{START_COLUMN: events_A[START_COLUMN] + 5, END_COLUMN: events_A[END_COLUMN] + 3})
+
+    expected = []
+    for (_, event_A), (_, event_B) in zip(events_A.iterrows(), events_B.iterrows()):
+        A_event = table_A[table_A[TIME_COLUMN].between(event_A[START_COLUMN], event_A[END_COLUMN])]
+        B_event = table_B[table_B[TIME_COLUMN].between(event_B[START_COLUMN], event_B[END_COLUMN])]
+        expected.append(ISC.ISC(A_event, B_event, 0.1))
+        assert np.allclose(ISCEngine(table_A).binned(event_A[START_COLUMN], event_A[END_COLUMN], 50),
+                           bin_signals(ISC.get_signals(A_event), 50), equal_nan=True)
+    ISC_table = ISC.ISC_by_events(events_A, events_B, table_A, table_B, 0.1)
+    assert list(ISC_table.index) == ['a', 'b', 'c']
+    assert np.allclose(ISC_table.to_numpy(dtype=float), expected)
+
+
+def test_sliding_windows_match_corrcoef():
+    table_A, table_B = create_table(2000, 5), create_table(2100, 6)
+    table_B.iloc[300:340, 1] = np.nan
+    dynamic_ISC = ISC.dynamic_ISC(table_A, table_B, 0.1, window_seconds=30, step_seconds=2.5)
+    assert dynamic_ISC.shape == (len(range(0, 2000 - 300 + 1, 25)), 5)
+    assert np.allclose(dynamic_ISC[TIME_COLUMN], np.arange(len(dynamic_ISC)) * 2.5)
+
+    values_A, values_B = ISC.get_signals(table_A), ISC.get_signals(table_B)
+    for window in [0, 11, 13, len(dynamic_ISC) - 1]:
+        rows = slice(window * 25, window * 25 + 300)
+        for channel in range(4):
+            a, b = values_A[rows, channel], values_B[rows, channel]
+            valid = ~np.isnan(b)
+            assert np.isclose(dynamic_ISC.iloc[window, channel + 1], np.corrcoef(a[valid], b[valid])[0, 1])
+
+
+def test_lagged_isc_matches_shifted_corrcoef():
+    table_A = create_table(1500, 7)
+    table_B = table_A.copy()
+    table_B.iloc[:, 1:] = np.roll(table_A.to_numpy()[:, 1:], 23, axis=0) + \
+        np.random.default_rng(8).standard_normal((1500, 4))
+    table_A.iloc[400:420, 2] = np.nan
+    lagged = ISC.lagged_ISC(table_A, table_B, 0.1, max_lag_seconds=5)
+    assert lagged.shape == (101, 4)
+    assert np.allclose(lagged.index, np.arange(-50, 51) / 10)
+
+    values_A, values_B = ISC.get_signals(table_A), ISC.get_signals(table_B)
+    for lag in [-50, -7, 0, 23, 50]:
+        a = values_A[max(-lag, 0):1500 - max(lag, 0)]
+        b = values_B[max(lag, 0):1500 - max(-lag, 0)]
+        for channel in range(4):
+            valid = ~np.isnan(a[:, channel])
+            assert np.isclose(lagged.iloc[lag + 50, channel],
+                              np.corrcoef(a[valid, channel], b[valid, channel])[0, 1])
+
+    peaks = ISC.peak_lagged_ISC(table_A, table_B, 0.1, max_lag_seconds=5)
+    assert np.allclose(peaks.loc[PEAK_LAG_ROW], 2.3)
+    assert np.allclose(peaks.loc[PEAK_ISC_ROW], lagged.max())
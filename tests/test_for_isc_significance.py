@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from niralysis.ISC.ISC import ISC
+from niralysis.utils.consts import CI_HIGH_ROW, CI_LOW_ROW, ISC_ROW, P_VALUE_ROW, TIME_COLUMN
+from niralysis.utils.isc_kernel import pearson
+from niralysis.utils.isc_significance import circularly_shifted, null_distribution, p_values, phase_randomized, \
+    pseudo_couples_null
+
+
+def create_signals(n_bins: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n_bins, 5)).cumsum(axis=0)
+
+
+def test_phase_randomization_keeps_the_spectrum():
+    signals = create_signals(64, 0)
+    surrogates = phase_randomized(signals, 20, np.random.default_rng(1))
+    assert surrogates.shape == (20, 64, 5)
+    assert np.allclose(np.abs(np.fft.rfft(surrogates, axis=1)), np.abs(np.fft.rfft(signals, axis=0)))
+    assert np.allclose(surrogates.mean(axis=1), signals.mean(axis=0))
+
+
+def test_circular_shifts():
+    signals = create_signals(30, 0)
+    surrogates = circularly_shifted(signals, 10, np.random.default_rng(2))
+    for surrogate in surrogates:
+        shift = int(np.flatnonzero(np.isclose(surrogate[0, 0], signals[:, 0]))[0])
+        assert shift != 0 and np.allclose(surrogate, np.roll(signals, -shift, axis=0))
+
+
+@pytest.mark.parametrize('method', ['phase', 'shift'])
+def test_null_distribution_is_reproducible(method):
+    binned_A, binned_B = create_signals(40, 3), create_signals(40, 4)
+    null = null_distribution(binned_A, binned_B, 2500, method, seed=7, batch_size=1000)
+    assert null.shape == (2500, 5)
+    assert np.array_equal(null, null_distribution(binned_A, binned_B, 2500, method, seed=7, batch_size=1000))
+    assert not np.array_equal(null, null_distribution(binned_A, binned_B, 2500, method, seed=8, batch_size=1000))
+
+
+def test_p_values():
+    binned_A = create_signals(60, 5)
+    binned_B = binned_A + 0.1 * create_signals(60, 6)
+    null = null_distribution(binned_A, create_signals(60, 6), 999, seed=0)
+    values = p_values(pearson(binned_A, binned_B), null)
+    assert (values < 0.05).all()
+    assert np.isclose(p_values(np.array([2.0]), null[:, :1])[0], 1 / 1000)
+
+
+def test_pseudo_couples_never_pair_a_couple():
+    binned_A = np.stack([create_signals(20, seed) for seed in range(3)])
+    null = pseudo_couples_null(binned_A, binned_A, 500, seed=0)
+    assert null.shape == (500, 5) and (null < 1 - 1e-9).all()
+
+
+def test_isc_significance_table():
+    table_A = pd.DataFrame(create_signals(3000, 9), columns=[f'S{i}_D1 hbo' for i in range(1, 6)])
+    table_A.insert(0, TIME_COLUMN, np.arange(3000) / 10)
+    table_B = table_A.copy()
+    table_B.iloc[:, 1:] += np.random.default_rng(10).standard_normal((3000, 5)).cumsum(axis=0)
+    significance = ISC.ISC_significance(table_A, table_B, 0.1, n_surrogates=200, seed=0)
+    assert list(significance.index) == [ISC_ROW, P_VALUE_ROW]
+    assert np.allclose(significance.loc[ISC_ROW], ISC.ISC(table_A, table_B, 0.1))
+    assert significance.loc[P_VALUE_ROW].between(1 / 201, 1).all()
+
+
+def test_isc_confidence_interval():
+    table_A = pd.DataFrame(create_signals(3000, 11), columns=[f'S{i}_D1 hbo' for i in range(1, 6)])
+    table_A.insert(0, TIME_COLUMN, np.arange(3000) / 10)
+    table_B = table_A.copy()
+    table_B.iloc[:, 1:] += 3 * np.random.default_rng(12).standard_normal((3000, 5))
+    interval = ISC.ISC_confidence_interval(table_A, table_B, 0.1, n_resamples=500, seed=0, memory_budget=1024)
+    assert list(interval.index) == [ISC_ROW, CI_LOW_ROW, CI_HIGH_ROW]
+    assert np.allclose(interval.loc[ISC_ROW], ISC.ISC(table_A, table_B, 0.1))
+    assert (interval.loc[CI_LOW_ROW] <= interval.loc[ISC_ROW]).all()
+    assert (interval.loc[ISC_ROW] <= interval.loc[CI_HIGH_ROW]).all()
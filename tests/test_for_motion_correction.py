@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from niralysis.utils.motion_correction import wavelet_motion_correction
+
+
+def create_signals():
+    """Slow drifts, the second channel has a motion artifact (a jump)"""
+    signals = 0.01 * np.random.default_rng(0).standard_normal((4, 1001)).cumsum(axis=1)
+    signals[1, 500:] += 5
+    return signals
+
+
+def test_thresholds_are_per_channel():
+    """Testing a channel's correction does not depend on the other channels' noise"""
+    signals = create_signals()
+    corrected = wavelet_motion_correction(signals.copy())
+    assert corrected.shape == signals.shape  # odd length
+    scaled = signals.copy()
+    scaled[2] *= 1000
+    corrected_scaled = wavelet_motion_correction(scaled)
+    assert np.allclose(corrected_scaled[2], 1000 * corrected[2])
+    assert np.allclose(corrected_scaled[[0, 1, 3]], corrected[[0, 1, 3]])
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_correction_in_place(n_jobs):
+    signals = create_signals()
+    expected = wavelet_motion_correction(signals.copy())
+    assert np.allclose(wavelet_motion_correction(signals, n_jobs=n_jobs), expected)
+    assert np.allclose(signals, expected)
+
+
+def test_zero_threshold_keeps_the_signals():
+    signals = create_signals()
+    assert np.allclose(wavelet_motion_correction(signals.copy(), threshold=0), signals)
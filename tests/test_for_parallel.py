@@ -0,0 +1,26 @@
+import pytest
+
+from niralysis.utils.parallel import run_sessions, successful_values, get_n_jobs
+
+
+def square_or_fail(value):
+    if value < 0:
+        raise ValueError(f"negative session {value}")
+    return value ** 2
+
+
+@pytest.mark.parametrize('n_jobs', [1, 3])
+def test_results_order_and_failure_isolation(n_jobs):
+    """Testing that results keep the sessions' order and that a failed session does not stop the others"""
+    sessions = [(3,), (-1,), (1,), (2,)]
+    results = run_sessions(square_or_fail, sessions, n_jobs)
+    assert [result.session for result in results] == sessions
+    assert [result.failed for result in results] == [False, True, False, False]
+    assert 'negative session -1' in results[1].error
+    assert successful_values(results) == [9, 1, 4]
+
+
+def test_n_jobs():
+    assert get_n_jobs(None) == 1
+    assert get_n_jobs(4) == 4
+    assert get_n_jobs(-1) >= 1
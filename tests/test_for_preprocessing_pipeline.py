@@ -0,0 +1,30 @@
+import numpy as np
+
+from niralysis.HbOData.HbOData import HbOData
+from niralysis.HbOData.PreprocessingPipeline import OPTICAL_DENSITY, MOTION_CORRECTION, FILTER, BEER_LAMBERT
+from tests.test_for_batch_preprocessor import create_raw
+
+
+def test_only_changed_stages_are_recomputed():
+    hbo_data = HbOData('', create_raw(3000, 0))
+    hbo_data.preprocess(None, with_storm=False)
+    assert hbo_data.pipeline.computed == [OPTICAL_DENSITY, MOTION_CORRECTION, FILTER, BEER_LAMBERT]
+    hbo_data.preprocess(None, with_storm=False, path_length_factor=0.5)
+    assert hbo_data.pipeline.computed == [BEER_LAMBERT]
+    hbo_data.preprocess(None, with_storm=False, path_length_factor=0.5, high_freq=0.3)
+    assert hbo_data.pipeline.computed == [FILTER, BEER_LAMBERT]
+    hbo_data.preprocess(None, with_storm=False, path_length_factor=0.5, high_freq=0.3)
+    assert hbo_data.pipeline.computed == []
+
+
+def test_sweep_matches_separate_preprocessing():
+    """Testing each variant of a sweep is the same as preprocessing a new recording with its parameters"""
+    raw = create_raw(3000, 1)
+    variants = [{'high_freq': 0.3}, {'path_length_factor': 0.5}, {'high_freq': 0.3, 'path_length_factor': 0.5},
+                {'motion_correction': True}]
+    hbo_arrays = HbOData('', raw.copy()).preprocess_sweep(variants, with_storm=False, bad_channels=['S1_D2'])
+    for variant, hbo_array in zip(variants, hbo_arrays):
+        expected = HbOData('', raw.copy())
+        expected.preprocess(None, with_storm=False, bad_channels=['S1_D2'], **variant)
+        assert list(hbo_array.channels) == list(expected.hbo_array.channels)
+        assert np.array_equal(hbo_array.data, expected.hbo_array.data)
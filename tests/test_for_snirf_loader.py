@@ -0,0 +1,86 @@
+import threading
+
+import mne
+import numpy as np
+import pytest
+
+from niralysis.utils import snirf_loader
+from niralysis.utils.snirf_loader import RawCache, ensure_writable
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Replaces the SNIRF reader with a small in memory recording and counts the reads"""
+    calls = []
+
+    def fake_read_raw_snirf(path, preload=True, verbose=None):
+        calls.append(path)
+        info = mne.create_info(['S1_D1 760', 'S1_D1 850'], 10.0, 'fnirs_cw_amplitude')
+        return mne.io.RawArray(np.ones((2, 100)), info, verbose=False)
+
+    monkeypatch.setattr(snirf_loader.mne.io, 'read_raw_snirf', fake_read_raw_snirf)
+    return calls
+
+
+def test_file_is_read_once(tmp_path, reads):
+    """Testing that the same file is read from disk only once"""
+    path = tmp_path / 'rec_A.snirf'
+    path.write_bytes(b'')
+    cache = RawCache()
+    first = cache.get(str(path))
+    second = cache.get(str(path))
+    assert len(reads) == 1
+    assert first is not second
+    assert np.shares_memory(first._data, second._data)
+
+
+def test_shared_data_is_copy_on_write(tmp_path, reads):
+    """Testing that changing one instance's data does not change the others"""
+    path = tmp_path / 'rec_A.snirf'
+    path.write_bytes(b'')
+    cache = RawCache()
+    first = cache.get(str(path))
+    with pytest.raises(ValueError):
+        first._data[0, 0] = 5
+    ensure_writable(first)._data[0, 0] = 5
+    assert cache.get(str(path))._data[0, 0] == 1
+
+
+def test_least_recently_used_is_evicted(tmp_path, reads):
+    """Testing that the cache does not grow beyond its size limit"""
+    cache = RawCache(max_bytes=2 * 2 * 100 * 8)
+    paths = [tmp_path / f'rec_{i}.snirf' for i in range(3)]
+    for path in paths:
+        path.write_bytes(b'')
+        cache.get(str(path))
+    assert len(cache) == 2
+    cache.get(str(paths[0]))
+    assert len(reads) == 4
+
+
+def test_concurrent_misses_are_counted_once(tmp_path, monkeypatch):
+    """Testing that two threads reading the same file at once keep a single entry and its size"""
+    barrier = threading.Barrier(2, timeout=5)
+
+    def slow_read_raw_snirf(path, preload=True, verbose=None):
+        barrier.wait()  # both threads missed before any of them inserts
+        info = mne.create_info(['S1_D1 760', 'S1_D1 850'], 10.0, 'fnirs_cw_amplitude')
+        return mne.io.RawArray(np.ones((2, 100)), info, verbose=False)
+
+    monkeypatch.setattr(snirf_loader.mne.io, 'read_raw_snirf', slow_read_raw_snirf)
+    path = tmp_path / 'rec_A.snirf'
+    path.write_bytes(b'')
+    cache = RawCache()
+    results = [None, None]
+
+    def get(i):
+        results[i] = cache.get(str(path))
+
+    threads = [threading.Thread(target=get, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(cache) == 1
+    assert cache.size == 2 * 100 * 8
+    assert np.shares_memory(results[0]._data, results[1]._data)
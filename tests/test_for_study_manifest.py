@@ -0,0 +1,42 @@
+import os
+
+from niralysis.utils.study_manifest import StudyManifest
+
+
+def create_study(path):
+    for date in ['24012024_1400', '31012024_0900']:
+        os.makedirs(path / 'runs' / date)
+        for name in [f'{date}_A.snirf', f'{date}_B.snirf', f'{date}_events_file.snirf', f'{date}.csv', 'notes.txt']:
+            (path / 'runs' / date / name).write_bytes(b'data')
+    (path / 'runs' / '31012024_0900' / '31012024_0900_B_2.snirf').write_bytes(b'data')
+
+
+def test_sessions(tmp_path):
+    """Testing the run folders' files are found and classified"""
+    create_study(tmp_path)
+    sessions = StudyManifest(tmp_path).sessions
+    assert [session.date for session in sessions] == ['24012024_1400', '31012024_0900']
+    assert sessions[0].snirf_files_A == ['24012024_1400_A.snirf']
+    assert sessions[0].snirf_files_B == ['24012024_1400_B.snirf']
+    assert sessions[0].snirf_files_B_2 == []
+    assert sessions[1].snirf_files_B_2 == ['31012024_0900_B_2.snirf']
+    assert sessions[1].events_files == ['31012024_0900_events_file.snirf']
+    assert sessions[1].psychopy_files == ['31012024_0900.csv']
+    assert 'notes.txt' not in sessions[1].files
+    assert sessions[1].files['31012024_0900_A.snirf'][0] == 4
+
+
+def test_persisted_manifest_rescans_only_changed_folders(tmp_path):
+    """Testing that a saved manifest is reused and only folders that changed are listed again"""
+    create_study(tmp_path / 'study')
+    manifest_path = str(tmp_path / 'manifest.json')
+    StudyManifest(tmp_path / 'study', manifest_path)
+
+    manifest = StudyManifest(tmp_path / 'study', manifest_path)
+    assert manifest.update() == []
+
+    changed_folder = tmp_path / 'study' / 'runs' / '24012024_1400'
+    (changed_folder / '24012024_1400_B_2.snirf').write_bytes(b'data')
+    assert manifest.update() == [str(changed_folder)]
+    assert manifest.sessions[0].snirf_files_B_2 == ['24012024_1400_B_2.snirf']
+    assert StudyManifest(tmp_path / 'study', manifest_path).sessions[0].snirf_files_B_2 == ['24012024_1400_B_2.snirf']